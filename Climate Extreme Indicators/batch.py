@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import pandas as pd
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple
+COMMON_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(1, COMMON_DIR) # modules shared by all three folders
+from input import load_all_data_for_analysis
+from preprocess import combine_preprocess, spatial_subset, time_subset
+from indices import climate_index, required_variables
+from time_segments import calendar_fields
+from tiling import run_tiled, working_bytes
+from writers import save_indices
+from execution import execution_backend
+from instrumentation import ProfileMode, instrumented_run, span
+from precision import precision_policy
+
+_WRITE_LOCK = threading.Lock() # netCDF-C is not thread-safe while defining variables; concurrent jobs write one at a time
+
+# Example manifest:
+# {
+#   "output_dir": "results/ensemble",
+#   "memory_budget_mb": 8000,
+#   "base_period": [1961, 1990],
+#   "regions": {"hanoi": {"lat_range": [20.5, 21.5], "lon_range": [105.3, 106.3]},
+#               "hcmc": {"lat_range": [10.3, 11.2], "lon_range": [106.3, 107.1]}},
+#   "jobs": [{"dataset": "data/ACCESS-CM2_ssp245", "member": "ACCESS-CM2_ssp245", "period": [1961, 2050], "indices": ["TXx", "Rx1day"]},
+#            {"dataset": "data/MIROC6_ssp245", "regions": ["hanoi"], "period": [1961, 2050]}]
+# }
+
+def load_manifest(manifest_path: str) -> Tuple[Dict, List[Dict]]:
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    regions = manifest.get('regions', {})
+    suffix = '.zarr' if manifest.get('output_format') == 'zarr' else '.nc'
+
+    jobs: List[Dict] = []
+    for entry in manifest['jobs']:
+        member = entry.get('member') or Path(entry['dataset']).name
+        for region in entry.get('regions') or list(regions):
+            if region not in regions:
+                raise ValueError(f"Unknown region '{region}' in job for {member}")
+            jobs.append({
+                "dataset": entry['dataset'],
+                "member": member,
+                "region": region,
+                "lat_range": tuple(regions[region]['lat_range']),
+                "lon_range": tuple(regions[region]['lon_range']),
+                "period": tuple(entry['period']) if entry.get('period') else None,
+                "indices": entry.get('indices'),
+                "output_filename": f"{member}_{region}{suffix}",
+            })
+    print(f"Manifest: {len(jobs)} jobs over {len({job['dataset'] for job in jobs})} datasets and {len(regions)} regions")
+    return manifest, jobs
+
+def group_jobs(jobs: List[Dict]) -> Dict[str, List[Dict]]:
+    groups: Dict[str, List[Dict]] = {}
+    for job in jobs:
+        groups.setdefault(job['dataset'], []).append(job)
+    return groups
+
+def _union_request(jobs: List[Dict]) -> Tuple[List[str], Optional[Tuple[int, int]], Tuple[float, float], Tuple[float, float]]:
+    variables = sorted(set().union(*(required_variables(job['indices']) for job in jobs)))
+    periods = [job['period'] for job in jobs]
+    period = None if None in periods else (min(p[0] for p in periods), max(p[1] for p in periods))
+    lat_range = (min(min(job['lat_range']) for job in jobs), max(max(job['lat_range']) for job in jobs))
+    lon_range = (min(min(job['lon_range']) for job in jobs), max(max(job['lon_range']) for job in jobs))
+    return variables, period, lat_range, lon_range
+
+def _job_crop(cube: xr.Dataset, job: Dict) -> xr.Dataset:
+    crop = cube[[name for name in required_variables(job['indices']) if name in cube.data_vars]]
+    crop = spatial_subset(crop, job['lat_range'], job['lon_range'], verbose=False)
+    return time_subset(crop, job['period'], verbose=False) if job['period'] else crop
+
+def _run_job(job: Dict, crop: xr.Dataset, output_dir: str, base_period: Optional[Tuple[int, int]], cache_dir: Optional[str]) -> str:
+    processed = combine_preprocess(crop, job['lat_range'], job['lon_range'], period=job['period'], verbose=False)
+    result = climate_index(processed, job['indices'], base_period=base_period, cache_dir=cache_dir, verbose=False).compute()
+    fmt = 'zarr' if job['output_filename'].endswith('.zarr') else 'netcdf'
+    with _WRITE_LOCK:
+        return save_indices(result, job['output_filename'], output_dir, fmt=fmt)
+
+def run_group(dataset: str, jobs: List[Dict], output_dir: str, memory_budget_mb: Optional[float] = None, max_jobs: int = 4,
+              base_period: Optional[Tuple[int, int]] = None, cache_dir: Optional[str] = None) -> Dict[str, str]:
+    variables, period, lat_range, lon_range = _union_request(jobs)
+    print(f"\nDataset {dataset}: {len(jobs)} jobs, variables {variables}")
+    with span('load', dataset=dataset):
+        # Ensemble members on the same grid share one set of cached regridding weights
+        cube = load_all_data_for_analysis(chunks=None, variables=variables, period=period, lat_range=lat_range,
+                                          lon_range=lon_range, data_dir=dataset, regrid_dir=os.path.join(output_dir, 'regrid_weights'))
+
+    crops = {job['output_filename']: _job_crop(cube, job) for job in jobs}
+    needs = {name: working_bytes(crop.sizes['lat'] * crop.sizes['lon'], crop.sizes['time'], len(crop.data_vars))
+             for name, crop in crops.items()}
+    budget = memory_budget_mb * 1024**2 if memory_budget_mb is not None else None
+
+    # Read the union hyperslab once and crop every region from memory when it fits next to the largest job
+    loaded = budget is None or cube.nbytes + max(needs.values()) <= budget
+    if loaded:
+        with span('read_union', dataset=dataset):
+            cube = cube.load()
+        crops = {job['output_filename']: _job_crop(cube, job) for job in jobs}
+        print(f"Read {cube.nbytes / 1024**2:.1f} MB once for {len(jobs)} jobs")
+    available = budget - (cube.nbytes if loaded else 0) if budget is not None else None
+
+    outputs: Dict[str, str] = {}
+    oversized = [job for job in jobs if available is not None and needs[job['output_filename']] > available]
+    for job in oversized:
+        print(f"Job {job['member']}/{job['region']} exceeds the memory budget, streaming it in tiles")
+        with span('job', job=f"{job['member']}/{job['region']}", tiled=True):
+            outputs[job['output_filename']] = run_tiled(crops[job['output_filename']], job['lat_range'], job['lon_range'],
+                                                        job['output_filename'], output_dir, max(available, 1) / 1024**2,
+                                                        base_period=base_period, cache_dir=cache_dir, indices=job['indices'])
+
+    gate = threading.Condition()
+    in_use = [0]
+
+    def run(job: Dict) -> Tuple[str, str]:
+        need = needs[job['output_filename']] if available is not None else 0
+        with gate:
+            gate.wait_for(lambda: in_use[0] == 0 or in_use[0] + need <= available)
+            in_use[0] += need
+        try:
+            with span('job', job=f"{job['member']}/{job['region']}"):
+                path = _run_job(job, crops[job['output_filename']], output_dir, base_period, cache_dir)
+            print(f"Job {job['member']}/{job['region']} completed.")
+            return job['output_filename'], path
+        finally:
+            with gate:
+                in_use[0] -= need
+                gate.notify_all()
+
+    with ThreadPoolExecutor(max_workers=max_jobs) as pool:
+        outputs.update(pool.map(run, [job for job in jobs if job not in oversized]))
+    return outputs
+
+def _open_output(path: str) -> xr.Dataset:
+    return xr.open_dataset(path, engine='zarr' if path.endswith('.zarr') else None)
+
+def stack_ensemble(jobs: List[Dict], outputs: Dict[str, str], output_dir: str, fmt: Literal['netcdf', 'zarr'] = 'netcdf') -> List[str]:
+    groups: Dict[Tuple, List[Dict]] = {}
+    for job in jobs:
+        groups.setdefault((job['region'], job['period'], tuple(job['indices'] or ())), []).append(job)
+
+    saved: List[str] = []
+    names: Dict[str, int] = {}
+    for (region, period, _), members in groups.items():
+        name = f"ensemble_{region}" + (f"_{period[0]}-{period[1]}" if period else "")
+        names[name] = names.get(name, 0) + 1
+        if names[name] > 1:
+            name = f"{name}_{names[name]}"
+
+        datasets = []
+        for job in members:
+            ds = _open_output(outputs[job['output_filename']])
+            # Members on different calendars only agree on the year
+            datasets.append(ds.assign_coords(time=calendar_fields(ds['time'])[0]))
+        stacked = xr.concat(datasets, dim=pd.Index([job['member'] for job in members], name='member'),
+                            join='outer', coords='different', compat='equals')
+        stacked['time'].attrs = {"long_name": "year"}
+        saved.append(save_indices(stacked, name + ('.zarr' if fmt == 'zarr' else '.nc'), output_dir, fmt=fmt))
+        for ds in datasets:
+            ds.close()
+    return saved
+
+def run_batch(manifest_path: str, output_dir: Optional[str] = None, memory_budget_mb: Optional[float] = None,
+              max_jobs: Optional[int] = None, report: bool = True, report_path: Optional[str] = None,
+              profile_stage: Optional[str] = None, profile_mode: ProfileMode = 'cprofile') -> List[str]:
+    manifest, jobs = load_manifest(manifest_path)
+    output_dir = output_dir or manifest.get('output_dir', 'results')
+    memory_budget_mb = memory_budget_mb if memory_budget_mb is not None else manifest.get('memory_budget_mb')
+    max_jobs = max_jobs or manifest.get('max_jobs', 4)
+    base_period = tuple(manifest['base_period']) if manifest.get('base_period') else None
+    cache_dir = manifest.get('threshold_cache_dir') or os.path.join(output_dir, 'threshold_cache')
+    os.makedirs(output_dir, exist_ok=True)
+
+    report_path = (report_path or os.path.join(output_dir, 'batch_report.json')) if report else None
+    config = {"manifest": manifest_path, "jobs": len(jobs), "memory_budget_mb": memory_budget_mb, "max_jobs": max_jobs}
+    with instrumented_run(report_path, profile_stage, profile_mode, config):
+        outputs: Dict[str, str] = {}
+        for dataset, dataset_jobs in group_jobs(jobs).items():
+            outputs.update(run_group(dataset, dataset_jobs, output_dir, memory_budget_mb, max_jobs, base_period, cache_dir))
+
+        with span('ensemble'):
+            ensembles = stack_ensemble(jobs, outputs, output_dir, 'zarr' if manifest.get('output_format') == 'zarr' else 'netcdf')
+    return list(outputs.values()) + ensembles
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run climate indices for every (dataset, region, period, indices) job in a manifest.")
+    parser.add_argument('manifest', help="JSON manifest of regions and jobs")
+    parser.add_argument('--output-dir', default=None, help="overrides the manifest's output_dir")
+    parser.add_argument('--memory-budget-mb', type=float, default=None, help="overrides the manifest's memory_budget_mb")
+    parser.add_argument('--max-jobs', type=int, default=None, help="jobs run concurrently within a dataset (default 4)")
+    parser.add_argument('--report', default=None, help="run report path (default: <output_dir>/batch_report.json)")
+    parser.add_argument('--no-report', dest='write_report', action='store_false')
+    parser.add_argument('--profile-stage', default=None, metavar='STAGE', help="profile one stage: load, read_union, job, ensemble, ...")
+    parser.add_argument('--profile', choices=['cprofile', 'dask'], default='cprofile',
+                        help="'dask' writes a dask performance report (needs --scheduler distributed)")
+    parser.add_argument('--precision', choices=['float32', 'float64'], default='float32')
+    parser.add_argument('--no-packing', dest='packing', action='store_false',
+                        help="store °C results as float instead of int16 with a 0.01 scale factor")
+    parser.add_argument('--compression', choices=['zlib', 'zstd', 'none'], default='zlib')
+    parser.add_argument('--scheduler', choices=['threads', 'processes', 'distributed'], default='threads')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="distributed scheduler only")
+    parser.add_argument('--memory-limit', default=None, help="per worker, e.g. '4GB' (distributed scheduler only)")
+    args = parser.parse_args(argv)
+
+    with execution_backend(args.scheduler, args.workers, args.memory_limit, args.threads_per_worker), \
+         precision_policy(args.precision, args.packing, args.compression):
+        run_batch(args.manifest, args.output_dir, args.memory_budget_mb, args.max_jobs, args.write_report, args.report,
+                  args.profile_stage, args.profile)
+    print("PROGRAM COMPLETED SUCCESSFULLY!")
+
+if __name__ == '__main__':
+    main()
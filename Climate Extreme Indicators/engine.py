@@ -0,0 +1,182 @@
+import xarray as xr
+import numpy as np
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+from spells import longest_run, days_in_runs
+from instrumentation import timed
+from time_segments import Frequency, nested_segments
+
+VARIABLES: List[str] = ["tasmax", "tasmin", "tas", "pr"]
+TEMPERATURE_INDICES: List[str] = ["TXx", "TXn", "TNx", "TNn", "DTR", "SU25", "TR20", "Tmean", "WSDI", "CSDI", "FDD"]
+PRECIPITATION_INDICES: List[str] = ["Rx1day", "Rx5day", "SDII", "PRCPTOT", "R95p", "R99p", "CWD", "CDD",
+                                    "R10mm", "R20mm", "R1mm", "RRR", "R50mm"]
+
+def _full_time(da: xr.DataArray) -> xr.DataArray:
+    if da.chunks is not None:
+        da = da.chunk({'time': -1})
+    return da
+
+def _seg_sum(x: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.add.reduceat(x, starts, axis=-1, dtype=np.float64)
+
+def _seg_nansum(x: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return _seg_sum(np.where(np.isnan(x), 0.0, x), starts)
+
+def _seg_nanmax(x: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.fmax.reduceat(x, starts, axis=-1)
+
+def _seg_nanmin(x: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.fmin.reduceat(x, starts, axis=-1)
+
+_SEGMENT_REDUCERS = {'max': _seg_nanmax, 'min': _seg_nanmin, 'sum': _seg_sum}
+_COMBINERS = {'max': np.fmax, 'min': np.fmin, 'sum': np.add}
+
+def _combine(fine: np.ndarray, groups: List[np.ndarray], how: str) -> np.ndarray:
+    # Coarser periods from the finest one (max of maxima, sum of sums), concatenated in frequency order
+    parts = [fine if len(group) == fine.shape[-1] else _COMBINERS[how].reduceat(fine, group, axis=-1) for group in groups]
+    return parts[0] if len(parts) == 1 else np.concatenate(parts, axis=-1)
+
+def _periods(x: np.ndarray, starts: np.ndarray, groups: List[np.ndarray], how: str) -> np.ndarray:
+    return _combine(_SEGMENT_REDUCERS[how](x, starts), groups, how)
+
+def _ratio(total: np.ndarray, count: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+def _periods_nanmean(x: np.ndarray, starts: np.ndarray, groups: List[np.ndarray]) -> np.ndarray:
+    return _ratio(_combine(_seg_nansum(x, starts), groups, 'sum'), _periods(~np.isnan(x), starts, groups, 'sum'))
+
+def _window_diff(cum: np.ndarray, window: int) -> np.ndarray:
+    out = cum.copy()
+    out[..., window:] -= cum[..., :-window]
+    return out
+
+def _rolling_sum(x: np.ndarray, window: int, min_periods: int) -> np.ndarray:
+    valid = ~np.isnan(x)
+    # A float32 running total over decades loses the daily amounts to rounding, so only the window sums are cast back
+    total = _window_diff(np.cumsum(np.where(valid, x, 0.0), axis=-1, dtype=np.float64), window).astype(x.dtype, copy=False)
+    count = _window_diff(np.cumsum(valid, axis=-1), window)
+    return np.where(count >= min_periods, total, np.nan)
+
+def _spell_periods(data: np.ndarray, mask: np.ndarray, starts: np.ndarray, groups: List[np.ndarray], kind: str, min_length: int,
+                   span_years: bool) -> np.ndarray:
+    # Runs are cut at each frequency's own period boundaries, so they are counted per frequency from the daily mask
+    period_starts = [starts[group] for group in groups]
+    if kind == 'longest':
+        values = [longest_run(mask, first, span_years) for first in period_starts]
+    else:
+        values = [days_in_runs(mask, first, min_length, span_years) for first in period_starts]
+    observed = _periods(~np.isnan(data), starts, groups, 'sum') > 0
+    return np.where(observed, values[0] if len(values) == 1 else np.concatenate(values, axis=-1), np.nan)
+
+def _temperature_kernel(*arrays: np.ndarray, variables: List[str], index_names: List[str], starts: np.ndarray,
+                        groups: List[np.ndarray], span_years: bool = False) -> np.ndarray:
+    v = dict(zip(variables, arrays))
+
+    def periods(x: np.ndarray, how: str) -> np.ndarray:
+        return _periods(x, starts, groups, how)
+
+    reducers = {
+        "TXx": lambda: periods(v['tasmax'], 'max'),
+        "TXn": lambda: periods(v['tasmax'], 'min'),
+        "TNx": lambda: periods(v['tasmin'], 'max'),
+        "TNn": lambda: periods(v['tasmin'], 'min'),
+        "DTR": lambda: _periods_nanmean(v['tasmax'] - v['tasmin'], starts, groups),
+        "SU25": lambda: periods(v['tasmax'] > 25, 'sum'),
+        "TR20": lambda: periods(v['tasmin'] > 20, 'sum'),
+        "Tmean": lambda: _periods_nanmean(v['tas'], starts, groups),
+        "WSDI": lambda: _spell_periods(v['tasmax'], v['tasmax'] > 30, starts, groups, 'days', 6, span_years),
+        "CSDI": lambda: _spell_periods(v['tasmin'], v['tasmin'] < 0, starts, groups, 'days', 6, span_years),
+        "FDD": lambda: periods(v['tasmin'] <= 0, 'sum'),
+    }
+    return np.stack([timed(f"index:{name}", reducers[name]) for name in index_names], axis=-2)
+
+def _precipitation_kernel(*arrays: np.ndarray, variables: List[str], index_names: List[str], starts: np.ndarray,
+                          groups: List[np.ndarray], span_years: bool = False) -> np.ndarray:
+    v = dict(zip(variables, arrays))
+    pr = v['pr']
+
+    def periods(x: np.ndarray, how: str) -> np.ndarray:
+        return _periods(x, starts, groups, how)
+
+    # Intermediates shared by several indices are built on first use only
+    @lru_cache(maxsize=None)
+    def wet() -> np.ndarray:
+        return pr > 1.0
+
+    @lru_cache(maxsize=None)
+    def wet_total() -> np.ndarray:
+        return periods(np.where(wet(), pr, 0.0), 'sum')
+
+    @lru_cache(maxsize=None)
+    def thr() -> np.ndarray:
+        return np.moveaxis(v['pr_thresholds'], -1, 0)[..., None]
+
+    def sdii() -> np.ndarray:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return wet_total() / periods(wet(), 'sum')
+
+    reducers = {
+        "Rx1day": lambda: periods(pr, 'max'),
+        "Rx5day": lambda: periods(_rolling_sum(pr, 5, 1), 'max'),
+        "SDII": sdii,
+        "PRCPTOT": wet_total,
+        "R95p": lambda: periods(np.where(pr > thr()[0], pr, 0.0), 'sum'),
+        "R99p": lambda: periods(np.where(pr > thr()[1], pr, 0.0), 'sum'),
+        "CWD": lambda: _spell_periods(pr, pr >= 1.0, starts, groups, 'longest', 1, span_years),
+        "CDD": lambda: _spell_periods(pr, pr < 1.0, starts, groups, 'longest', 1, span_years),
+        "R10mm": lambda: periods(pr >= 10, 'sum'),
+        "R20mm": lambda: periods(pr >= 20, 'sum'),
+        "R1mm": lambda: periods(pr >= 1, 'sum'),
+        "RRR": lambda: periods(_rolling_sum(np.where(wet(), pr, np.nan), 7, 7), 'max'),
+        "R50mm": lambda: periods(pr >= 50, 'sum'),
+    }
+    return np.stack([timed(f"index:{name}", reducers[name]) for name in index_names], axis=-2)
+
+def _apply_kernel(kernel, arrays: List[xr.DataArray], names: List[str], starts: np.ndarray, groups: Dict[str, np.ndarray],
+                  labels: Dict[str, xr.DataArray], core_dims: Optional[List[List[str]]] = None,
+                  **kwargs) -> Dict[str, Dict[str, xr.DataArray]]:
+    # Every frequency comes out of the same pass, laid end to end along 'time', and is split afterwards
+    n_periods = sum(len(group) for group in groups.values())
+    stacked = xr.apply_ufunc(
+        kernel, *[_full_time(da) if 'time' in da.dims else da for da in arrays],
+        kwargs={'starts': starts, 'groups': list(groups.values()), **kwargs},
+        input_core_dims=core_dims or [['time']] * len(arrays),
+        output_core_dims=[['index', 'time']],
+        exclude_dims={'time'},
+        dask='parallelized',
+        output_dtypes=[np.float64],
+        dask_gufunc_kwargs={'output_sizes': {'index': len(names), 'time': n_periods}},
+    )
+    results: Dict[str, Dict[str, xr.DataArray]] = {}
+    offset = 0
+    for freq, group in groups.items():
+        part = stacked.isel(time=slice(offset, offset + len(group))).assign_coords(time=labels[freq].values)
+        results[freq] = {name: part.isel(index=i, drop=True).transpose('time', ...) for i, name in enumerate(names)}
+        offset += len(group)
+    return results
+
+def fused_climate_index(ds: xr.Dataset, names: Sequence[str], registry: Dict[str, Dict[str, List[str]]],
+                        pr_thresholds: Optional[xr.DataArray] = None, span_years: bool = False,
+                        freqs: Sequence[Frequency] = ('annual',)) -> Dict[str, xr.Dataset]:
+    # registry maps each index to its input variables and shared intermediates;
+    # pr_thresholds holds the R95p and R99p thresholds along a 'quantile' dimension
+    starts, groups, labels = nested_segments(ds['time'], freqs)
+    results: Dict[str, Dict[str, xr.DataArray]] = {freq: {} for freq in groups}
+    for kernel, group in [(_temperature_kernel, TEMPERATURE_INDICES), (_precipitation_kernel, PRECIPITATION_INDICES)]:
+        group_names = [name for name in group if name in names]
+        if not group_names:
+            continue
+        needed = {var for name in group_names for var in registry[name]['inputs']}
+        variables = [var for var in VARIABLES if var in needed]
+        arrays = [ds[var] for var in variables]
+        core_dims = [['time']] * len(arrays)
+        if any('pr_thresholds' in registry[name]['intermediates'] for name in group_names):
+            variables.append('pr_thresholds')
+            arrays.append(pr_thresholds.sel(quantile=[0.95, 0.99]))
+            core_dims.append(['quantile'])
+        by_freq = _apply_kernel(kernel, arrays, group_names, starts, groups, labels, core_dims=core_dims,
+                                variables=variables, index_names=group_names, span_years=span_years)
+        for freq, arrays_by_name in by_freq.items():
+            results[freq].update(arrays_by_name)
+    return {freq: xr.Dataset(arrays_by_name) for freq, arrays_by_name in results.items()}
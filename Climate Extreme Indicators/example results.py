@@ -1,3 +1,4 @@
+import xarray as xr
 import numpy as np
 import netCDF4 as nc
 from netCDF4 import Dataset
@@ -5,6 +6,8 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 
 file_path = '/content/drive/MyDrive/Group Project 2025/results/calculated_indices.nc'
+preview_path = file_path.replace('.nc', '_preview.nc') # written next to the result by main.py
+PREVIEW_LEVEL = 0 # 1, 2, 3 draw the map from coarser grids for large domains
 fh = Dataset(file_path, 'r')
 
 print(fh.file_format)
@@ -15,15 +18,15 @@ print(fh.Conventions)
 for attr in fh.ncattrs():
     print(attr, '=', getattr(fh,attr))
 
-lat = fh.variables['lat'][:]
-lon = fh.variables['lon'][:]
-time_var = fh.variables['time']
-tnn_data = fh.variables['TNn'][:]
+# Maps and histograms come from small precomputed arrays instead of the full result
+clim = xr.open_dataset(preview_path, group=f'level_{PREVIEW_LEVEL}')
+hist = xr.open_dataset(preview_path)
 
-d_times = nc.num2date(time_var[:], time_var.units)
-years = np.array([d.year for d in d_times])
+lat = clim['lat'].values
+lon = clim['lon'].values
+years = hist['time'].dt.year.values
 
-tnn_mean = np.nanmean(tnn_data, axis=0)
+tnn_mean = clim['TNn_climatology'].values
 
 fig = plt.figure(figsize=(16, 10))
 
@@ -48,14 +51,13 @@ unique_years = np.unique(years)
 years_to_plot = [unique_years[0], unique_years[len(unique_years)//2], unique_years[-1]]
 colors = ['#1f77b4', '#2ca02c', '#d62728']
 
+edges = hist['TNn_bin_edges'].values
 for year, color in zip(years_to_plot, colors):
-    year_idx = np.where(years == year)[0]
-    year_data = tnn_data[year_idx, :, :].flatten()
-    clean_data = year_data[~np.isnan(year_data)]
+    counts = hist['TNn_hist'].sel(time=str(year)).sum(dim='time').values
 
-    if len(clean_data) > 0:
-        ax2.hist(clean_data, bins=40, alpha=0.4, label=f'Year {year}', color=color, density=True)
-        ax2.axvline(np.mean(clean_data), color=color, linestyle='--', linewidth=1.5)
+    if counts.sum() > 0:
+        ax2.stairs(counts / (counts.sum() * np.diff(edges)), edges, fill=True, alpha=0.4, label=f'Year {year}', color=color)
+        ax2.axvline(float(hist['TNn_area_mean'].sel(time=str(year)).mean()), color=color, linestyle='--', linewidth=1.5)
 
 ax2.set_title('(b) TNn Frequency Distribution over Selected Years', fontsize=14, fontweight='bold')
 ax2.set_xlabel('Temperature (°C)')
@@ -66,4 +68,6 @@ ax2.grid(axis='y', alpha=0.3)
 plt.tight_layout()
 plt.show()
 
+clim.close()
+hist.close()
 fh.close()
@@ -0,0 +1,130 @@
+import xarray as xr
+import numpy as np
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+from indices import INDEX_REGISTRY, climate_index, resolve_indices
+from thresholds import PR_QUANTILES, get_thresholds
+from time_segments import calendar_fields
+from writers import _atomic_write, save_indices, write_zarr_region
+
+# Days before the first updated year that rolling indices (Rx5day, RRR) look back over
+LOOKBACK_DAYS = 7
+
+def existing_years(output_path: Path) -> List[int]:
+    if not output_path.exists():
+        return []
+    with xr.open_dataset(output_path) as existing:
+        return sorted(int(y) for y in calendar_fields(existing['time'])[0])
+
+def years_to_update(ds: xr.Dataset, output_path: Path, recompute_years: Sequence[int] = ()) -> List[int]:
+    input_years = np.unique(calendar_fields(ds['time'])[0])
+    done = existing_years(output_path)
+    years = {int(y) for y in input_years if y not in done}
+
+    if done:
+        with xr.open_dataset(output_path) as existing:
+            coverage_end = existing.attrs.get('time_coverage_end')
+        # A year that was partial on the last run has grown and must be redone
+        if coverage_end is not None:
+            last_year = int(coverage_end[:4])
+            times = ds['time'].values[calendar_fields(ds['time'])[0] == last_year]
+            if any(str(t)[:10] > coverage_end[:10] for t in times):
+                years.add(last_year)
+
+    years.update(int(y) for y in recompute_years if y in input_years)
+    return sorted(years)
+
+def _contiguous(years: List[int]) -> List[Tuple[int, int]]:
+    blocks: List[Tuple[int, int]] = []
+    for year in years:
+        if blocks and year == blocks[-1][1] + 1:
+            blocks[-1] = (blocks[-1][0], year)
+        else:
+            blocks.append((year, year))
+    return blocks
+
+def thresholds_path(output_path: Path) -> Path:
+    return output_path.with_name(f"{output_path.stem}_thresholds.nc")
+
+def needs_thresholds(indices: Optional[Sequence[str]] = None) -> bool:
+    return any("pr_thresholds" in INDEX_REGISTRY[name]["intermediates"] for name in resolve_indices(indices))
+
+def freeze_thresholds(thr: xr.DataArray, output_path: Path) -> None:
+    thr_path = thresholds_path(output_path)
+    _atomic_write(thr, thr_path, lambda da, path: da.to_netcdf(path))
+    print(f"Percentile thresholds frozen at: {thr_path}")
+
+def frozen_thresholds(ds: xr.Dataset, output_path: Path, base_period: Optional[Tuple[int, int]]) -> xr.DataArray:
+    thr_path = thresholds_path(output_path)
+    if thr_path.exists():
+        return xr.open_dataarray(thr_path).load()
+    # Thresholds from a different record would make R95p/R99p of the new years inconsistent with the stored ones
+    if output_path.exists():
+        raise ValueError(f"{output_path} exists but its frozen thresholds {thr_path.name} are missing; "
+                         "rerun without --incremental and with --base-period to freeze them")
+    if base_period is None:
+        raise ValueError("Incremental runs with R95p/R99p need a fixed base period (--base-period START END), "
+                         "otherwise the thresholds depend on the years available on the first run")
+    thr = get_thresholds(ds['pr'], PR_QUANTILES, base_period)
+    freeze_thresholds(thr, output_path)
+    return thr
+
+def _block_indices(ds: xr.Dataset, first_year: int, last_year: int, pr_thresholds: Optional[xr.DataArray], span_years: bool,
+                   indices: Optional[Sequence[str]]) -> xr.Dataset:
+    years = calendar_fields(ds['time'])[0]
+    start = max(int(np.argmax(years >= first_year)) - LOOKBACK_DAYS, 0)
+    stop = int(np.flatnonzero(years <= last_year)[-1]) + 1
+    block = climate_index(ds.isel(time=slice(start, stop)), indices, span_years=span_years, pr_thresholds=pr_thresholds, verbose=False)
+    return block.isel(time=np.flatnonzero(calendar_fields(block['time'])[0] >= first_year))
+
+def update_indices(ds: xr.Dataset, output_filename: str, output_dir: str, base_period: Optional[Tuple[int, int]] = None,
+                   recompute_years: Sequence[int] = (), span_years: bool = False, indices: Optional[Sequence[str]] = None) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = Path(output_dir) / output_filename
+    years = years_to_update(ds, output_path, recompute_years)
+    if not years:
+        print("All years are already up to date.")
+        return str(output_path.resolve())
+    print(f"Years to compute: {years}")
+
+    pr_thresholds = frozen_thresholds(ds, output_path, base_period) if needs_thresholds(indices) else None
+    new_blocks = [_block_indices(ds, first, last, pr_thresholds, span_years, indices) for first, last in _contiguous(years)]
+    coverage_end = str(ds['time'].values[-1])[:10]
+
+    if output_path.suffix == '.zarr' and output_path.exists():
+        done = existing_years(output_path)
+        # Regions and appends only extend a store forward in time; earlier years mean rewriting it in order
+        if all(year in done or year > done[-1] for year in years):
+            _update_zarr(new_blocks, output_path, coverage_end)
+            print(f"\n Updated {len(years)} years at: {output_path.resolve()}")
+            return str(output_path.resolve())
+        print(f"Years before {done[0]} are added: rewriting {output_path.name}")
+
+    updated = xr.concat(new_blocks, dim='time')
+    if output_path.exists():
+        with xr.open_dataset(output_path) as existing:
+            kept = existing.isel(time=np.flatnonzero(~np.isin(calendar_fields(existing['time'])[0], years))).load()
+        updated = xr.concat([kept, updated], dim='time').sortby('time')
+
+    updated.attrs['time_coverage_end'] = coverage_end
+    fmt = 'zarr' if output_path.suffix == '.zarr' else 'netcdf'
+    return save_indices(updated, output_filename, output_dir, fmt=fmt)
+
+def _update_zarr(new_blocks: List[xr.Dataset], output_path: Path, coverage_end: str) -> None:
+    import zarr
+
+    done = existing_years(output_path)
+    for block in new_blocks:
+        block_years = calendar_fields(block['time'])[0]
+        recomputed = np.isin(block_years, done)
+        # Years already in the store are overwritten in place, later years are appended. The year is loaded first so the
+        # write does not depend on its dask chunks lining up with the store's (stores from older runs chunk time coarser)
+        for i in np.flatnonzero(recomputed):
+            pos = done.index(int(block_years[i]))
+            write_zarr_region(block.isel(time=[i]).load(), str(output_path), {'time': slice(pos, pos + 1)})
+        if (~recomputed).any():
+            save_indices(block.isel(time=np.flatnonzero(~recomputed)), output_path.name, str(output_path.parent), fmt='zarr-append')
+
+    zarr.open_group(str(output_path), mode='r+').attrs['time_coverage_end'] = coverage_end
+    zarr.consolidate_metadata(str(output_path))
@@ -1,8 +1,12 @@
 from utilities import _clean_coords
+from engine import fused_climate_index
+from thresholds import PR_QUANTILES, get_thresholds
+from instrumentation import span
+from time_segments import Frequency, label_periods, period_index
 import xarray as xr
 import numpy as np
 import warnings
-from typing import Dict, Union
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 warnings.filterwarnings("ignore", message="All-NaN slice encountered")
 
@@ -19,149 +23,255 @@ INDEX_INFO: Dict[str, Dict[str, str]] = {
     "Rx5day": {"long_name": "Annual maximum consecutive 5-day precipitation amount", "units": "mm"},
     "SDII": {"long_name": "Simple daily intensity index (PRCPTOT/wet_days)", "units": "mm/day"},
     "PRCPTOT": {"long_name": "Annual total wet-day precipitation (PR > 1mm)", "units": "mm"},
-    "R95p": {"long_name": "Annual total precipitation above 95th percentile", "units": "mm"},
-    "R99p": {"long_name": "Annual total precipitation above 99th percentile", "units": "mm"},
-    "CWD": {"long_name": "Consecutive wet days", "units": "days"},
-    "CDD": {"long_name": "Consecutive dry days", "units": "days"},
+    "R95p": {"long_name": "Annual total precipitation above the 95th percentile of wet days", "units": "mm"},
+    "R99p": {"long_name": "Annual total precipitation above the 99th percentile of wet days", "units": "mm"},
+    "CWD": {"long_name": "Maximum number of consecutive wet days (PR ≥ 1mm)", "units": "days"},
+    "CDD": {"long_name": "Maximum number of consecutive dry days (PR < 1mm)", "units": "days"},
     "R10mm": {"long_name": "Number of days with precipitation ≥ 10mm", "units": "days"},
     "R20mm": {"long_name": "Number of days with precipitation ≥ 20mm", "units": "days"},
-    "WSDI": {"long_name": "Warm Spell Duration Index", "units": "days"},
-    "CSDI": {"long_name": "Cold Spell Duration Index", "units": "days"},
+    "WSDI": {"long_name": "Warm Spell Duration Index (days in ≥6-day spells of Tmax > 30°C)", "units": "days"},
+    "CSDI": {"long_name": "Cold Spell Duration Index (days in ≥6-day spells of Tmin < 0°C)", "units": "days"},
     "R1mm": {"long_name": "Number of days with precipitation ≥ 1mm", "units": "days"},
     "RRR": {"long_name": "Annual total precipitation in the wettest period", "units": "mm"},
     "FDD": {"long_name": "Frost days (Tmin ≤ 0°C)", "units": "days"},
     "R50mm": {"long_name": "Number of days with precipitation ≥ 50mm", "units": "days"},
 }
 
-def TXx(tasmax: xr.DataArray) -> xr.DataArray:
-    return tasmax.where(~np.isnan(tasmax)).groupby('time.year').max(dim='time', skipna=True)
+PERIOD_NAMES: Dict[str, str] = {'annual': 'Annual', 'seasonal': 'Seasonal', 'monthly': 'Monthly'}
+
+_YEAR = ["year_segments"]
+
+INDEX_REGISTRY: Dict[str, Dict[str, List[str]]] = {
+    "TXx": {"inputs": ["tasmax"], "intermediates": _YEAR},
+    "TXn": {"inputs": ["tasmax"], "intermediates": _YEAR},
+    "TNx": {"inputs": ["tasmin"], "intermediates": _YEAR},
+    "TNn": {"inputs": ["tasmin"], "intermediates": _YEAR},
+    "DTR": {"inputs": ["tasmax", "tasmin"], "intermediates": _YEAR},
+    "SU25": {"inputs": ["tasmax"], "intermediates": _YEAR},
+    "TR20": {"inputs": ["tasmin"], "intermediates": _YEAR},
+    "Tmean": {"inputs": ["tas"], "intermediates": _YEAR},
+    "Rx1day": {"inputs": ["pr"], "intermediates": _YEAR},
+    "Rx5day": {"inputs": ["pr"], "intermediates": _YEAR},
+    "SDII": {"inputs": ["pr"], "intermediates": _YEAR + ["wet_mask"]},
+    "PRCPTOT": {"inputs": ["pr"], "intermediates": _YEAR + ["wet_mask"]},
+    "R95p": {"inputs": ["pr"], "intermediates": _YEAR + ["pr_thresholds"]},
+    "R99p": {"inputs": ["pr"], "intermediates": _YEAR + ["pr_thresholds"]},
+    "CWD": {"inputs": ["pr"], "intermediates": _YEAR + ["spell_runs"]},
+    "CDD": {"inputs": ["pr"], "intermediates": _YEAR + ["spell_runs"]},
+    "R10mm": {"inputs": ["pr"], "intermediates": _YEAR},
+    "R20mm": {"inputs": ["pr"], "intermediates": _YEAR},
+    "WSDI": {"inputs": ["tasmax"], "intermediates": _YEAR + ["spell_runs"]},
+    "CSDI": {"inputs": ["tasmin"], "intermediates": _YEAR + ["spell_runs"]},
+    "R1mm": {"inputs": ["pr"], "intermediates": _YEAR},
+    "RRR": {"inputs": ["pr"], "intermediates": _YEAR + ["wet_mask"]},
+    "FDD": {"inputs": ["tasmin"], "intermediates": _YEAR},
+    "R50mm": {"inputs": ["pr"], "intermediates": _YEAR},
+}
+
+def resolve_indices(indices: Optional[Sequence[str]] = None) -> List[str]:
+    if indices is None:
+        return list(INDEX_INFO)
+    unknown = [name for name in indices if name not in INDEX_REGISTRY]
+    if unknown:
+        raise ValueError(f"Unknown indices requested: {unknown}")
+    return [name for name in INDEX_INFO if name in indices]
+
+def required_variables(indices: Optional[Sequence[str]] = None) -> List[str]:
+    needed = {var for name in resolve_indices(indices) for var in INDEX_REGISTRY[name]["inputs"]}
+    return [var for var in ['tasmax', 'tasmin', 'tas', 'pr'] if var in needed]
+
+def _periodic(da: xr.DataArray, how: str, freq: Frequency = 'annual', **kwargs) -> xr.DataArray:
+    # Integer period codes work for every calendar and give the same time labels as the fused engine
+    reduced = getattr(da.groupby(period_index(da['time'], freq)), how)(dim='time', **kwargs)
+    return label_periods(reduced, da['time'], freq)
 
-def TXn(tasmax: xr.DataArray) -> xr.DataArray:
-    return tasmax.where(~np.isnan(tasmax)).groupby('time.year').min(dim='time', skipna=True)
+def TXx(tasmax: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(tasmax.where(~np.isnan(tasmax)), 'max', freq, skipna=True)
 
-def TNx(tasmin: xr.DataArray) -> xr.DataArray:
-    return tasmin.where(~np.isnan(tasmin)).groupby('time.year').max(dim='time', skipna=True)
+def TXn(tasmax: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(tasmax.where(~np.isnan(tasmax)), 'min', freq, skipna=True)
 
-def TNn(tasmin: xr.DataArray) -> xr.DataArray:
-    return tasmin.where(~np.isnan(tasmin)).groupby('time.year').min(dim='time', skipna=True)
+def TNx(tasmin: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(tasmin.where(~np.isnan(tasmin)), 'max', freq, skipna=True)
 
-def DTR(tasmax: xr.DataArray, tasmin: xr.DataArray) -> xr.DataArray:
+def TNn(tasmin: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(tasmin.where(~np.isnan(tasmin)), 'min', freq, skipna=True)
+
+def DTR(tasmax: xr.DataArray, tasmin: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
     dtr_daily = tasmax - tasmin
-    return dtr_daily.where(~np.isnan(dtr_daily)).groupby('time.year').mean(dim='time', skipna=True)
+    return _periodic(dtr_daily.where(~np.isnan(dtr_daily)), 'mean', freq, skipna=True)
 
-def SU25(tasmax: xr.DataArray) -> xr.DataArray:
-    return (tasmax > 25).groupby("time.year").sum(dim="time", skipna=True)
+def SU25(tasmax: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(tasmax > 25, 'sum', freq, skipna=True)
 
-def TR20(tasmin: xr.DataArray) -> xr.DataArray:
-    return (tasmin > 20).groupby("time.year").sum(dim="time", skipna=True)
+def TR20(tasmin: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(tasmin > 20, 'sum', freq, skipna=True)
 
-def Tmean(tas: xr.DataArray) -> xr.DataArray:
-    return tas.where(~np.isnan(tas)).groupby('time.year').mean(dim='time', skipna=True)
+def Tmean(tas: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(tas.where(~np.isnan(tas)), 'mean', freq, skipna=True)
 
-def Rx1day(pr: xr.DataArray) -> xr.DataArray:
-    return pr.where(~np.isnan(pr)).resample(time='YE').max(dim='time', skipna=True)
+def Rx1day(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(pr.where(~np.isnan(pr)), 'max', freq, skipna=True)
 
-def Rx5day(pr: xr.DataArray) -> xr.DataArray:
+def Rx5day(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
     pr_rolling = pr.where(~np.isnan(pr)).rolling(time=5, min_periods=1).sum(skipna=True)
-    return pr_rolling.resample(time='YE').max(dim='time', skipna=True)
+    return _periodic(pr_rolling, 'max', freq, skipna=True)
 
-def SDII(pr: xr.DataArray) -> xr.DataArray:
+def SDII(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
     pr_rain = pr.where(pr > 1.0)
-    prcptot = pr_rain.groupby('time.year').sum(dim='time', skipna=True)
-    wet_days = pr_rain.groupby('time.year').count(dim='time')
+    prcptot = _periodic(pr_rain, 'sum', freq, skipna=True)
+    wet_days = _periodic(pr_rain, 'count', freq)
     return prcptot / wet_days
 
-def PRCPTOT(pr: xr.DataArray) -> xr.DataArray:
+def PRCPTOT(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
     pr_rain = pr.where(pr > 1.0)
-    return pr_rain.groupby('time.year').sum(dim='time', skipna=True)
+    return _periodic(pr_rain, 'sum', freq, skipna=True)
 
-def R95p(pr: xr.DataArray) -> xr.DataArray:
+def R95p(pr: xr.DataArray, base_period: Optional[Tuple[int, int]] = None, cache_dir: Optional[str] = None,
+         thresholds: Optional[xr.DataArray] = None, freq: Frequency = 'annual') -> xr.DataArray:
     pr_valid = pr.where(~np.isnan(pr))
-    thr = pr_valid.quantile(0.95, dim='time', skipna=True)
+    if thresholds is None:
+        thresholds = get_thresholds(pr, PR_QUANTILES, base_period, cache_dir)
+    thr = thresholds.sel(quantile=0.95)
     pr95 = pr_valid.where(pr_valid > _clean_coords(thr))
-    return pr95.groupby('time.year').sum(dim='time', skipna=True)
+    return _periodic(pr95, 'sum', freq, skipna=True)
 
-def R99p(pr: xr.DataArray) -> xr.DataArray:
+def R99p(pr: xr.DataArray, base_period: Optional[Tuple[int, int]] = None, cache_dir: Optional[str] = None,
+         thresholds: Optional[xr.DataArray] = None, freq: Frequency = 'annual') -> xr.DataArray:
     pr_valid = pr.where(~np.isnan(pr))
-    thr = pr_valid.quantile(0.99, dim='time', skipna=True)
+    if thresholds is None:
+        thresholds = get_thresholds(pr, PR_QUANTILES, base_period, cache_dir)
+    thr = thresholds.sel(quantile=0.99)
     pr99 = pr_valid.where(pr_valid > _clean_coords(thr))
-    return pr99.groupby('time.year').sum(dim='time', skipna=True)
-
-def CWD(pr: xr.DataArray) -> xr.DataArray:
-    return pr.where(pr > 1.0).rolling(time=5, min_periods=1).count().resample(time='YE').max(dim='time', skipna=True)
-
-def CDD(pr: xr.DataArray) -> xr.DataArray:
-    return pr.where(pr == 0).rolling(time=5, min_periods=1).count().resample(time='YE').max(dim='time', skipna=True)
-
-def R10mm(pr: xr.DataArray) -> xr.DataArray:
-    return (pr >= 10).groupby("time.year").sum(dim="time", skipna=True)
-
-def R20mm(pr: xr.DataArray) -> xr.DataArray:
-    return (pr >= 20).groupby("time.year").sum(dim="time", skipna=True)
-
-def WSDI(tasmax: xr.DataArray) -> xr.DataArray:
-    return tasmax.where(tasmax > 30).groupby("time.year").sum(dim="time", skipna=True)
-
-def CSDI(tasmin: xr.DataArray) -> xr.DataArray:
-    return tasmin.where(tasmin < 0).groupby("time.year").sum(dim="time", skipna=True)
-
-def R1mm(pr: xr.DataArray) -> xr.DataArray:
-    return (pr >= 1).groupby("time.year").sum(dim="time", skipna=True)
-
-def RRR(pr: xr.DataArray) -> xr.DataArray:
-    return pr.where(pr > 1).rolling(time=7).sum().resample(time="YE").max(dim="time", skipna=True)
-
-def FDD(tasmin: xr.DataArray) -> xr.DataArray:
-    return (tasmin <= 0).groupby("time.year").sum(dim="time", skipna=True)
-
-def R50mm(pr: xr.DataArray) -> xr.DataArray:
-    return (pr >= 50).groupby("time.year").sum(dim="time", skipna=True)
-
-def climate_index(ds: xr.Dataset) -> xr.Dataset:
-    required_vars = ['tasmax', 'tasmin', 'tas', 'pr']
+    return _periodic(pr99, 'sum', freq, skipna=True)
+
+def _spell_ends(count: xr.DataArray, length: int, period: Optional[xr.DataArray]) -> xr.DataArray:
+    # True where the `length` days ending here are all spell days (and, given period codes, fall in one period);
+    # count is the running number of spell days
+    full = (count - count.shift(time=length, fill_value=0)) == length
+    if period is not None:
+        full = full & (period == period.shift(time=length - 1))
+    return full
+
+def _observed(data: xr.DataArray, freq: Frequency) -> xr.DataArray:
+    return _periodic(data.notnull(), 'sum', freq) > 0
+
+def _longest_spell(data: xr.DataArray, mask: xr.DataArray, span_years: bool, freq: Frequency) -> xr.DataArray:
+    # The longest spell is the number of lengths L for which some L-day window of the period is a full spell
+    period = None if span_years else period_index(data['time'], freq)
+    count = mask.cumsum('time')
+    found = [_periodic(_spell_ends(count, 1, period), 'max', freq)]
+    while bool(found[-1].any()):
+        found.append(_periodic(_spell_ends(count, len(found) + 1, period), 'max', freq))
+    return sum(spell.astype(np.float64) for spell in found).where(_observed(data, freq))
+
+def _spell_days(data: xr.DataArray, mask: xr.DataArray, min_length: int, span_years: bool, freq: Frequency) -> xr.DataArray:
+    # A day belongs to a spell when one of the full min_length-day windows covering it ends on or after it
+    period = None if span_years else period_index(data['time'], freq)
+    ends = _spell_ends(mask.cumsum('time'), min_length, period)
+    in_spell = ends
+    for offset in range(1, min_length):
+        in_spell = in_spell | ends.shift(time=-offset, fill_value=False)
+    return _periodic(in_spell, 'sum', freq).astype(np.float64).where(_observed(data, freq))
+
+def CWD(pr: xr.DataArray, span_years: bool = False, freq: Frequency = 'annual') -> xr.DataArray:
+    return _longest_spell(pr, pr >= 1.0, span_years, freq)
+
+def CDD(pr: xr.DataArray, span_years: bool = False, freq: Frequency = 'annual') -> xr.DataArray:
+    return _longest_spell(pr, pr < 1.0, span_years, freq)
+
+def R10mm(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(pr >= 10, 'sum', freq, skipna=True)
+
+def R20mm(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(pr >= 20, 'sum', freq, skipna=True)
+
+def WSDI(tasmax: xr.DataArray, span_years: bool = False, freq: Frequency = 'annual') -> xr.DataArray:
+    return _spell_days(tasmax, tasmax > 30, 6, span_years, freq)
+
+def CSDI(tasmin: xr.DataArray, span_years: bool = False, freq: Frequency = 'annual') -> xr.DataArray:
+    return _spell_days(tasmin, tasmin < 0, 6, span_years, freq)
+
+def R1mm(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(pr >= 1, 'sum', freq, skipna=True)
+
+def RRR(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(pr.where(pr > 1).rolling(time=7).sum(), 'max', freq, skipna=True)
+
+def FDD(tasmin: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(tasmin <= 0, 'sum', freq, skipna=True)
+
+def R50mm(pr: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    return _periodic(pr >= 50, 'sum', freq, skipna=True)
+
+def _finish(ds_indices: xr.Dataset, ds: xr.Dataset, freq: Frequency) -> xr.Dataset:
+    for name in ds_indices.data_vars:
+        for var in INDEX_REGISTRY[name]["inputs"]:
+            if f"valid_mask_{var}" in ds.coords:
+                ds_indices[name] = ds_indices[name].where(ds[f"valid_mask_{var}"].reset_coords(drop=True))
+    ds_indices = ds_indices.drop_vars([name for name in ds_indices.coords if name.startswith('valid_mask')])
+    for name, da in ds_indices.data_vars.items():
+        da.attrs.update(INDEX_INFO[name])
+        da.attrs['long_name'] = da.attrs['long_name'].replace('Annual', PERIOD_NAMES[freq])
+    if freq == 'seasonal':
+        ds_indices = ds_indices.assign_coords(season=('time', ds_indices['time'].dt.season.values))
+    ds_indices.attrs['title'] = f"{PERIOD_NAMES[freq]} ETCCDI Climate Indices"
+    return ds_indices
+
+def climate_index(ds: xr.Dataset, indices: Optional[Sequence[str]] = None, fused: bool = True, span_years: bool = False,
+                  base_period: Optional[Tuple[int, int]] = None, cache_dir: Optional[str] = None,
+                  pr_thresholds: Optional[xr.DataArray] = None, verbose: bool = True,
+                  freq: Union[Frequency, Sequence[Frequency]] = 'annual') -> Union[xr.Dataset, Dict[str, xr.Dataset]]:
+    # A list of frequencies returns one dataset per frequency, all from a single pass over the daily data
+    freqs: List[Frequency] = [freq] if isinstance(freq, str) else list(dict.fromkeys(freq))
+    unknown = [f for f in freqs if f not in PERIOD_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown frequencies requested: {unknown}")
+    selected = resolve_indices(indices)
+    required_vars = required_variables(selected)
     if not all(v in ds.data_vars for v in required_vars):
         missing = [v for v in required_vars if v not in ds.data_vars]
         raise ValueError(f"Required variables are missing from the dataset: {missing}")
 
-    tasmax, tasmin, tas, pr = ds['tasmax'], ds['tasmin'], ds['tas'], ds['pr']
-    results: Dict[str, Union[xr.DataArray, xr.Dataset]] = {}
-
-    results["TXx"] = _clean_coords(TXx(tasmax))
-    results["TXn"] = _clean_coords(TXn(tasmax))
-    results["TNx"] = _clean_coords(TNx(tasmin))
-    results["TNn"] = _clean_coords(TNn(tasmin))
-    results["DTR"] = _clean_coords(DTR(tasmax, tasmin))
-    results["SU25"] = _clean_coords(SU25(tasmax))
-    results["TR20"] = _clean_coords(TR20(tasmin))
-    results["Tmean"] = _clean_coords(Tmean(tas))
-    results["Rx1day"] = _clean_coords(Rx1day(pr))
-    results["Rx5day"] = _clean_coords(Rx5day(pr))
-    results["SDII"] = _clean_coords(SDII(pr))
-    results["PRCPTOT"] = _clean_coords(PRCPTOT(pr))
-    results["R95p"] = _clean_coords(R95p(pr))
-    results["R99p"] = _clean_coords(R99p(pr))
-    results["CWD"] = _clean_coords(CWD(pr))
-    results["CDD"] = _clean_coords(CDD(pr))
-    results["R10mm"] = _clean_coords(R10mm(pr))
-    results["R20mm"] = _clean_coords(R20mm(pr))
-    results["WSDI"] = _clean_coords(WSDI(tasmax))
-    results["CSDI"] = _clean_coords(CSDI(tasmin))
-    results["R1mm"] = _clean_coords(R1mm(pr))
-    results["RRR"] = _clean_coords(RRR(pr))
-    results["FDD"] = _clean_coords(FDD(tasmin))
-    results["R50mm"] = _clean_coords(R50mm(pr))
-
-    ds_annual_indices = xr.Dataset(results)
-
-    for name, da in ds_annual_indices.data_vars.items():
-        if name in INDEX_INFO:
-            da.name = name
-            da.attrs.update(INDEX_INFO[name])
-
-    if 'time' not in ds_annual_indices.coords:
-        if 'year' in ds_annual_indices.dims:
-            ds_annual_indices = ds_annual_indices.rename({'year': 'time'})
-
-    print("ETCCDI indices calculation completed.")
-    return ds_annual_indices
-    
+    ds = ds[required_vars]
+    needs_thresholds = any("pr_thresholds" in INDEX_REGISTRY[name]["intermediates"] for name in selected)
+    if needs_thresholds and pr_thresholds is None:
+        with span('thresholds'):
+            pr_thresholds = get_thresholds(ds['pr'], PR_QUANTILES, base_period, cache_dir)
+
+    if fused:
+        by_freq = fused_climate_index(ds, selected, INDEX_REGISTRY, pr_thresholds, span_years, freqs)
+    else:
+        tasmax, tasmin, tas, pr = (ds.get(v) for v in ['tasmax', 'tasmin', 'tas', 'pr'])
+        reference: Dict[str, Callable[[Frequency], xr.DataArray]] = {
+            "TXx": lambda f: TXx(tasmax, f),
+            "TXn": lambda f: TXn(tasmax, f),
+            "TNx": lambda f: TNx(tasmin, f),
+            "TNn": lambda f: TNn(tasmin, f),
+            "DTR": lambda f: DTR(tasmax, tasmin, f),
+            "SU25": lambda f: SU25(tasmax, f),
+            "TR20": lambda f: TR20(tasmin, f),
+            "Tmean": lambda f: Tmean(tas, f),
+            "Rx1day": lambda f: Rx1day(pr, f),
+            "Rx5day": lambda f: Rx5day(pr, f),
+            "SDII": lambda f: SDII(pr, f),
+            "PRCPTOT": lambda f: PRCPTOT(pr, f),
+            "R95p": lambda f: R95p(pr, base_period, cache_dir, pr_thresholds, f),
+            "R99p": lambda f: R99p(pr, base_period, cache_dir, pr_thresholds, f),
+            "CWD": lambda f: CWD(pr, span_years, f),
+            "CDD": lambda f: CDD(pr, span_years, f),
+            "R10mm": lambda f: R10mm(pr, f),
+            "R20mm": lambda f: R20mm(pr, f),
+            "WSDI": lambda f: WSDI(tasmax, span_years, f),
+            "CSDI": lambda f: CSDI(tasmin, span_years, f),
+            "R1mm": lambda f: R1mm(pr, f),
+            "RRR": lambda f: RRR(pr, f),
+            "FDD": lambda f: FDD(tasmin, f),
+            "R50mm": lambda f: R50mm(pr, f),
+        }
+        by_freq = {f: xr.Dataset({name: _clean_coords(reference[name](f)) for name in selected}) for f in freqs}
+
+    results = {f: _finish(by_freq[f][selected], ds, f) for f in freqs}
+    if verbose:
+        print("ETCCDI indices calculation completed.")
+    return results[freq] if isinstance(freq, str) else results
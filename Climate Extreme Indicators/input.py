@@ -1,37 +1,56 @@
 import xarray as xr
-from pathlib import Path
-import os
-import glob
+from catalog import build_catalog, open_variable, select_files
+from preprocess import spatial_subset, time_subset
+from regrid import RegridMethod, align_to_grid
+from typing import Dict, List, Optional, Tuple, Union
+
+DEFAULT_CHUNKS: Dict[str, Union[int, str]] = {'time': -1, 'lat': 'auto', 'lon': 'auto'}
+REGRID_METHOD: RegridMethod = 'conservative' # used when variables come on different grids; keeps pr totals
 
 def get_drive_data_path() -> str:
     default_path = '/content/drive/MyDrive/Group Project 2025/data/'
     return default_path
 
-def load_all_datasets_dynamically():
-    base_path = get_drive_data_path()  
-    nc_files = glob.glob(os.path.join(base_path, '*.nc'))
+def load_all_datasets_dynamically(chunks: Optional[Dict[str, Union[int, str]]] = DEFAULT_CHUNKS, variables: Optional[List[str]] = None,
+                                  period: Optional[Tuple[int, int]] = None, lat_range: Optional[Tuple[float, float]] = None,
+                                  lon_range: Optional[Tuple[float, float]] = None, data_dir: Optional[str] = None):
+    base_path = data_dir or get_drive_data_path()
+    catalog = build_catalog(base_path)
 
     datasets = {}
-    for file_path in nc_files:
-
-            name = Path(file_path).stem.split('_')[-1]
-            ds = xr.open_dataset(file_path, chunks={'time': -1})
-            datasets[name] = ds
+    for name in sorted({entry["variable"] for entry in catalog}):
+        if variables is not None and name not in variables:
+            continue
+        entries = select_files(catalog, name, period, lat_range, lon_range)
+        if not entries:
+            continue
+        # Crop lazily here so only the requested hyperslab is ever read from disk
+        ds = open_variable(entries, chunks)
+        if lat_range or lon_range:
+            ds = spatial_subset(ds, lat_range or (-90, 90), lon_range or (-180, 180), verbose=False)
+        if period:
+            ds = time_subset(ds, period, verbose=False)
+        datasets[name] = ds
 
     print("\nTotal number of datasets downloaded:", len(datasets))
     return datasets
-    
-def combine_datasets(datasets):
+
+def combine_datasets(datasets, regrid_method: RegridMethod = REGRID_METHOD, regrid_dir: Optional[str] = None):
     priority_vars = ['tas', 'tasmax', 'tasmin', 'pr']
     datasets_to_merge = [datasets[name] for name in priority_vars if name in datasets]
+    # Everything goes on the grid of the first variable, so the outer join below only ever pads the time axis
+    datasets_to_merge = align_to_grid(datasets_to_merge, regrid_method, regrid_dir)
 
     merged = xr.merge(datasets_to_merge, compat='override', join='outer')
     print(f"\nDataset has been combined. Variables:{list(merged.data_vars)}")
     return merged
 
-def load_all_data_for_analysis():
-    all_datasets = load_all_datasets_dynamically()
-    combined_data = combine_datasets(all_datasets)
+def load_all_data_for_analysis(chunks: Optional[Dict[str, Union[int, str]]] = DEFAULT_CHUNKS, variables: Optional[List[str]] = None,
+                               period: Optional[Tuple[int, int]] = None, lat_range: Optional[Tuple[float, float]] = None,
+                               lon_range: Optional[Tuple[float, float]] = None, data_dir: Optional[str] = None,
+                               regrid_method: RegridMethod = REGRID_METHOD, regrid_dir: Optional[str] = None):
+    all_datasets = load_all_datasets_dynamically(chunks, variables, period, lat_range, lon_range, data_dir)
+    combined_data = combine_datasets(all_datasets, regrid_method, regrid_dir)
 
     return combined_data
 
@@ -1,32 +1,217 @@
 import argparse
+import dask
+import os
+import sys
+import xarray as xr
+from pathlib import Path
+COMMON_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(1, COMMON_DIR) # modules shared by all three folders
+from input import REGRID_METHOD, get_drive_data_path, load_all_data_for_analysis
 from preprocess import combine_preprocess
-from utilities import save_indices_to_netcdf
-from indices import climate_index
-from typing import Literal
-
-def main():
-    OUTPUT_DIR = '/content/drive/MyDrive/Group Project 2025/results'
-    LAT_RANGE = (8.0, 24.0) # currently Vietnam
-    LON_RANGE = (102.0, 110.0)
-    NAN_METHOD: Literal['keep'] = 'keep'
-
-    combined_data = load_all_data_for_analysis()
-
-    processed_data = combine_preprocess(
-        ds=combined_data,
-        lat_range=LAT_RANGE,
-        lon_range=LON_RANGE,
-        nan_method=NAN_METHOD
-    )
-
-    annual_indices_ds = climate_index(processed_data)
-
-    save_indices_to_netcdf(
-        ds_indices=annual_indices_ds,
-        output_filename='calculated_indices.nc',
-        output_dir=OUTPUT_DIR
-    )
+from writers import save_indices
+from indices import climate_index, required_variables, INDEX_INFO, PERIOD_NAMES
+from tiling import run_tiled
+from incremental import freeze_thresholds, needs_thresholds, update_indices
+from thresholds import PR_QUANTILES, get_thresholds
+from execution import execution_backend
+from previews import write_previews
+from zonal import write_zonal
+from cube_cache import cached_cube, input_fingerprint
+from instrumentation import instrumented_run, path_size_mb, span
+from precision import precision_policy, precision_report
+from typing import List, Literal, Optional, Tuple
+
+OUTPUT_DIR = '/content/drive/MyDrive/Group Project 2025/results'
+OUTPUT_FILENAME = 'calculated_indices.nc' # use a '.zarr' name to write a Zarr store
+LAT_RANGE = (8.0, 24.0) # currently Vietnam
+LON_RANGE = (102.0, 110.0)
+PERIOD: Optional[Tuple[int, int]] = None # e.g. (1961, 2023); None keeps every full year in the files
+NAN_METHOD: Literal['keep'] = 'keep'
+INDICES: Optional[List[str]] = None # e.g. ['TXx', 'Rx1day']; None computes all 24 indices
+FREQUENCIES: List[str] = ['annual'] # any of 'annual', 'seasonal' (DJF/MAM/JJA/SON), 'monthly', computed in one pass
+MEMORY_BUDGET_MB: Optional[float] = None # set to stream spatial tiles under this budget
+BASE_PERIOD: Optional[Tuple[int, int]] = None # e.g. (1961, 1990); None uses the full record
+INCREMENTAL = False # only compute years missing from an existing output file
+CUBE_CACHE_GB = 20.0 # size cap of the preprocessed-cube cache in '<output-dir>/cube_cache'; 0 disables it
+PREVIEWS = True # write '<output>_preview.nc' (coarsened levels, climatology, histograms) for fast plotting
+REGIONS: Optional[str] = None # GeoJSON of provinces/districts; writes '<output>_zonal.nc/.csv' (time, region) tables
+REGION_FIELD: Optional[str] = None # feature property holding the region name; None tries 'name', 'NAME_1', ...
+PRECISION: Literal['float32', 'float64'] = 'float32' # compute dtype of the daily fields; 'float64' reproduces the old pipeline
+PACKING = True # store °C results as int16 with scale_factor 0.01 (0.005 °C steps); day counts are always int16
+COMPRESSION: Literal['zlib', 'zstd', 'none'] = 'zlib' # 'zstd' is smaller and faster but needs netCDF-C with the zstd filter to read
+VALIDATE_PRECISION = False # rerun in float64 and write '<output>_precision.json' with the largest deviations
+REPORT = True # write '<output>_report.json' with per-stage timings, I/O, memory and dask task counts
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compute annual, seasonal or monthly ETCCDI climate extreme indices.")
+    parser.add_argument('--data-dir', default=None, help="folder with the input .nc files (default: get_drive_data_path())")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--output-file', default=OUTPUT_FILENAME, help="ends in .zarr to write a Zarr store")
+    parser.add_argument('--lat-range', nargs=2, type=float, default=LAT_RANGE, metavar=('MIN', 'MAX'))
+    parser.add_argument('--lon-range', nargs=2, type=float, default=LON_RANGE, metavar=('MIN', 'MAX'))
+    parser.add_argument('--period', nargs=2, type=int, default=PERIOD, metavar=('START', 'END'))
+    parser.add_argument('--base-period', nargs=2, type=int, default=BASE_PERIOD, metavar=('START', 'END'))
+    parser.add_argument('--indices', nargs='+', default=INDICES, choices=list(INDEX_INFO), metavar='INDEX')
+    parser.add_argument('--freq', nargs='+', default=FREQUENCIES, choices=list(PERIOD_NAMES),
+                        help="seasonal and monthly results go to '<output-file stem>_<freq>' next to the annual file")
+    parser.add_argument('--memory-budget-mb', type=float, default=MEMORY_BUDGET_MB)
+    parser.add_argument('--incremental', action='store_true', default=INCREMENTAL)
+    parser.add_argument('--regrid-method', choices=['conservative', 'bilinear'], default=REGRID_METHOD,
+                        help="used when input variables come on different grids")
+    parser.add_argument('--regrid-cache-dir', default=None, help="default: <output-dir>/regrid_weights")
+    parser.add_argument('--cube-cache-dir', default=None, help="default: <output-dir>/cube_cache")
+    parser.add_argument('--cube-cache-gb', type=float, default=CUBE_CACHE_GB, help="0 disables the preprocessed-cube cache")
+    parser.add_argument('--no-previews', dest='previews', action='store_false', default=PREVIEWS)
+    parser.add_argument('--regions', default=REGIONS, help="GeoJSON (or shapefile with geopandas) of regions to average over")
+    parser.add_argument('--region-field', default=REGION_FIELD)
+    parser.add_argument('--zonal-cache-dir', default=None, help="default: <output-dir>/zonal_weights")
+    parser.add_argument('--precision', choices=['float32', 'float64'], default=PRECISION)
+    parser.add_argument('--no-packing', dest='packing', action='store_false', default=PACKING,
+                        help="store °C results as float instead of int16 with a 0.01 scale factor")
+    parser.add_argument('--compression', choices=['zlib', 'zstd', 'none'], default=COMPRESSION)
+    parser.add_argument('--validate-precision', action='store_true', default=VALIDATE_PRECISION,
+                        help="rerun in float64 and report the largest deviation of every saved variable")
+    parser.add_argument('--report', default=None, help="run report path (default: <output-dir>/<output-file stem>_report.json)")
+    parser.add_argument('--no-report', dest='write_report', action='store_false', default=REPORT)
+    parser.add_argument('--profile-stage', default=None, metavar='STAGE',
+                        help="profile one stage: load, preprocess, cube_cache, thresholds, climate_index, save, tile, previews, zonal, ...")
+    parser.add_argument('--profile', choices=['cprofile', 'dask'], default='cprofile',
+                        help="'dask' writes a dask performance report (needs --scheduler distributed)")
+    parser.add_argument('--threshold-cache-dir', default=None, help="default: <output-dir>/threshold_cache")
+    parser.add_argument('--scheduler', choices=['threads', 'processes', 'distributed'], default='threads')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="distributed scheduler only")
+    parser.add_argument('--memory-limit', default=None, help="per worker, e.g. '4GB' (distributed scheduler only)")
+    args = parser.parse_args(argv)
+    if args.freq != ['annual'] and (args.incremental or args.memory_budget_mb is not None):
+        parser.error("--incremental and --memory-budget-mb only produce annual indices")
+    if args.validate_precision and (args.incremental or args.memory_budget_mb is not None):
+        parser.error("--validate-precision needs the in-memory run (no --incremental or --memory-budget-mb)")
+    return args
+
+def frequency_filename(output_file: str, freq: str) -> str:
+    if freq == 'annual':
+        return output_file
+    path = Path(output_file)
+    return f"{path.stem}_{freq}{path.suffix}"
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    data_dir = args.data_dir or get_drive_data_path()
+    lat_range = tuple(args.lat_range)
+    lon_range = tuple(args.lon_range)
+    period = tuple(args.period) if args.period else None
+    base_period = tuple(args.base_period) if args.base_period else None
+    threshold_cache_dir = args.threshold_cache_dir or os.path.join(args.output_dir, 'threshold_cache')
+    regrid_dir = args.regrid_cache_dir or os.path.join(args.output_dir, 'regrid_weights')
+
+    report_path = args.report or os.path.join(args.output_dir, f"{Path(args.output_file).stem}_report.json")
+
+    with execution_backend(args.scheduler, args.workers, args.memory_limit, args.threads_per_worker), \
+         precision_policy(args.precision, args.packing, args.compression), \
+         instrumented_run(report_path if args.write_report else None, args.profile_stage, args.profile, vars(args)):
+        if args.memory_budget_mb is not None:
+            with span('run_tiled'):
+                saved_paths = [run_tiled(
+                    ds=load_all_data_for_analysis(chunks=None, variables=required_variables(args.indices), period=period,
+                                                  lat_range=lat_range, lon_range=lon_range, data_dir=data_dir,
+                                                  regrid_method=args.regrid_method, regrid_dir=regrid_dir),
+                    lat_range=lat_range,
+                    lon_range=lon_range,
+                    output_filename=args.output_file,
+                    output_dir=args.output_dir,
+                    memory_budget_mb=args.memory_budget_mb,
+                    nan_method=NAN_METHOD,
+                    base_period=base_period,
+                    cache_dir=threshold_cache_dir,
+                    indices=args.indices
+                )]
+        else:
+            saved_paths = _run_in_memory(args, data_dir, lat_range, lon_range, period, base_period, threshold_cache_dir, regrid_dir)
+
+        if args.previews:
+            with span('previews'):
+                for saved_path in saved_paths:
+                    write_previews(saved_path)
+        if args.regions:
+            # Overlap weights are computed once per (region file, grid) and reused from the cache
+            with span('zonal'):
+                for saved_path in saved_paths:
+                    write_zonal(saved_path, args.regions, args.zonal_cache_dir or os.path.join(args.output_dir, 'zonal_weights'),
+                                args.region_field)
     print("PROGRAM COMPLETED SUCCESSFULLY!")
 
+def _run_in_memory(args: argparse.Namespace, data_dir: str, lat_range: Tuple[float, float], lon_range: Tuple[float, float],
+                   period: Optional[Tuple[int, int]], base_period: Optional[Tuple[int, int]], threshold_cache_dir: str,
+                   regrid_dir: str) -> List[str]:
+    variables = required_variables(args.indices)
+
+    def preprocessed() -> xr.Dataset:
+        with span('load'):
+            combined_data = load_all_data_for_analysis(variables=variables, period=period, lat_range=lat_range, lon_range=lon_range,
+                                                       data_dir=data_dir, regrid_method=args.regrid_method, regrid_dir=regrid_dir)
+        with span('preprocess'):
+            return combine_preprocess(
+                ds=combined_data,
+                lat_range=lat_range,
+                lon_range=lon_range,
+                nan_method=NAN_METHOD,
+                period=period
+            )
+
+    # Repeated runs over the same files, area and period start from the cleaned cube on disk
+    with span('cube_cache'):
+        cache_key = {"files": input_fingerprint(data_dir, variables, period, lat_range, lon_range), "variables": variables,
+                     "lat_range": lat_range, "lon_range": lon_range, "period": period, "nan_method": NAN_METHOD,
+                     "regrid": args.regrid_method, "precision": args.precision}
+        processed_data = cached_cube(cache_key, preprocessed, args.cube_cache_dir or os.path.join(args.output_dir, 'cube_cache'),
+                                     args.cube_cache_gb)
+
+    if args.incremental:
+        with span('update_indices'):
+            return [update_indices(
+                ds=processed_data,
+                output_filename=args.output_file,
+                output_dir=args.output_dir,
+                base_period=base_period,
+                indices=args.indices
+            )]
+
+    # Thresholds of a fixed base period are frozen next to the output, so later --incremental runs can extend it
+    pr_thresholds = None
+    if base_period is not None and needs_thresholds(args.indices):
+        with span('thresholds'):
+            pr_thresholds = get_thresholds(processed_data['pr'], PR_QUANTILES, base_period, threshold_cache_dir)
+
+    with span('climate_index'):
+        indices_by_freq = climate_index(processed_data, args.indices, base_period=base_period, cache_dir=threshold_cache_dir,
+                                        pr_thresholds=pr_thresholds, freq=args.freq)
+
+    # The index graph is computed here, while writing
+    with span('save') as stage:
+        if len(indices_by_freq) > 1:
+            # All frequencies come out of the same kernel calls, so compute them together rather than once per file
+            indices_by_freq = dict(zip(indices_by_freq, dask.persist(*indices_by_freq.values())))
+        saved_paths = [save_indices(
+            ds_indices=ds_indices,
+            output_filename=frequency_filename(args.output_file, freq),
+            output_dir=args.output_dir,
+            fmt='zarr' if args.output_file.endswith('.zarr') else 'netcdf'
+        ) for freq, ds_indices in indices_by_freq.items()]
+        stage['output_mb'] = round(sum(path_size_mb(path) for path in saved_paths), 2)
+    if pr_thresholds is not None:
+        freeze_thresholds(pr_thresholds, Path(args.output_dir) / args.output_file)
+
+    if args.validate_precision:
+        # Reference run from the raw inputs in float64, bypassing the cube and threshold caches of the float32 run
+        with span('validate_precision'):
+            with precision_policy('float64', packing=False, compression=args.compression):
+                reference = climate_index(preprocessed(), args.indices, base_period=base_period, cache_dir=None, freq=args.freq)
+                reference = dict(zip(reference, dask.compute(*reference.values())))
+            for saved_path, ds_reference in zip(saved_paths, reference.values()):
+                precision_report(ds_reference, saved_path)
+    return saved_paths
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,86 @@
+import xarray as xr
+import numpy as np
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dask.base import tokenize
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+PR_QUANTILES: Tuple[float, ...] = (0.95, 0.99)
+WET_DAY_MM = 1.0
+
+# Least recently used thresholds are dropped beyond this many entries
+MEMORY_CACHE_SIZE = 16
+_memory_cache: "OrderedDict[str, xr.DataArray]" = OrderedDict()
+
+def _source_fingerprint(da: xr.DataArray) -> Union[List, str]:
+    # Every input file (catalog.open_variable and the cube cache record them), otherwise the data itself
+    return da.encoding.get('source_files') or tokenize(da.data)
+
+def threshold_key(da: xr.DataArray, quantiles: Sequence[float], base_period: Optional[Tuple[int, int]]) -> str:
+    bbox = [round(float(da[c].min()), 4) for c in ('lat', 'lon')] + [round(float(da[c].max()), 4) for c in ('lat', 'lon')]
+    payload = {
+        "variable": da.name,
+        "source": _source_fingerprint(da),
+        "time": [str(da['time'].values[0]), str(da['time'].values[-1])],
+        "n_time": da.sizes['time'],
+        "units": da.attrs.get('units', ''),
+        "dtype": str(da.dtype),
+        "bbox": bbox,
+        "shape": [da.sizes['lat'], da.sizes['lon']],
+        "base_period": list(base_period) if base_period else None,
+        "quantiles": sorted(float(q) for q in quantiles),
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+def _wet_quantiles(values: np.ndarray, quantiles: Sequence[float], wet_day: float) -> np.ndarray:
+    wet = np.where(values >= wet_day, values, np.nan)
+    return np.moveaxis(np.nanquantile(wet, quantiles, axis=-1), 0, -1)
+
+def compute_thresholds(pr: xr.DataArray, quantiles: Sequence[float] = PR_QUANTILES, base_period: Optional[Tuple[int, int]] = None,
+                       wet_day: float = WET_DAY_MM) -> xr.DataArray:
+    if base_period is not None:
+        pr = pr.sel(time=slice(f"{base_period[0]:04d}", f"{base_period[1]:04d}"))
+    if pr.chunks is not None:
+        pr = pr.chunk({'time': -1})
+    thr = xr.apply_ufunc(
+        _wet_quantiles, pr,
+        kwargs={'quantiles': list(quantiles), 'wet_day': wet_day},
+        input_core_dims=[['time']],
+        output_core_dims=[['quantile']],
+        dask='parallelized',
+        output_dtypes=[np.float64],
+        dask_gufunc_kwargs={'output_sizes': {'quantile': len(quantiles)}},
+    )
+    thr = thr.assign_coords(quantile=list(quantiles)).transpose('quantile', ...)
+    thr.attrs = {"long_name": "Wet-day precipitation percentile thresholds", "units": pr.attrs.get('units', 'mm'),
+                 "base_period": f"{base_period[0]}-{base_period[1]}" if base_period else "full record"}
+    return thr.rename('thresholds')
+
+def get_thresholds(pr: xr.DataArray, quantiles: Sequence[float] = PR_QUANTILES, base_period: Optional[Tuple[int, int]] = None,
+                   cache_dir: Optional[str] = None) -> xr.DataArray:
+    key = threshold_key(pr, quantiles, base_period)
+    if key in _memory_cache:
+        _memory_cache.move_to_end(key)
+        return _memory_cache[key]
+
+    cache_path = Path(cache_dir) / f"thresholds_{key}.nc" if cache_dir else None
+    if cache_path is not None and cache_path.exists():
+        thr = xr.open_dataarray(cache_path).load()
+        print(f"Percentile thresholds loaded from cache: {cache_path.name}")
+    else:
+        thr = compute_thresholds(pr, quantiles, base_period).load()
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp')
+            thr.to_netcdf(tmp_path)
+            os.replace(tmp_path, cache_path)
+            print(f"Percentile thresholds cached at: {cache_path}")
+
+    thr = thr.assign_coords(lat=pr['lat'], lon=pr['lon'])
+    _memory_cache[key] = thr
+    while len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+    return thr
@@ -0,0 +1,74 @@
+import xarray as xr
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Iterator, Literal, Optional, Sequence, Tuple
+from preprocess import combine_preprocess, spatial_subset
+from indices import climate_index
+from incremental import freeze_thresholds, needs_thresholds
+from thresholds import PR_QUANTILES, get_thresholds
+from writers import init_zarr_store, save_indices_to_netcdf, write_zarr_region
+from instrumentation import span
+
+# Input variables plus the temporaries the fused kernels hold per tile
+_WORKING_COPIES = 12
+
+def working_bytes(n_cells: int, n_time: int, n_vars: int = 4) -> int:
+    return n_cells * n_time * 8 * (n_vars + _WORKING_COPIES)
+
+def tile_size_for_budget(n_time: int, memory_budget_mb: float, n_vars: int = 4) -> int:
+    return max(1, int(math.sqrt(memory_budget_mb * 1024**2 / working_bytes(1, n_time, n_vars))))
+
+def iter_tiles(ds: xr.Dataset, tile_size: int) -> Iterator[Tuple[slice, slice]]:
+    n_lat, n_lon = ds.sizes['lat'], ds.sizes['lon']
+    for i in range(0, n_lat, tile_size):
+        for j in range(0, n_lon, tile_size):
+            yield slice(i, min(i + tile_size, n_lat)), slice(j, min(j + tile_size, n_lon))
+
+def run_tiled(ds: xr.Dataset, lat_range: Tuple[float, float], lon_range: Tuple[float, float], output_filename: str, output_dir: str,
+              memory_budget_mb: float, nan_method: Literal['keep'] = 'keep', base_period: Optional[Tuple[int, int]] = None,
+              cache_dir: Optional[str] = None, indices: Optional[Sequence[str]] = None) -> str:
+    region = spatial_subset(ds, lat_range, lon_range)
+    tile_size = tile_size_for_budget(region.sizes['time'], memory_budget_mb, len(region.data_vars))
+    n_tiles = math.ceil(region.sizes['lat'] / tile_size) * math.ceil(region.sizes['lon'] / tile_size)
+    print(f"Streaming {n_tiles} tiles of {tile_size}x{tile_size} cells (budget {memory_budget_mb} MB)")
+
+    output_path = Path(output_dir) / output_filename
+    zarr_output = output_path.suffix == '.zarr'
+    tile_dir = Path(output_dir) / f"{output_path.stem}_tiles"
+    os.makedirs(tile_dir, exist_ok=True)
+    # Thresholds of a fixed base period are frozen next to the output, so later --incremental runs can extend it
+    freeze = base_period is not None and needs_thresholds(indices)
+    tile_thresholds = []
+
+    for k, (lat_slice, lon_slice) in enumerate(iter_tiles(region, tile_size)):
+        with span('tile', tile=k):
+            tile = region.isel(lat=lat_slice, lon=lon_slice).load()
+            processed = combine_preprocess(tile, lat_range, lon_range, nan_method, verbose=False)
+            pr_thresholds = get_thresholds(processed['pr'], PR_QUANTILES, base_period, cache_dir) if freeze else None
+            tile_indices = climate_index(processed, indices, base_period=base_period, cache_dir=cache_dir,
+                                         pr_thresholds=pr_thresholds, verbose=False).compute()
+            if freeze:
+                tile_thresholds.append(pr_thresholds)
+            if zarr_output:
+                # Every tile is written straight into its region of one store
+                if k == 0:
+                    template = tile_indices.chunk().reindex(lat=region['lat'], lon=region['lon'])
+                    init_zarr_store(template, str(output_path), {'time': 1, 'lat': tile_size, 'lon': tile_size})
+                write_zarr_region(tile_indices, str(output_path), {'lat': lat_slice, 'lon': lon_slice})
+            else:
+                tile_indices.to_netcdf(tile_dir / f"tile_{k:05d}.nc")
+            print(f"Tile {k + 1}/{n_tiles} completed.")
+
+    if freeze:
+        freeze_thresholds(xr.combine_by_coords(tile_thresholds), output_path)
+    if zarr_output:
+        shutil.rmtree(tile_dir)
+        print(f"\n Save {len(tile_indices.data_vars)} success indicators at: {output_path.resolve()}")
+        return str(output_path.resolve())
+
+    with span('merge_tiles'), xr.open_mfdataset(sorted(tile_dir.glob('tile_*.nc')), combine='by_coords') as merged:
+        saved_path = save_indices_to_netcdf(merged, output_filename, output_dir)
+    shutil.rmtree(tile_dir)
+    return saved_path
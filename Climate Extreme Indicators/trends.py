@@ -0,0 +1,163 @@
+import argparse
+import os
+import sys
+import warnings
+import numpy as np
+import xarray as xr
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+COMMON_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(1, COMMON_DIR) # modules shared by all three folders
+from time_segments import calendar_fields
+from writers import save_indices
+from execution import execution_backend
+
+STATISTICS = ['sen_slope', 'mk_z', 'mk_p', 'ols_slope', 'ols_stderr', 'n_years']
+STATISTIC_INFO: Dict[str, Dict[str, str]] = {
+    "sen_slope": {"long_name": "Sen's slope (median of pairwise slopes)"},
+    "mk_z": {"long_name": "Mann-Kendall Z statistic (tie-corrected)", "units": "1"},
+    "mk_p": {"long_name": "Two-sided Mann-Kendall p-value", "units": "1"},
+    "ols_slope": {"long_name": "Least-squares linear trend"},
+    "ols_stderr": {"long_name": "Standard error of the least-squares trend"},
+    "n_years": {"long_name": "Years with data", "units": "count"},
+}
+PER_DECADE = {'sen_slope', 'ols_slope', 'ols_stderr'} # slopes are saved in index units per decade
+MIN_YEARS = 10 # cells with fewer valid years get NaN statistics
+PAIR_BUDGET_MB = 256.0 # memory for the pairwise differences of one chunk
+
+def _erfc(x: np.ndarray) -> np.ndarray:
+    # Complementary error function for x >= 0 (Numerical Recipes erfcc, relative error < 1.2e-7)
+    t = 1.0 / (1.0 + 0.5 * x)
+    poly = (-1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (-0.18628806 + t * (0.27886807
+            + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277)))))))))
+    return t * np.exp(-x * x + poly)
+
+def _trend_kernel(x: np.ndarray, years: np.ndarray, min_years: int) -> np.ndarray:
+    # All statistics for every series along the last axis at once; NaN years drop out of every pair they are part of
+    x = x.astype(np.float64)
+    valid = ~np.isnan(x)
+    n = valid.sum(axis=-1)
+    first, second = np.triu_indices(x.shape[-1], k=1)
+    dx = x[..., second] - x[..., first]
+    dt = (years[second] - years[first]).astype(np.float64)
+
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        sen = np.nanmedian(dx / dt, axis=-1)
+
+        # Mann-Kendall S with the tie correction: each value in a tie group of size t adds (t - 1)(2t + 5)
+        s = np.nansum(np.sign(dx), axis=-1)
+        ties = (x[..., :, None] == x[..., None, :]).sum(axis=-1)
+        tie_term = np.where(valid, (ties - 1) * (2 * ties + 5), 0).sum(axis=-1)
+        variance = (n * (n - 1) * (2 * n + 5) - tie_term) / 18.0
+        z = np.where(variance > 0, (s - np.sign(s)) / np.sqrt(variance), 0.0)
+        p = _erfc(np.abs(z) / np.sqrt(2.0))
+
+        t = np.where(valid, years.astype(np.float64), np.nan)
+        t_anomaly = t - np.nanmean(t, axis=-1, keepdims=True)
+        x_anomaly = x - np.nanmean(x, axis=-1, keepdims=True)
+        sxx = np.nansum(t_anomaly ** 2, axis=-1)
+        slope = np.nansum(t_anomaly * x_anomaly, axis=-1) / sxx
+        residual = np.nansum((x_anomaly - slope[..., None] * t_anomaly) ** 2, axis=-1) / (n - 2)
+        stderr = np.sqrt(residual / sxx)
+
+    out = np.stack([sen, z, p, slope, stderr, n.astype(np.float64)], axis=-1)
+    out[..., :-1] = np.where((n >= max(min_years, 3))[..., None], out[..., :-1], np.nan)
+    return out
+
+def _cells_per_chunk(n_years: int, budget_mb: float) -> int:
+    n_pairs = max(n_years * (n_years - 1) // 2, 1)
+    # dx, slopes, signs and the (n, n) tie table are the largest temporaries per cell
+    return max(int(budget_mb * 1e6 / (8 * (3 * n_pairs + n_years * n_years))), 1)
+
+def _series_trends(da: xr.DataArray, years: np.ndarray, min_years: int, budget_mb: float) -> xr.DataArray:
+    if da.chunks is not None:
+        spatial = [dim for dim in da.dims if dim != 'time']
+        chunks: Dict[str, int] = {'time': -1}
+        if spatial:
+            inner = int(np.prod([da.sizes[dim] for dim in spatial[1:]]))
+            chunks.update({dim: -1 for dim in spatial[1:]})
+            chunks[spatial[0]] = max(_cells_per_chunk(len(years), budget_mb) // max(inner, 1), 1)
+        da = da.chunk(chunks)
+    return xr.apply_ufunc(
+        _trend_kernel, da,
+        kwargs={'years': years, 'min_years': min_years},
+        input_core_dims=[['time']],
+        output_core_dims=[['statistic']],
+        dask='parallelized',
+        output_dtypes=[np.float64],
+        dask_gufunc_kwargs={'output_sizes': {'statistic': len(STATISTICS)}},
+    )
+
+def index_trends(ds: xr.Dataset, indices: Optional[List[str]] = None, period: Optional[Tuple[int, int]] = None,
+                 min_years: int = MIN_YEARS, budget_mb: float = PAIR_BUDGET_MB) -> xr.Dataset:
+    # Trend statistics of every index and grid cell. Seasonal and monthly outputs get one trend per season or month
+    years, months = calendar_fields(ds['time'])
+    if period is not None:
+        keep = (years >= period[0]) & (years <= period[1])
+        ds, years, months = ds.isel(time=keep), years[keep], months[keep]
+    names = [name for name in (indices or list(ds.data_vars)) if name in ds.data_vars and 'time' in ds[name].dims]
+    if not names:
+        raise ValueError(f"No indices with a time dimension to compute trends for (asked for {indices}).")
+
+    sub_periods = np.unique(months) if len(np.unique(years)) < len(years) else None
+    out: Dict[str, xr.DataArray] = {}
+    for name in names:
+        da = ds[name].reset_coords(drop=True)
+        if sub_periods is None:
+            stats = _series_trends(da, years, min_years, budget_mb)
+        else:
+            stats = xr.concat([_series_trends(da.isel(time=months == month), years[months == month], min_years, budget_mb)
+                               for month in sub_periods], dim='month')
+        stats = stats.assign_coords(statistic=STATISTICS)
+
+        units = ds[name].attrs.get('units', '')
+        for statistic in STATISTICS:
+            info = dict(STATISTIC_INFO[statistic])
+            value = stats.sel(statistic=statistic, drop=True)
+            if statistic in PER_DECADE:
+                value = value * 10.0
+                info['units'] = f"{units} decade-1" if units else "decade-1"
+            info['long_name'] = f"{info['long_name']} of {name}"
+            out[f"{name}_{statistic}"] = value.assign_attrs(info)
+
+    trends = xr.Dataset(out)
+    if sub_periods is not None:
+        trends = trends.assign_coords(month=sub_periods)
+        if 'season' in ds.coords:
+            trends = trends.assign_coords(season=('month', [str(ds['season'].values[months == month][0]) for month in sub_periods]))
+    trends.attrs["title"] = f"Trends of {ds.attrs.get('title', 'climate indices')}"
+    trends.attrs["period"] = f"{int(years.min())}-{int(years.max())}"
+    print(f"Trend statistics prepared for {len(names)} indices over {trends.attrs['period']}.")
+    return trends
+
+def write_trends(input_path: str, output_path: Optional[str] = None, indices: Optional[List[str]] = None,
+                 period: Optional[Tuple[int, int]] = None, min_years: int = MIN_YEARS) -> str:
+    # Reads the saved indices lazily (NetCDF or Zarr) and writes '<stem>_trends' in the same format next to them
+    input_path = Path(input_path)
+    fmt = 'zarr' if input_path.suffix == '.zarr' else 'netcdf'
+    output_path = Path(output_path) if output_path else input_path.with_name(f"{input_path.stem}_trends{input_path.suffix}")
+    with xr.open_dataset(input_path, engine='zarr' if fmt == 'zarr' else None, chunks={}) as ds:
+        trends = index_trends(ds, indices, period, min_years)
+        return save_indices(trends, output_path.name, str(output_path.parent), fmt)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Sen's slope, Mann-Kendall and least-squares trends of saved climate indices.")
+    parser.add_argument('input', help="indices file written by main.py (.nc or .zarr)")
+    parser.add_argument('--output', default=None, help="default: '<input stem>_trends' next to the input")
+    parser.add_argument('--indices', nargs='+', default=None, metavar='INDEX', help="default: every index in the file")
+    parser.add_argument('--period', nargs=2, type=int, default=None, metavar=('START', 'END'))
+    parser.add_argument('--min-years', type=int, default=MIN_YEARS)
+    parser.add_argument('--scheduler', choices=['threads', 'processes', 'distributed'], default='threads')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="distributed scheduler only")
+    parser.add_argument('--memory-limit', default=None, help="per worker, e.g. '4GB' (distributed scheduler only)")
+    args = parser.parse_args(argv)
+
+    with execution_backend(args.scheduler, args.workers, args.memory_limit, args.threads_per_worker):
+        write_trends(args.input, args.output, args.indices, tuple(args.period) if args.period else None, args.min_years)
+    print("PROGRAM COMPLETED SUCCESSFULLY!")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import xarray as xr
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from engine import NUMBA_AVAILABLE, heat_block, humidity_inputs
+from spells import longest_run
+from instrumentation import timed
+from time_segments import Frequency, calendar_fields, time_segments
+
+RISK_THRESHOLDS: Tuple[float, float, float] = (26.0, 28.0, 32.0) # WBGT °C: moderate, high, extreme
+
+AGGREGATE_INFO: Dict[str, Dict[str, str]] = {
+    "WBGT_max": {"long_name": "Maximum Wet-Bulb Globe Temperature", "units": "°C"},
+    "Tw_max": {"long_name": "Maximum Wet-bulb Temperature", "units": "°C"},
+    "HI_max": {"long_name": "Maximum Heat Index", "units": "°C"},
+    "WBGT_days_low": {"long_name": "Days with low heat risk (WBGT < 26°C)", "units": "days"},
+    "WBGT_days_moderate": {"long_name": "Days with moderate heat risk (26°C ≤ WBGT < 28°C)", "units": "days"},
+    "WBGT_days_high": {"long_name": "Days with high heat risk (28°C ≤ WBGT < 32°C)", "units": "days"},
+    "WBGT_days_extreme": {"long_name": "Days with extreme heat risk (WBGT ≥ 32°C)", "units": "days"},
+    "WBGT_max_run": {"long_name": "Longest run of days with WBGT ≥ run threshold", "units": "days"},
+}
+AGGREGATES: List[str] = list(AGGREGATE_INFO)
+PERIOD_NAMES: Dict[str, str] = {'annual': 'Annual', 'seasonal': 'Seasonal', 'monthly': 'Monthly'}
+
+def _reduce_block(tw: np.ndarray, wbgt: np.ndarray, hi: np.ndarray, starts: np.ndarray = None,
+                  run_threshold: float = 26.0) -> np.ndarray:
+    moderate, high, extreme = RISK_THRESHOLDS
+    observed = np.add.reduceat(~np.isnan(wbgt), starts, axis=-1) > 0
+
+    def days(mask: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(mask, starts, axis=-1, dtype=np.float64)
+
+    with np.errstate(invalid='ignore'):
+        reducers = {
+            "WBGT_max": lambda: np.fmax.reduceat(wbgt, starts, axis=-1),
+            "Tw_max": lambda: np.fmax.reduceat(tw, starts, axis=-1),
+            "HI_max": lambda: np.fmax.reduceat(hi, starts, axis=-1),
+            "WBGT_days_low": lambda: days(wbgt < moderate),
+            "WBGT_days_moderate": lambda: days((wbgt >= moderate) & (wbgt < high)),
+            "WBGT_days_high": lambda: days((wbgt >= high) & (wbgt < extreme)),
+            "WBGT_days_extreme": lambda: days(wbgt >= extreme),
+            "WBGT_max_run": lambda: longest_run(wbgt >= run_threshold, starts),
+        }
+        products = [timed(f"index:{name}", reducers[name]) for name in AGGREGATES]
+    return np.where(observed[..., None, :], np.stack(products, axis=-2), np.nan)
+
+def _aggregate_kernel(t: np.ndarray, a: np.ndarray, b: Optional[np.ndarray] = None, starts: np.ndarray = None,
+                      source: str = 'rh', scale: float = 1.0, use_numba: bool = True, run_threshold: float = 26.0) -> np.ndarray:
+    # Daily fields only exist for the block being reduced
+    tw, wbgt, hi = heat_block(t, a, b, source, scale, use_numba)
+    return _reduce_block(tw, wbgt, hi, starts, run_threshold)
+
+def input_masks(ds: xr.Dataset) -> List[xr.DataArray]:
+    # Every product uses temperature and humidity; a constant humidity has no mask
+    humidity, _, _ = humidity_inputs(ds)
+    return [ds[f"valid_mask_{da.name}"].reset_coords(drop=True) for da in [ds['tas']] + humidity if f"valid_mask_{da.name}" in ds.coords]
+
+def _aggregate(kernel, arrays: List[xr.DataArray], kwargs: Dict, masks: Sequence[xr.DataArray], freq: Frequency,
+               run_threshold: float) -> xr.Dataset:
+    time = arrays[0]['time']
+    starts, labels = time_segments(time, freq)
+    arrays = [da.chunk({'time': -1}) if da.chunks is not None and 'time' in da.dims else da for da in arrays]
+
+    stacked = xr.apply_ufunc(
+        kernel, *arrays,
+        kwargs={**kwargs, 'starts': starts, 'run_threshold': run_threshold},
+        input_core_dims=[['time'] if 'time' in da.dims else [] for da in arrays],
+        output_core_dims=[['index', 'time']],
+        exclude_dims={'time'},
+        dask='parallelized',
+        output_dtypes=[np.float64],
+        dask_gufunc_kwargs={'output_sizes': {'index': len(AGGREGATES), 'time': len(starts)}},
+    )
+    stacked = stacked.assign_coords(time=labels.values)
+
+    result = xr.Dataset({name: stacked.isel(index=i, drop=True).transpose('time', ...) for i, name in enumerate(AGGREGATES)})
+    for mask in masks:
+        result = result.where(mask)
+    result = result.drop_vars([name for name in result.coords if name.startswith('valid_mask')])
+    if freq == 'seasonal':
+        result = result.assign_coords(season=('time', labels.dt.season.values))
+    for name in AGGREGATES:
+        result[name].attrs = dict(AGGREGATE_INFO[name])
+    result['WBGT_max_run'].attrs['threshold'] = f"{run_threshold}°C"
+    years = calendar_fields(time)[0]
+    result.attrs.update(title=f"{PERIOD_NAMES[freq]} Heat-Stress Metrics", frequency=freq,
+                        period=f"{int(years.min())}-{int(years.max())}")
+
+    print(f"Heat-stress {freq} aggregation completed.")
+    return result
+
+def aggregate_heat_stress(ds: xr.Dataset, freq: Frequency = 'annual', run_threshold: float = RISK_THRESHOLDS[0],
+                          use_numba: Optional[bool] = None) -> xr.Dataset:
+    humidity, source, scale = humidity_inputs(ds)
+    kwargs = {'source': source, 'scale': scale, 'use_numba': NUMBA_AVAILABLE if use_numba is None else use_numba}
+    return _aggregate(_aggregate_kernel, [ds['tas']] + humidity, kwargs, input_masks(ds), freq, run_threshold)
+
+def aggregate_daily(daily: xr.Dataset, freq: Frequency = 'annual', run_threshold: float = RISK_THRESHOLDS[0],
+                    masks: Sequence[xr.DataArray] = ()) -> xr.Dataset:
+    # Same products from Tw/WBGT/HI that were already computed (e.g. the --keep-daily file), without rerunning the kernel
+    return _aggregate(_reduce_block, [daily['Tw'], daily['WBGT'], daily['HI']], {}, masks, freq, run_threshold)
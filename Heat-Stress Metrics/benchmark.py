@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import tempfile
+from typing import Callable, Dict, List, Optional
+COMMON_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(1, COMMON_DIR) # modules shared by all three folders
+from benchmarking import REGRESSION_TOLERANCE, STUDY_LAT, STUDY_LON, compare, measure, previous_results, store_results, synthetic_cube, write_synthetic_files
+from input import DEFAULT_CHUNKS, load_and_process_tas
+from preprocess import combine_preprocess
+from indices import calculate_indices, calculate_indices_reference
+from aggregation import aggregate_heat_stress
+from engine import HEAT_INDICES
+from writers import save_indices_to_netcdf
+from execution import execution_backend
+
+# Synthetic daily tas/hurs cubes; nothing is read from Google Drive
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results.jsonl')
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the heat-stress pipeline on synthetic CMIP-like data.")
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--lat', type=int, default=40, help="grid cells along latitude")
+    parser.add_argument('--lon', type=int, default=40, help="grid cells along longitude")
+    parser.add_argument('--calendar', default='standard', help="e.g. 'noleap' or '360_day' for cftime time axes")
+    parser.add_argument('--stages', nargs='+', default=None, help="only run stages whose name contains one of these")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="skip the traced peak-memory run")
+    parser.add_argument('--data-dir', default=None, help="keep the synthetic NetCDF files here (default: a temporary folder)")
+    parser.add_argument('--results', default=RESULTS_PATH)
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--scheduler', choices=['threads', 'processes', 'distributed'], default='threads')
+    parser.add_argument('--workers', type=int, default=None)
+    return parser.parse_args(argv)
+
+def build_stages(data_dir: str, output_dir: str, years: int, n_lat: int, n_lon: int, calendar: str) -> Dict[str, Callable[[], object]]:
+    raw = synthetic_cube(years, n_lat, n_lon, calendar=calendar, humidity=True)[['tas', 'hurs']]
+    write_synthetic_files(raw, data_dir)
+    raw = raw.chunk(DEFAULT_CHUNKS)
+    # Metric stages start from the cleaned cube already in memory, so they time the heat-stress engine only
+    processed = combine_preprocess(raw.copy(), STUDY_LAT, STUDY_LON, verbose=False).persist()
+    reference_input = processed.rename({'hurs': 'rh'})
+    computed = aggregate_heat_stress(processed).compute()
+
+    return {
+        "load": lambda: load_and_process_tas(lat_range=STUDY_LAT, lon_range=STUDY_LON, data_dir=data_dir),
+        "combine_preprocess": lambda: combine_preprocess(raw.copy(), STUDY_LAT, STUDY_LON, verbose=False),
+        "calculate_indices": lambda: calculate_indices(processed.copy())[HEAT_INDICES],
+        "calculate_indices_reference": lambda: calculate_indices_reference(reference_input.copy())[['Tw', 'WBGT']],
+        "aggregate_annual": lambda: aggregate_heat_stress(processed, 'annual'),
+        "aggregate_seasonal": lambda: aggregate_heat_stress(processed, 'seasonal'),
+        "save_netcdf": lambda: save_indices_to_netcdf(computed, 'benchmark_heatstress.nc', output_dir),
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    config = {"suite": "heat-stress", "years": args.years, "lat": args.lat, "lon": args.lon, "calendar": args.calendar,
+              "scheduler": args.scheduler, "workers": args.workers}
+
+    with tempfile.TemporaryDirectory() as scratch, execution_backend(args.scheduler, args.workers):
+        print(f"Generating a {args.years}-year {args.lat}x{args.lon} synthetic cube ({args.calendar} calendar)...")
+        stages = build_stages(args.data_dir or os.path.join(scratch, 'data'), scratch, args.years, args.lat, args.lon, args.calendar)
+        results: Dict[str, Dict[str, float]] = {}
+        for name, stage in stages.items():
+            if args.stages and not any(part in name for part in args.stages):
+                continue
+            print(f"Timing {name}...")
+            results[name] = measure(stage, args.repeat, args.memory)
+
+    previous = previous_results(args.results, config)
+    store_results(args.results, config, results)
+    regressions = compare(results, previous, args.tolerance)
+    print(f"Benchmark results appended to: {args.results}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
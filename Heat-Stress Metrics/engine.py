@@ -0,0 +1,113 @@
+import xarray as xr
+import numpy as np
+from typing import List, Literal, Optional, Tuple
+from instrumentation import timed
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+HEAT_INDICES: List[str] = ["Tw", "WBGT", "HI"]
+STANDARD_PRESSURE_HPA = 1013.25
+
+HumiditySource = Literal['rh', 'q']
+
+def _pressure_scale(units: str) -> float:
+    return 1.0 if units.strip().lower() in ('hpa', 'mbar', 'mb') else 0.01
+
+def humidity_inputs(ds: xr.Dataset) -> Tuple[List[xr.DataArray], HumiditySource, float]:
+    # Relative humidity is used directly when available, otherwise derived from specific humidity and pressure
+    for name in ('hurs', 'rh'):
+        if name in ds.data_vars:
+            rh = ds[name]
+            units = rh.attrs.get('units', '%' if rh.ndim else '1').strip()
+            return [rh], 'rh', 100.0 if units in ('1', 'fraction', '0-1') else 1.0
+    for name in ('huss', 'hus'):
+        if name in ds.data_vars:
+            pressure = next((ds[p] for p in ('ps', 'psl') if p in ds.data_vars), None)
+            if pressure is None:
+                return [ds[name]], 'q', 1.0
+            return [ds[name], pressure], 'q', _pressure_scale(pressure.attrs.get('units', 'Pa'))
+    raise ValueError("Heat-stress metrics need 'hurs', 'huss'/'hus' or a constant 'rh' in the dataset.")
+
+def _saturation_vapour_pressure(t: np.ndarray) -> np.ndarray:
+    return 6.112 * np.exp(17.67 * t / (t + 243.5))
+
+def _relative_humidity(t: np.ndarray, a: np.ndarray, b: Optional[np.ndarray], source: HumiditySource, scale: float) -> np.ndarray:
+    if source == 'rh':
+        return a * scale
+    p = b * scale if b is not None else STANDARD_PRESSURE_HPA
+    e = a * p / (0.622 + 0.378 * a)
+    return np.clip(100.0 * e / _saturation_vapour_pressure(t), 0.0, 100.0)
+
+def _heat_numpy(t: np.ndarray, rh: np.ndarray, tw: np.ndarray, wbgt: np.ndarray, hi: np.ndarray) -> None:
+    # Stull (2011) wet-bulb temperature
+    np.multiply(t, np.arctan(0.151977 * np.sqrt(rh + 8.313659)), out=tw)
+    tw += np.arctan(t + rh) - np.arctan(rh - 1.676331) + 0.00391838 * rh * np.sqrt(rh) * np.arctan(0.023101 * rh) - 4.686035
+
+    # Simplified WBGT (ACSM) from vapour pressure in hPa
+    np.multiply(rh / 100.0 * _saturation_vapour_pressure(t), 0.393, out=wbgt)
+    wbgt += 0.567 * t + 3.94
+
+    # NWS heat index (Rothfusz regression with Steadman below 80 °F)
+    f = t * 1.8 + 32.0
+    simple = 0.5 * (f + 61.0 + (f - 68.0) * 1.2 + rh * 0.094)
+    full = (-42.379 + 2.04901523 * f + 10.14333127 * rh - 0.22475541 * f * rh - 0.00683783 * f * f - 0.05481717 * rh * rh
+            + 0.00122874 * f * f * rh + 0.00085282 * f * rh * rh - 0.00000199 * f * f * rh * rh)
+    with np.errstate(invalid='ignore'):
+        dry = (rh < 13.0) & (f >= 80.0) & (f <= 112.0)
+        full -= np.where(dry, (13.0 - rh) / 4.0 * np.sqrt(np.clip(17.0 - np.abs(f - 95.0), 0.0, None) / 17.0), 0.0)
+        humid = (rh > 85.0) & (f >= 80.0) & (f <= 87.0)
+        full += np.where(humid, (rh - 85.0) / 10.0 * (87.0 - f) / 5.0, 0.0)
+        np.copyto(hi, np.where((simple + f) / 2.0 >= 80.0, full, simple))
+    hi -= 32.0
+    hi /= 1.8
+
+if numba is not None:
+    # Serial per block: dask already runs blocks in parallel, a nested numba thread pool would oversubscribe.
+    # No 'nnan'/'ninf' fast-math flags so missing cells still propagate as NaN
+    @numba.njit(cache=True, fastmath={'afn', 'contract', 'arcp'})
+    def _heat_numba(t, rh, tw, wbgt, hi):
+        for i in range(t.size):
+            ti, ri = t[i], rh[i]
+            tw[i] = (ti * np.arctan(0.151977 * np.sqrt(ri + 8.313659)) + np.arctan(ti + ri) - np.arctan(ri - 1.676331)
+                     + 0.00391838 * ri * np.sqrt(ri) * np.arctan(0.023101 * ri) - 4.686035)
+            wbgt[i] = 0.567 * ti + 0.393 * (ri / 100.0 * 6.112 * np.exp(17.67 * ti / (ti + 243.5))) + 3.94
+
+            f = ti * 1.8 + 32.0
+            value = 0.5 * (f + 61.0 + (f - 68.0) * 1.2 + ri * 0.094)
+            if (value + f) / 2.0 >= 80.0:
+                value = (-42.379 + 2.04901523 * f + 10.14333127 * ri - 0.22475541 * f * ri - 0.00683783 * f * f
+                         - 0.05481717 * ri * ri + 0.00122874 * f * f * ri + 0.00085282 * f * ri * ri - 0.00000199 * f * f * ri * ri)
+                if ri < 13.0 and 80.0 <= f <= 112.0:
+                    value -= (13.0 - ri) / 4.0 * np.sqrt(max(17.0 - abs(f - 95.0), 0.0) / 17.0)
+                elif ri > 85.0 and 80.0 <= f <= 87.0:
+                    value += (ri - 85.0) / 10.0 * (87.0 - f) / 5.0
+            hi[i] = (value - 32.0) / 1.8
+
+def heat_block(t: np.ndarray, a: np.ndarray, b: Optional[np.ndarray] = None, source: HumiditySource = 'rh', scale: float = 1.0,
+                use_numba: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rh = _relative_humidity(t, a, b, source, scale)
+    t, rh = np.broadcast_arrays(t, rh)
+    dtype = np.result_type(t.dtype, np.float32)
+    tw, wbgt, hi = (np.empty(t.shape, dtype=dtype) for _ in range(3))
+    if use_numba and NUMBA_AVAILABLE:
+        timed("heat_metrics", lambda: _heat_numba(np.ascontiguousarray(t).ravel(), np.ascontiguousarray(rh, dtype=dtype).ravel(),
+                                                  tw.ravel(), wbgt.ravel(), hi.ravel()))
+    else:
+        timed("heat_metrics", lambda: _heat_numpy(t, rh, tw, wbgt, hi))
+    return tw, wbgt, hi
+
+def fused_heat_index(ds: xr.Dataset, use_numba: Optional[bool] = None) -> Tuple[xr.DataArray, xr.DataArray, xr.DataArray]:
+    humidity, source, scale = humidity_inputs(ds)
+    tas = ds['tas']
+    # Elementwise, so dask blocks are processed as they are without rechunking
+    return xr.apply_ufunc(
+        heat_block, tas, *humidity,
+        kwargs={'source': source, 'scale': scale, 'use_numba': NUMBA_AVAILABLE if use_numba is None else use_numba},
+        output_core_dims=[[], [], []],
+        dask='parallelized',
+        output_dtypes=[np.result_type(tas.dtype, np.float32)] * 3,
+    )
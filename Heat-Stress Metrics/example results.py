@@ -7,6 +7,8 @@ import matplotlib.colors as mcolors
 import warnings
 
 file_path = '/content/drive/MyDrive/Group Project 2025/results/calculated_heatstress.nc'
+preview_path = file_path.replace('.nc', '_preview.nc') # written next to the result by main.py
+PREVIEW_LEVEL = 0 # 1, 2, 3 draw the map from coarser grids for large domains
 fh = Dataset(file_path, 'r')
 
 print(fh.file_format)
@@ -19,29 +21,29 @@ for attr in fh.ncattrs():
 
 warnings.filterwarnings("ignore", message="All-NaN slice encountered")
 
-def plot_existing_wbgt_analysis(file_path: str):
-    ds = xr.open_dataset(file_path)
+def plot_existing_wbgt_analysis(preview_path: str, preview_level: int = 0):
+    clim = xr.open_dataset(preview_path, group=f'level_{preview_level}')
+    summary = xr.open_dataset(preview_path)
 
-    if 'WBGT' not in ds.variables:
-        print("Error: 'WBGT' variable not found in the file. Please check the variable name.")
+    if 'WBGT_days_low_climatology' not in clim.variables:
+        print("Error: risk-category variables not found in the preview. Please run main.py to create the aggregated output.")
         return
 
-    lon = ds.lon.values
-    lat = ds.lat.values
-    years = ds.time.dt.year.values
+    lon = clim.lon.values
+    lat = clim.lat.values
+    years = summary.time.dt.year.values
 
-    wbgt_data = ds['WBGT']
-    risk_level = xr.where(wbgt_data < 26, 1,
-                 xr.where(wbgt_data < 28, 2,
-                 xr.where(wbgt_data < 32, 3, 4)))
-
-    risk_level = risk_level.where(~np.isnan(wbgt_data))
+    categories = ['WBGT_days_low', 'WBGT_days_moderate', 'WBGT_days_high', 'WBGT_days_extreme']
+    levels = xr.DataArray([1, 2, 3, 4], dims='level')
 
     fig = plt.figure(figsize=(15, 8))
 
     # --- SUBPLOT 1: HEAT RISK MAP ---
     ax1 = fig.add_subplot(1, 2, 1)
-    risk_map_data = risk_level.mean(dim='time')
+    # Mean daily risk level, weighted by the number of days spent in each category
+    days = xr.concat([clim[f"{name}_climatology"] for name in categories], dim='level')
+    total_days = days.sum(dim='level')
+    risk_map_data = (days * levels).sum(dim='level') / total_days.where(total_days > 0)
 
     colors = ['#28a745', '#ffc107', '#fd7e14', '#dc3545']
     cmap = mcolors.ListedColormap(colors)
@@ -64,32 +66,30 @@ def plot_existing_wbgt_analysis(file_path: str):
     ax1.set_xlim(102, 109.5)
     ax1.set_ylim(8, 23.5)
 
-    # --- SUBPLOT 2: WBGT FREQUENCY DISTRIBUTION (HISTOGRAM) ---
+    # --- SUBPLOT 2: DAYS PER RISK CATEGORY OVER SELECTED YEARS ---
     ax2 = fig.add_subplot(1, 2, 2)
 
     unique_years = np.unique(years)
     years_to_show = [unique_years[0], unique_years[len(unique_years)//2], unique_years[-1]]
     plot_colors = ['#1f77b4', '#2ca02c', '#d62728']
-
-    for year, color in zip(years_to_show, plot_colors):
-        data_year = ds['WBGT'].sel(time=str(year)).values.flatten()
-        data_clean = data_year[~np.isnan(data_year)]
-
-        if len(data_clean) > 0:
-            ax2.hist(data_clean, bins=50, alpha=0.4, label=f'Year {year}', color=color, density=True)
-            ax2.axvline(np.mean(data_clean), color=color, linestyle='--', linewidth=1.5)
-
-    ax2.axvline(26, color='gray', linestyle=':', label='Risk Threshold (26°C)')
-    ax2.axvline(32, color='darkred', linestyle='-', label='Extreme Threshold (32°C)')
-
-    ax2.set_title('(b) WBGT Frequency Distribution over Selected Years', fontsize=14, fontweight='bold')
-    ax2.set_xlabel('WBGT Temperature (°C)')
-    ax2.set_ylabel('Probability Density (PDF)')
+    labels = ['Low (<26)', 'Moderate (26-28)', 'High (28-32)', 'Extreme (>32)']
+    width = 0.25
+
+    for k, (year, color) in enumerate(zip(years_to_show, plot_colors)):
+        days_year = [float(summary[f"{name}_area_mean"].sel(time=str(year)).sum()) for name in categories]
+        ax2.bar(np.arange(4) + (k - 1) * width, days_year, width=width, alpha=0.7, label=f'Year {year}', color=color)
+
+    ax2.set_xticks(np.arange(4))
+    ax2.set_xticklabels(labels)
+    ax2.set_title('(b) Days per WBGT Risk Category over Selected Years', fontsize=14, fontweight='bold')
+    ax2.set_xlabel('WBGT Risk Category (°C)')
+    ax2.set_ylabel('Mean Number of Days per Grid Cell')
     ax2.legend()
     ax2.grid(axis='y', alpha=0.3)
 
     plt.tight_layout()
     plt.show()
-    ds.close()
+    clim.close()
+    summary.close()
 
-plot_existing_wbgt_analysis(file_path)
+plot_existing_wbgt_analysis(preview_path, PREVIEW_LEVEL)
@@ -1,16 +1,18 @@
 import xarray as xr
 import numpy as np
 import warnings
-from typing import Dict
+from typing import Dict, Optional
+from engine import fused_heat_index
 
 warnings.filterwarnings("ignore", message="All-NaN slice encountered")
 
 INDEX_INFO: Dict[str, Dict[str, str]] = {
     "Tw": {"long_name": "Wet-bulb Temperature", "units": "°C"},
     "WBGT": {"long_name": "Wet-Bulb Globe Temperature", "units": "°C"},
+    "HI": {"long_name": "Heat Index", "units": "°C"},
 }
 
-def calculate_indices(ds: xr.Dataset) -> xr.Dataset:
+def calculate_indices_reference(ds: xr.Dataset) -> xr.Dataset:
 
     TAS = ds['tas']
     RH = ds['rh'] * 100 if ds['rh'].max() <= 1.0 else ds['rh']
@@ -31,3 +33,11 @@ def calculate_indices(ds: xr.Dataset) -> xr.Dataset:
     ds['WBGT'].attrs = INDEX_INFO["WBGT"]
 
     return ds
+
+def calculate_indices(ds: xr.Dataset, use_numba: Optional[bool] = None) -> xr.Dataset:
+    tw, wbgt, hi = fused_heat_index(ds, use_numba)
+    for name, da in zip(("Tw", "WBGT", "HI"), (tw, wbgt, hi)):
+        ds[name] = da
+        ds[name].attrs = INDEX_INFO[name]
+    print("Heat-stress metrics calculation completed.")
+    return ds
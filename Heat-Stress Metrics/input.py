@@ -1,34 +1,79 @@
-import xarray as xr
-from pathlib import Path
 import os
-import glob
+import sys
+import xarray as xr
+COMMON_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(1, COMMON_DIR) # modules shared by all three folders
+from catalog import build_catalog, open_variable, select_files
+from preprocess import spatial_subset, time_subset
+from regrid import RegridMethod, align_to_grid
+from typing import Dict, List, Optional, Tuple, Union
+
+DEFAULT_CHUNKS: Dict[str, Union[int, str]] = {'time': -1, 'lat': 'auto', 'lon': 'auto'}
+HUMIDITY_VARIABLES: List[str] = ['hurs', 'huss', 'hus', 'ps', 'psl']
+DEFAULT_RH = 0.7
+REGRID_METHOD: RegridMethod = 'conservative' # used when humidity comes on a different grid than tas
 
 def get_drive_data_path() -> str:
     default_path = '/content/drive/MyDrive/Group Project 2025/data/'
     return default_path
 
-def load_and_process_tas():
-    base_path = get_drive_data_path()
-    nc_files = glob.glob(os.path.join(base_path, '*.nc'))
-
-    tas_ds = None
+def _open_cropped(catalog: List[Dict], name: str, chunks: Optional[Dict[str, Union[int, str]]], period: Optional[Tuple[int, int]],
+                  lat_range: Optional[Tuple[float, float]], lon_range: Optional[Tuple[float, float]]) -> Optional[xr.Dataset]:
+    entries = select_files(catalog, name, period, lat_range, lon_range)
+    if not entries:
+        return None
+    print(f"Loading variable: {name} ({len(entries)} files)")
+    ds = open_variable(entries, chunks)
+    if lat_range or lon_range:
+        ds = spatial_subset(ds, lat_range or (-90, 90), lon_range or (-180, 180), verbose=False)
+    if period:
+        ds = time_subset(ds, period, verbose=False)
+    if 'plev' in ds[name].dims:
+        # Only the level nearest the surface is needed for heat stress
+        ds = ds.isel(plev=int(ds['plev'].argmax()), drop=True)
+    return ds[[name]]
 
-    for file_path in nc_files:
-        name = Path(file_path).stem.split('_')[-1]
+def _first_available(catalog: List[Dict], names: List[str], *args) -> Optional[xr.Dataset]:
+    for name in names:
+        ds = _open_cropped(catalog, name, *args)
+        if ds is not None:
+            return ds
+    return None
 
-        if name == 'tas':
-            print(f"Loading variable: {name}")
-            tas_ds = xr.open_dataset(file_path, chunks={'time': -1})
-            break
+def _open_humidity(catalog: List[Dict], *args) -> List[xr.Dataset]:
+    # Relative humidity directly if available, otherwise specific humidity plus surface pressure
+    hurs = _open_cropped(catalog, 'hurs', *args)
+    if hurs is not None:
+        return [hurs]
+    q = _first_available(catalog, ['huss', 'hus'], *args)
+    if q is None:
+        return []
+    pressure = _first_available(catalog, ['ps', 'psl'], *args)
+    return [q] if pressure is None else [q, pressure]
 
-    if tas_ds is not None:
-        tas_ds['rh'] = 0.7
+def load_and_process_tas(chunks: Optional[Dict[str, Union[int, str]]] = DEFAULT_CHUNKS, period: Optional[Tuple[int, int]] = None,
+                         lat_range: Optional[Tuple[float, float]] = None, lon_range: Optional[Tuple[float, float]] = None,
+                         data_dir: Optional[str] = None, regrid_method: RegridMethod = REGRID_METHOD, regrid_dir: Optional[str] = None):
+    base_path = data_dir or get_drive_data_path()
+    catalog = build_catalog(base_path)
 
-        print("\nDataset processed successfully.")
-        print(f"Variables in dataset: {list(tas_ds.data_vars)}")
-        return tas_ds
-    else:
+    tas_ds = _open_cropped(catalog, 'tas', chunks, period, lat_range, lon_range)
+    if tas_ds is None:
         print("Error: Could not find file for 'tas'.")
         return None
 
-combined_data = load_and_process_tas()
+    humidity = _open_humidity(catalog, chunks, period, lat_range, lon_range)
+    if humidity:
+        # Humidity is put on the tas grid first; an inner join would otherwise drop every cell the grids do not share
+        tas_ds = xr.merge(align_to_grid([tas_ds] + humidity, regrid_method, regrid_dir), compat='override', join='inner')
+    else:
+        print(f"Warning: no humidity files ({', '.join(HUMIDITY_VARIABLES)}) found, using a constant RH of {DEFAULT_RH}.")
+        tas_ds['rh'] = DEFAULT_RH
+
+    print("\nDataset processed successfully.")
+    print(f"Variables in dataset: {list(tas_ds.data_vars)}")
+    return tas_ds
+
+if __name__ == '__main__':
+    combined_data = load_and_process_tas()
@@ -1,32 +1,177 @@
 import argparse
+import os
+import sys
+import xarray as xr
+from pathlib import Path
+COMMON_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(1, COMMON_DIR) # modules shared by all three folders
+from input import DEFAULT_CHUNKS, DEFAULT_RH, HUMIDITY_VARIABLES, REGRID_METHOD, get_drive_data_path, load_and_process_tas
 from preprocess import combine_preprocess
-from utilities import save_indices_to_netcdf
+from writers import save_indices_to_netcdf
 from indices import calculate_indices
-from typing import Literal
-
-def main():
-    OUTPUT_DIR = '/content/drive/MyDrive/Group Project 2025/results'
-    LAT_RANGE = (8.0, 24.0) # currently Vietnam
-    LON_RANGE = (102.0, 110.0)
-    NAN_METHOD: Literal['keep'] = 'keep'
-
-    initial_data = combined_data
-
-    processed_data = combine_preprocess(
-        ds=initial_data,
-        lat_range=LAT_RANGE,
-        lon_range=LON_RANGE,
-        nan_method=NAN_METHOD
-    )
-
-    annual_indices_ds = calculate_indices(processed_data)
-
-    save_indices_to_netcdf(
-        ds_indices=annual_indices_ds,
-        output_filename='calculated_heatstress.nc',
-        output_dir=OUTPUT_DIR
-    )
+from aggregation import RISK_THRESHOLDS, aggregate_daily, aggregate_heat_stress, input_masks
+from engine import HEAT_INDICES
+from execution import execution_backend
+from previews import write_previews
+from zonal import write_zonal
+from cube_cache import cached_cube, input_fingerprint
+from instrumentation import instrumented_run, path_size_mb, span
+from precision import precision_policy, precision_report
+from typing import List, Literal, Optional, Tuple
+
+OUTPUT_DIR = '/content/drive/MyDrive/Group Project 2025/results'
+OUTPUT_FILENAME = 'calculated_heatstress.nc'
+LAT_RANGE = (8.0, 24.0) # currently Vietnam
+LON_RANGE = (102.0, 110.0)
+PERIOD: Optional[Tuple[int, int]] = None # e.g. (1961, 2023); None keeps every full year in the files
+NAN_METHOD: Literal['keep'] = 'keep'
+FREQ: Literal['annual', 'seasonal'] = 'annual' # period the daily metrics are reduced over
+KEEP_DAILY = False # also write the daily Tw/WBGT/HI fields to '<output>_daily.nc'
+CUBE_CACHE_GB = 20.0 # size cap of the preprocessed-cube cache in '<output-dir>/cube_cache'; 0 disables it
+PREVIEWS = True # write '<output>_preview.nc' (coarsened levels, climatology, histograms) for fast plotting
+REGIONS: Optional[str] = None # GeoJSON of provinces/districts; writes '<output>_zonal.nc/.csv' (time, region) tables
+REGION_FIELD: Optional[str] = None # feature property holding the region name; None tries 'name', 'NAME_1', ...
+PRECISION: Literal['float32', 'float64'] = 'float32' # compute dtype of the daily fields; 'float64' reproduces the old pipeline
+PACKING = True # store °C results as int16 with scale_factor 0.01 (0.005 °C steps); day counts are always int16
+COMPRESSION: Literal['zlib', 'zstd', 'none'] = 'zlib' # 'zstd' is smaller and faster but needs netCDF-C with the zstd filter to read
+VALIDATE_PRECISION = False # rerun in float64 and write '<output>_precision.json' with the largest deviations
+REPORT = True # write '<output>_report.json' with per-stage timings, I/O, memory and dask task counts
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compute heat-stress metrics (Tw, WBGT, HI) and their annual/seasonal risk products.")
+    parser.add_argument('--data-dir', default=None, help="folder with the input .nc files (default: get_drive_data_path())")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--output-file', default=OUTPUT_FILENAME)
+    parser.add_argument('--lat-range', nargs=2, type=float, default=LAT_RANGE, metavar=('MIN', 'MAX'))
+    parser.add_argument('--lon-range', nargs=2, type=float, default=LON_RANGE, metavar=('MIN', 'MAX'))
+    parser.add_argument('--period', nargs=2, type=int, default=PERIOD, metavar=('START', 'END'))
+    parser.add_argument('--freq', choices=['annual', 'seasonal'], default=FREQ)
+    parser.add_argument('--run-threshold', type=float, default=RISK_THRESHOLDS[0], help="WBGT (°C) for the longest-run product")
+    parser.add_argument('--keep-daily', action='store_true', default=KEEP_DAILY)
+    parser.add_argument('--regrid-method', choices=['conservative', 'bilinear'], default=REGRID_METHOD,
+                        help="used when input variables come on different grids")
+    parser.add_argument('--regrid-cache-dir', default=None, help="default: <output-dir>/regrid_weights")
+    parser.add_argument('--cube-cache-dir', default=None, help="default: <output-dir>/cube_cache")
+    parser.add_argument('--cube-cache-gb', type=float, default=CUBE_CACHE_GB, help="0 disables the preprocessed-cube cache")
+    parser.add_argument('--no-previews', dest='previews', action='store_false', default=PREVIEWS)
+    parser.add_argument('--regions', default=REGIONS, help="GeoJSON (or shapefile with geopandas) of regions to average over")
+    parser.add_argument('--region-field', default=REGION_FIELD)
+    parser.add_argument('--zonal-cache-dir', default=None, help="default: <output-dir>/zonal_weights")
+    parser.add_argument('--precision', choices=['float32', 'float64'], default=PRECISION)
+    parser.add_argument('--no-packing', dest='packing', action='store_false', default=PACKING,
+                        help="store °C results as float instead of int16 with a 0.01 scale factor")
+    parser.add_argument('--compression', choices=['zlib', 'zstd', 'none'], default=COMPRESSION)
+    parser.add_argument('--validate-precision', action='store_true', default=VALIDATE_PRECISION,
+                        help="rerun in float64 and report the largest deviation of every saved variable")
+    parser.add_argument('--report', default=None, help="run report path (default: <output-dir>/<output-file stem>_report.json)")
+    parser.add_argument('--no-report', dest='write_report', action='store_false', default=REPORT)
+    parser.add_argument('--profile-stage', default=None, metavar='STAGE',
+                        help="profile one stage: load, preprocess, cube_cache, daily, aggregate, save, previews, zonal")
+    parser.add_argument('--profile', choices=['cprofile', 'dask'], default='cprofile',
+                        help="'dask' writes a dask performance report (needs --scheduler distributed)")
+    parser.add_argument('--scheduler', choices=['threads', 'processes', 'distributed'], default='threads')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="distributed scheduler only")
+    parser.add_argument('--memory-limit', default=None, help="per worker, e.g. '4GB' (distributed scheduler only)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    lat_range = tuple(args.lat_range)
+    lon_range = tuple(args.lon_range)
+    period = tuple(args.period) if args.period else None
+
+    report_path = args.report or os.path.join(args.output_dir, f"{Path(args.output_file).stem}_report.json")
+
+    with execution_backend(args.scheduler, args.workers, args.memory_limit, args.threads_per_worker), \
+         precision_policy(args.precision, args.packing, args.compression), \
+         instrumented_run(report_path if args.write_report else None, args.profile_stage, args.profile, vars(args)):
+        with span('cube_cache'):
+            processed_data = _preprocessed_cube(args, args.data_dir or get_drive_data_path(), lat_range, lon_range, period)
+
+        daily_path = None
+        if args.keep_daily:
+            with span('daily'):
+                daily_ds = calculate_indices(processed_data.copy())[HEAT_INDICES]
+                daily_ds.attrs = {'title': "Daily Heat-Stress Indices", 'frequency': 'daily'}
+                # Stored unpacked, so the products reduced from this file equal those of a run without --keep-daily
+                with precision_policy(args.precision, packing=False, compression=args.compression):
+                    daily_path = save_indices_to_netcdf(
+                        ds_indices=daily_ds,
+                        output_filename=f"{Path(args.output_file).stem}_daily.nc",
+                        output_dir=args.output_dir
+                    )
+
+        # Daily fields are reduced block by block and never written unless asked for
+        with span('aggregate'):
+            if daily_path:
+                # The kept daily fields are reduced instead of running the heat kernel a second time
+                daily_data = xr.open_dataset(daily_path, chunks=DEFAULT_CHUNKS)
+                aggregated_ds = aggregate_daily(daily_data, args.freq, args.run_threshold, input_masks(processed_data))
+            else:
+                aggregated_ds = aggregate_heat_stress(processed_data, args.freq, args.run_threshold)
+
+        # The aggregation graph is computed here, while writing
+        with span('save') as stage:
+            saved_path = save_indices_to_netcdf(
+                ds_indices=aggregated_ds,
+                output_filename=args.output_file,
+                output_dir=args.output_dir
+            )
+            stage['output_mb'] = round(path_size_mb(saved_path), 2)
+        if daily_path:
+            daily_data.close()
+        if args.validate_precision:
+            # Reference run from the raw inputs in float64, bypassing the cube cache of the float32 run
+            with span('validate_precision'):
+                with precision_policy('float64', packing=False, compression=args.compression):
+                    reference_data = _preprocessed_cube(args, args.data_dir or get_drive_data_path(), lat_range, lon_range,
+                                                        period, use_cache=False)
+                    reference = aggregate_heat_stress(reference_data, args.freq, args.run_threshold).compute()
+                precision_report(reference, saved_path)
+        if args.previews:
+            with span('previews'):
+                write_previews(saved_path)
+        if args.regions:
+            # Overlap weights are computed once per (region file, grid) and reused from the cache
+            with span('zonal'):
+                write_zonal(saved_path, args.regions, args.zonal_cache_dir or os.path.join(args.output_dir, 'zonal_weights'),
+                            args.region_field)
     print("PROGRAM COMPLETED SUCCESSFULLY!")
 
+def _preprocessed_cube(args: argparse.Namespace, data_dir: str, lat_range: Tuple[float, float], lon_range: Tuple[float, float],
+                       period: Optional[Tuple[int, int]], use_cache: bool = True) -> xr.Dataset:
+    variables = ['tas'] + HUMIDITY_VARIABLES
+
+    def preprocessed() -> xr.Dataset:
+        with span('load'):
+            initial_data = load_and_process_tas(period=period, lat_range=lat_range, lon_range=lon_range, data_dir=data_dir,
+                                                regrid_method=args.regrid_method,
+                                                regrid_dir=args.regrid_cache_dir or os.path.join(args.output_dir, 'regrid_weights'))
+        if initial_data is None:
+            raise FileNotFoundError("No 'tas' files found for the requested area and period.")
+        with span('preprocess'):
+            return combine_preprocess(
+                ds=initial_data,
+                lat_range=lat_range,
+                lon_range=lon_range,
+                nan_method=NAN_METHOD,
+                period=period
+            )
+
+    if not use_cache:
+        return preprocessed()
+    # Repeated runs over the same files, area and period start from the cleaned cube on disk
+    cache_key = {"files": input_fingerprint(data_dir, variables, period, lat_range, lon_range), "variables": variables,
+                 "lat_range": lat_range, "lon_range": lon_range, "period": period, "nan_method": NAN_METHOD,
+                 "regrid": args.regrid_method, "precision": args.precision}
+    cube = cached_cube(cache_key, preprocessed, args.cube_cache_dir or os.path.join(args.output_dir, 'cube_cache'),
+                       args.cube_cache_gb)
+    if not any(name in cube.data_vars for name in HUMIDITY_VARIABLES):
+        # The constant RH used without humidity files is not an input file, so it is not part of the cached cube
+        cube['rh'] = DEFAULT_RH
+    return cube
+
 if __name__ == '__main__':
     main()
@@ -1 +1,65 @@
-#in progress
+import xarray as xr
+import numpy as np
+from netCDF4 import Dataset
+import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+
+file_path = '/content/drive/MyDrive/Group Project 2025/results/calculated_uhi.nc'
+CITY = 'Hanoi'
+fh = Dataset(file_path, 'r')
+
+print(fh.file_format)
+print(fh.dimensions.keys())
+print(fh.dimensions['time'])
+print(fh.variables.keys())
+print(fh.Conventions)
+for attr in fh.ncattrs():
+    print(attr, '=', getattr(fh,attr))
+
+def plot_uhi_analysis(file_path: str, city: str):
+    ds = xr.open_dataset(file_path)
+
+    if 'UHI_tas' not in ds.variables:
+        print("Error: 'UHI_tas' not found. Please run main.py to create the UHI output.")
+        return
+
+    fig = plt.figure(figsize=(15, 6))
+
+    # --- SUBPLOT 1: URBAN / RURAL / BUFFER ZONES OF ONE CITY ---
+    ax1 = fig.add_subplot(1, 2, 1)
+    zone = ds['zone'].sel(city=city)
+    cmap = mcolors.ListedColormap(['#f0f0f0', '#d62728', '#2ca02c', '#ffbf00'])
+    norm = mcolors.BoundaryNorm([-0.5, 0.5, 1.5, 2.5, 3.5], cmap.N)
+    plot = ax1.pcolormesh(ds.lon.values, ds.lat.values, zone.values, cmap=cmap, norm=norm, shading='auto')
+    cbar = fig.colorbar(plot, ax=ax1, ticks=[0, 1, 2, 3], shrink=0.7)
+    cbar.ax.set_yticklabels(['Outside', 'Urban', 'Rural', 'Buffer'])
+    ax1.plot(float(zone.city_lon), float(zone.city_lat), 'k*', markersize=12)
+
+    ax1.set_title(f'(a) UHI Zones around {city}', fontsize=14, fontweight='bold')
+    ax1.set_xlabel('Longitude (°E)')
+    ax1.set_ylabel('Latitude (°N)')
+    ax1.set_aspect('equal')
+
+    # --- SUBPLOT 2: MEAN ANNUAL CYCLE OF UHI INTENSITY PER CITY ---
+    ax2 = fig.add_subplot(1, 2, 2)
+    cycle = ds['UHI_tas'].groupby('time.month').mean(dim='time')
+    for name in ds.city.values:
+        ax2.plot(cycle.month, cycle.sel(city=name), marker='o', label=str(name))
+    for var, style in [('UHI_tasmax', '--'), ('UHI_tasmin', ':')]:
+        if var in ds:
+            ax2.plot(cycle.month, ds[var].sel(city=city).groupby('time.month').mean(dim='time'), style, color='k',
+                     label=f'{city} ({var.split("_")[1]})')
+
+    ax2.axhline(0, color='grey', linewidth=0.8)
+    ax2.set_xticks(np.arange(1, 13))
+    ax2.set_title('(b) Mean Monthly UHI Intensity (Urban − Rural)', fontsize=14, fontweight='bold')
+    ax2.set_xlabel('Month')
+    ax2.set_ylabel('ΔT (°C)')
+    ax2.legend()
+    ax2.grid(alpha=0.3)
+
+    plt.tight_layout()
+    plt.show()
+    ds.close()
+
+plot_uhi_analysis(file_path, CITY)
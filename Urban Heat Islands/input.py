@@ -1 +1,62 @@
-#in progress
+import xarray as xr
+from catalog import build_catalog, open_variable, select_files
+from preprocess import spatial_subset, time_subset
+from regrid import RegridMethod, align_to_grid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+DEFAULT_CHUNKS: Dict[str, Union[int, str]] = {'time': -1, 'lat': 'auto', 'lon': 'auto'}
+TEMPERATURE_VARIABLES: List[str] = ['tas', 'tasmax', 'tasmin']
+REGRID_METHOD: RegridMethod = 'conservative' # used when the temperature variables come on different grids
+
+def get_drive_data_path() -> str:
+    default_path = '/content/drive/MyDrive/Group Project 2025/data/'
+    return default_path
+
+def get_lulc_path() -> str:
+    # e.g. an ESA CCI land cover map (NetCDF) or an ESA WorldCover / MODIS GeoTIFF covering the study area
+    default_path = '/content/drive/MyDrive/Group Project 2025/lulc/ESACCI-LC-L4-LCCS-Map-300m-P1Y-2020-v2.1.1.nc'
+    return default_path
+
+def load_temperature(chunks: Optional[Dict[str, Union[int, str]]] = DEFAULT_CHUNKS, variables: List[str] = TEMPERATURE_VARIABLES,
+                     period: Optional[Tuple[int, int]] = None, lat_range: Optional[Tuple[float, float]] = None,
+                     lon_range: Optional[Tuple[float, float]] = None, data_dir: Optional[str] = None,
+                     regrid_method: RegridMethod = REGRID_METHOD, regrid_dir: Optional[str] = None) -> Optional[xr.Dataset]:
+    base_path = data_dir or get_drive_data_path()
+    catalog = build_catalog(base_path)
+
+    datasets = []
+    for name in variables:
+        entries = select_files(catalog, name, period, lat_range, lon_range)
+        if not entries:
+            continue
+        print(f"Loading variable: {name} ({len(entries)} files)")
+        ds = open_variable(entries, chunks)
+        if lat_range or lon_range:
+            ds = spatial_subset(ds, lat_range or (-90, 90), lon_range or (-180, 180), verbose=False)
+        if period:
+            ds = time_subset(ds, period, verbose=False)
+        datasets.append(ds[[name]])
+
+    if not datasets:
+        print(f"Error: Could not find files for any of {variables}.")
+        return None
+    merged = xr.merge(align_to_grid(datasets, regrid_method, regrid_dir), compat='override', join='inner')
+    print(f"\nDataset has been combined. Variables:{list(merged.data_vars)}")
+    return merged
+
+def open_lulc(path: str, variable: Optional[str] = None) -> xr.DataArray:
+    # Class codes on a regular lat/lon raster, read lazily so large maps are streamed in blocks
+    if Path(path).suffix.lower() in ('.tif', '.tiff'):
+        try:
+            da = xr.open_dataarray(path, engine='rasterio', chunks={})
+        except ValueError as exc:
+            raise ImportError("Reading GeoTIFF land cover needs rioxarray (pip install rioxarray).") from exc
+        da = da.isel(band=0, drop=True).rename({'y': 'lat', 'x': 'lon'})
+    else:
+        ds = xr.open_dataset(path, chunks={})
+        if variable is None:
+            # e.g. 'lccs_class' in ESA CCI maps: the first variable on the lat/lon grid
+            variable = next(name for name, da in ds.data_vars.items() if {'lat', 'lon'} <= set(da.dims))
+        da = ds[variable]
+    return da.squeeze(drop=True).drop_vars([name for name in da.coords if name not in ('lat', 'lon')], errors='ignore')
@@ -0,0 +1,136 @@
+import xarray as xr
+import numpy as np
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from input import open_lulc
+from grids import cell_edges, grid_digest
+from writers import _atomic_write
+
+# Bump when the classification changes so stale masks are not reused
+MASK_VERSION = 1
+EARTH_RADIUS_KM = 6371.0
+
+ZONE_OUTSIDE, ZONE_URBAN, ZONE_RURAL, ZONE_BUFFER = 0, 1, 2, 3
+ZONE_NAMES: Dict[int, str] = {ZONE_OUTSIDE: 'outside', ZONE_URBAN: 'urban', ZONE_RURAL: 'rural', ZONE_BUFFER: 'buffer'}
+
+LULC_SCHEMES: Dict[str, Dict[str, List[int]]] = {
+    "esa_cci": {"urban": [190], "water": [210], "nodata": [0]},
+    "worldcover": {"urban": [50], "water": [80], "nodata": [0]},
+    "modis_igbp": {"urban": [13], "water": [17], "nodata": [0, 255]},
+}
+
+def _cell_of(pixels: np.ndarray, centres: np.ndarray) -> np.ndarray:
+    # Index of the climate cell holding each pixel centre, -1 outside the grid; centres may be descending
+    order = np.argsort(centres)
+    edges = cell_edges(centres[order])
+    pos = np.searchsorted(edges, pixels, side='right') - 1
+    inside = (pos >= 0) & (pos < len(centres))
+    return np.where(inside, order[np.clip(pos, 0, len(centres) - 1)], -1)
+
+def _pixel_window(coord: np.ndarray, low: float, high: float) -> slice:
+    inside = np.flatnonzero((coord >= low) & (coord <= high))
+    return slice(int(inside[0]), int(inside[-1]) + 1) if inside.size else slice(0, 0)
+
+def cover_fractions(lulc: xr.DataArray, lat: xr.DataArray, lon: xr.DataArray, scheme: str = 'esa_cci',
+                    block_rows: int = 1024) -> xr.Dataset:
+    # Share of urban and water pixels in every climate cell, from one pass over the land cover raster in row blocks
+    classes = LULC_SCHEMES[scheme]
+    lat_c, lon_c = lat.values, lon.values
+    lat_edges, lon_edges = cell_edges(np.sort(lat_c)), cell_edges(np.sort(lon_c))
+    pixel_lon = lulc['lon'].values
+    if lon_c.max() > 180:
+        pixel_lon = pixel_lon % 360
+    rows = _pixel_window(lulc['lat'].values, lat_edges[0], lat_edges[-1])
+    cols = _pixel_window(pixel_lon, lon_edges[0], lon_edges[-1])
+    col_cell = _cell_of(pixel_lon[cols], lon_c)
+
+    n_cells = lat_c.size * lon_c.size
+    counts = {name: np.zeros(n_cells, dtype=np.int64) for name in ('valid', 'urban', 'water')}
+    for start in range(rows.start, rows.stop, block_rows):
+        window = slice(start, min(start + block_rows, rows.stop))
+        block = np.asarray(lulc.isel(lat=window, lon=cols).values)
+        row_cell = _cell_of(lulc['lat'].values[window], lat_c)
+        cell = row_cell[:, None] * lon_c.size + col_cell[None, :]
+        valid = (row_cell[:, None] >= 0) & (col_cell[None, :] >= 0) & ~np.isin(block, classes['nodata'])
+        cell = cell[valid]
+        block = block[valid]
+        counts['valid'] += np.bincount(cell, minlength=n_cells)
+        counts['urban'] += np.bincount(cell, weights=np.isin(block, classes['urban']), minlength=n_cells).astype(np.int64)
+        counts['water'] += np.bincount(cell, weights=np.isin(block, classes['water']), minlength=n_cells).astype(np.int64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fractions = {name: np.where(counts['valid'] > 0, counts[name] / counts['valid'], np.nan).reshape(lat_c.size, lon_c.size)
+                     for name in ('urban', 'water')}
+    return xr.Dataset(
+        {
+            "urban_fraction": (('lat', 'lon'), fractions['urban'], {"long_name": "Fraction of urban land cover", "units": "1"}),
+            "water_fraction": (('lat', 'lon'), fractions['water'], {"long_name": "Fraction of water land cover", "units": "1"}),
+        },
+        coords={'lat': lat.values, 'lon': lon.values},
+    )
+
+def _distance_km(lat: np.ndarray, lon: np.ndarray, lat0: float, lon0: float) -> np.ndarray:
+    lat, lon, lat0, lon0 = np.radians(lat), np.radians(lon), np.radians(lat0), np.radians(lon0)
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def zone_masks(fractions: xr.Dataset, cities: Dict[str, Tuple[float, float]], urban_threshold: float = 0.3,
+               rural_threshold: float = 0.05, water_threshold: float = 0.2, urban_radius_km: float = 30.0,
+               buffer_km: float = 20.0, rural_radius_km: float = 100.0) -> xr.DataArray:
+    # Urban core: built-up cells near the centre; rural reference: mostly non-urban, dry land in an outer ring,
+    # separated from the core by a buffer ring that is used by neither
+    urban_fraction = fractions['urban_fraction'].fillna(0).values
+    water_fraction = fractions['water_fraction'].fillna(1).values
+    lat2d, lon2d = np.meshgrid(fractions['lat'].values, fractions['lon'].values, indexing='ij')
+    zones = np.zeros((len(cities),) + urban_fraction.shape, dtype=np.int8)
+    for k, (name, (lat0, lon0)) in enumerate(cities.items()):
+        distance = _distance_km(lat2d, lon2d, lat0, lon0)
+        urban = (distance <= urban_radius_km) & (urban_fraction >= urban_threshold)
+        if not urban.any():
+            # Coarse grids may never reach the threshold: fall back to the cell holding the centre
+            urban = distance == distance.min()
+            print(f"Warning: no cell near {name} reaches {urban_threshold:.0%} urban cover; using the centre cell only.")
+        rural = ((distance > urban_radius_km + buffer_km) & (distance <= rural_radius_km)
+                 & (urban_fraction <= rural_threshold) & (water_fraction <= water_threshold))
+        zones[k] = np.where(urban, ZONE_URBAN, np.where(rural, ZONE_RURAL, np.where(distance <= rural_radius_km, ZONE_BUFFER, ZONE_OUTSIDE)))
+        if not rural.any():
+            print(f"Warning: no rural reference cells found for {name} within {rural_radius_km} km.")
+
+    city_lat, city_lon = zip(*cities.values()) if cities else ((), ())
+    return xr.DataArray(
+        zones, dims=('city', 'lat', 'lon'),
+        coords={'city': list(cities), 'city_lat': ('city', list(city_lat)), 'city_lon': ('city', list(city_lon)),
+                'lat': fractions['lat'].values, 'lon': fractions['lon'].values},
+        name='zone',
+        attrs={"long_name": "UHI zone of each grid cell", "flag_values": list(ZONE_NAMES), "flag_meanings": ' '.join(ZONE_NAMES.values())},
+    )
+
+def _mask_key(payload: Dict) -> str:
+    return hashlib.sha1(json.dumps({"version": MASK_VERSION, **payload}, sort_keys=True, default=list).encode()).hexdigest()[:16]
+
+def cached_zone_masks(lulc_path: str, lat: xr.DataArray, lon: xr.DataArray, cities: Dict[str, Tuple[float, float]],
+                      cache_dir: Optional[str], scheme: str = 'esa_cci', lulc_variable: Optional[str] = None, **thresholds) -> xr.Dataset:
+    # The land cover raster is classified to the climate grid once per (raster, grid, cities, thresholds)
+    stat = os.stat(lulc_path)
+    payload = {"lulc": [str(Path(lulc_path).resolve()), stat.st_size, stat.st_mtime_ns], "scheme": scheme, "variable": lulc_variable,
+               "lat": grid_digest(lat.values), "lon": grid_digest(lon.values),
+               "cities": {name: list(point) for name, point in cities.items()}, "thresholds": thresholds}
+    mask_path = Path(cache_dir) / f"uhi_masks_{_mask_key(payload)}.nc" if cache_dir else None
+    if mask_path is not None and mask_path.exists():
+        print(f"UHI zone masks loaded from cache: {mask_path}")
+        with xr.open_dataset(mask_path) as cached:
+            return cached.load()
+
+    print(f"Classifying land cover ({scheme}) to the {lat.size}x{lon.size} climate grid...")
+    with open_lulc(lulc_path, lulc_variable) as lulc:
+        fractions = cover_fractions(lulc, lat, lon, scheme)
+    masks = fractions.assign(zone=zone_masks(fractions, cities, **thresholds))
+    if mask_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        masks.attrs["payload"] = json.dumps(payload)
+        _atomic_write(masks, mask_path, lambda ds, path: ds.to_netcdf(path, engine='netcdf4'))
+        print(f"UHI zone masks cached at: {mask_path}")
+    return masks
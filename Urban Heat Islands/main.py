@@ -1 +1,166 @@
-#in progress
+import argparse
+import json
+import os
+import sys
+import xarray as xr
+from pathlib import Path
+COMMON_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+if COMMON_DIR not in sys.path:
+    sys.path.insert(1, COMMON_DIR) # modules shared by all three folders
+from input import REGRID_METHOD, TEMPERATURE_VARIABLES, get_drive_data_path, get_lulc_path, load_temperature
+from preprocess import combine_preprocess
+from writers import save_indices_to_netcdf
+from lulc import LULC_SCHEMES, cached_zone_masks
+from indices import uhi_intensity
+from execution import execution_backend
+from cube_cache import cached_cube, input_fingerprint
+from instrumentation import instrumented_run, path_size_mb, span
+from precision import precision_policy
+from typing import Dict, List, Literal, Optional, Tuple
+
+OUTPUT_DIR = '/content/drive/MyDrive/Group Project 2025/results'
+OUTPUT_FILENAME = 'calculated_uhi.nc'
+LAT_RANGE = (8.0, 24.0) # currently Vietnam
+LON_RANGE = (102.0, 110.0)
+PERIOD: Optional[Tuple[int, int]] = None # e.g. (1961, 2023); None keeps every full year in the files
+NAN_METHOD: Literal['keep'] = 'keep'
+CITIES: Dict[str, Tuple[float, float]] = { # name: (lat, lon) of the city centre
+    "Hanoi": (21.03, 105.85),
+    "Hai Phong": (20.86, 106.68),
+    "Da Nang": (16.05, 108.20),
+    "Ho Chi Minh City": (10.78, 106.70),
+    "Can Tho": (10.03, 105.78),
+}
+LULC_SCHEME = 'esa_cci' # class codes of the land cover map: 'esa_cci', 'worldcover' or 'modis_igbp'
+URBAN_THRESHOLD = 0.3 # urban cover share of an urban-core cell
+RURAL_THRESHOLD = 0.05 # maximum urban cover share of a rural reference cell
+WATER_THRESHOLD = 0.2 # maximum water cover share of a rural reference cell
+URBAN_RADIUS_KM = 30.0 # urban-core cells lie within this distance of the centre
+BUFFER_KM = 20.0 # ring between the core and the rural reference that is used by neither
+RURAL_RADIUS_KM = 100.0 # rural reference cells lie within this distance of the centre
+CUBE_CACHE_GB = 20.0 # size cap of the preprocessed-cube cache in '<output-dir>/cube_cache'; 0 disables it
+PRECISION: Literal['float32', 'float64'] = 'float32' # compute dtype of the daily fields; 'float64' reproduces the old pipeline
+PACKING = True # store °C results as int16 with scale_factor 0.01 (0.005 °C steps); day counts are always int16
+COMPRESSION: Literal['zlib', 'zstd', 'none'] = 'zlib' # 'zstd' is smaller and faster but needs netCDF-C with the zstd filter to read
+REPORT = True # write '<output>_report.json' with per-stage timings, I/O, memory and dask task counts
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compute daily urban heat island intensity (urban minus rural temperature) per city.")
+    parser.add_argument('--data-dir', default=None, help="folder with the input .nc files (default: get_drive_data_path())")
+    parser.add_argument('--lulc', default=None, help="land cover map (.nc, or .tif with rioxarray; default: get_lulc_path())")
+    parser.add_argument('--lulc-scheme', choices=list(LULC_SCHEMES), default=LULC_SCHEME)
+    parser.add_argument('--lulc-variable', default=None, help="class variable in a NetCDF map (default: the first lat/lon variable)")
+    parser.add_argument('--cities', default=None, help='JSON file of {"name": [lat, lon]} (default: CITIES)')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--output-file', default=OUTPUT_FILENAME)
+    parser.add_argument('--lat-range', nargs=2, type=float, default=LAT_RANGE, metavar=('MIN', 'MAX'))
+    parser.add_argument('--lon-range', nargs=2, type=float, default=LON_RANGE, metavar=('MIN', 'MAX'))
+    parser.add_argument('--period', nargs=2, type=int, default=PERIOD, metavar=('START', 'END'))
+    parser.add_argument('--variables', nargs='+', default=TEMPERATURE_VARIABLES, choices=TEMPERATURE_VARIABLES)
+    parser.add_argument('--urban-threshold', type=float, default=URBAN_THRESHOLD)
+    parser.add_argument('--rural-threshold', type=float, default=RURAL_THRESHOLD)
+    parser.add_argument('--water-threshold', type=float, default=WATER_THRESHOLD)
+    parser.add_argument('--urban-radius-km', type=float, default=URBAN_RADIUS_KM)
+    parser.add_argument('--buffer-km', type=float, default=BUFFER_KM)
+    parser.add_argument('--rural-radius-km', type=float, default=RURAL_RADIUS_KM)
+    parser.add_argument('--mask-cache-dir', default=None, help="default: <output-dir>/uhi_masks")
+    parser.add_argument('--regrid-method', choices=['conservative', 'bilinear'], default=REGRID_METHOD,
+                        help="used when input variables come on different grids")
+    parser.add_argument('--regrid-cache-dir', default=None, help="default: <output-dir>/regrid_weights")
+    parser.add_argument('--cube-cache-dir', default=None, help="default: <output-dir>/cube_cache")
+    parser.add_argument('--cube-cache-gb', type=float, default=CUBE_CACHE_GB, help="0 disables the preprocessed-cube cache")
+    parser.add_argument('--precision', choices=['float32', 'float64'], default=PRECISION)
+    parser.add_argument('--no-packing', dest='packing', action='store_false', default=PACKING,
+                        help="store °C results as float instead of int16 with a 0.01 scale factor")
+    parser.add_argument('--compression', choices=['zlib', 'zstd', 'none'], default=COMPRESSION)
+    parser.add_argument('--report', default=None, help="run report path (default: <output-dir>/<output-file stem>_report.json)")
+    parser.add_argument('--no-report', dest='write_report', action='store_false', default=REPORT)
+    parser.add_argument('--profile-stage', default=None, metavar='STAGE',
+                        help="profile one stage: load, preprocess, cube_cache, masks, uhi, save")
+    parser.add_argument('--profile', choices=['cprofile', 'dask'], default='cprofile',
+                        help="'dask' writes a dask performance report (needs --scheduler distributed)")
+    parser.add_argument('--scheduler', choices=['threads', 'processes', 'distributed'], default='threads')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="distributed scheduler only")
+    parser.add_argument('--memory-limit', default=None, help="per worker, e.g. '4GB' (distributed scheduler only)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    lat_range = tuple(args.lat_range)
+    lon_range = tuple(args.lon_range)
+    period = tuple(args.period) if args.period else None
+    cities = CITIES
+    if args.cities:
+        with open(args.cities) as f:
+            cities = {name: tuple(point) for name, point in json.load(f).items()}
+
+    report_path = args.report or os.path.join(args.output_dir, f"{Path(args.output_file).stem}_report.json")
+
+    with execution_backend(args.scheduler, args.workers, args.memory_limit, args.threads_per_worker), \
+         precision_policy(args.precision, args.packing, args.compression), \
+         instrumented_run(report_path if args.write_report else None, args.profile_stage, args.profile, vars(args)):
+        with span('cube_cache'):
+            processed_data = _preprocessed_cube(args, args.data_dir or get_drive_data_path(), lat_range, lon_range, period)
+
+        # Land cover is classified to this grid once and reused from the cache on later runs
+        with span('masks', cities=len(cities)):
+            masks = cached_zone_masks(
+                lulc_path=args.lulc or get_lulc_path(),
+                lat=processed_data['lat'],
+                lon=processed_data['lon'],
+                cities=cities,
+                cache_dir=args.mask_cache_dir or os.path.join(args.output_dir, 'uhi_masks'),
+                scheme=args.lulc_scheme,
+                lulc_variable=args.lulc_variable,
+                urban_threshold=args.urban_threshold,
+                rural_threshold=args.rural_threshold,
+                water_threshold=args.water_threshold,
+                urban_radius_km=args.urban_radius_km,
+                buffer_km=args.buffer_km,
+                rural_radius_km=args.rural_radius_km
+            )
+
+        with span('uhi'):
+            uhi_ds = uhi_intensity(processed_data, masks['zone'], args.variables)
+            uhi_ds = uhi_ds.assign(zone=masks['zone'], urban_fraction=masks['urban_fraction'])
+
+        # The reduction is computed here, while writing
+        with span('save') as stage:
+            saved_path = save_indices_to_netcdf(
+                ds_indices=uhi_ds,
+                output_filename=args.output_file,
+                output_dir=args.output_dir
+            )
+            stage['output_mb'] = round(path_size_mb(saved_path), 2)
+    print("PROGRAM COMPLETED SUCCESSFULLY!")
+
+def _preprocessed_cube(args: argparse.Namespace, data_dir: str, lat_range: Tuple[float, float], lon_range: Tuple[float, float],
+                       period: Optional[Tuple[int, int]]) -> xr.Dataset:
+    variables = list(args.variables)
+
+    def preprocessed() -> xr.Dataset:
+        with span('load'):
+            initial_data = load_temperature(variables=variables, period=period, lat_range=lat_range, lon_range=lon_range,
+                                            data_dir=data_dir, regrid_method=args.regrid_method,
+                                            regrid_dir=args.regrid_cache_dir or os.path.join(args.output_dir, 'regrid_weights'))
+        if initial_data is None:
+            raise FileNotFoundError(f"No {variables} files found for the requested area and period.")
+        with span('preprocess'):
+            return combine_preprocess(
+                ds=initial_data,
+                lat_range=lat_range,
+                lon_range=lon_range,
+                nan_method=NAN_METHOD,
+                period=period
+            )
+
+    # Same cleaned cube as the other modules: runs over the same files, area and period share the cache entry
+    cache_key = {"files": input_fingerprint(data_dir, variables, period, lat_range, lon_range), "variables": variables,
+                 "lat_range": lat_range, "lon_range": lon_range, "period": period, "nan_method": NAN_METHOD,
+                 "regrid": args.regrid_method, "precision": args.precision}
+    return cached_cube(cache_key, preprocessed, args.cube_cache_dir or os.path.join(args.output_dir, 'cube_cache'),
+                       args.cube_cache_gb)
+
+if __name__ == '__main__':
+    main()
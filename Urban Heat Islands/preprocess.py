@@ -1 +0,0 @@
-#in progress
@@ -0,0 +1,145 @@
+import xarray as xr
+import numpy as np
+import dask
+import contextlib
+import io
+import json
+import os
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import median
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from instrumentation import environment
+
+REGRESSION_TOLERANCE = 0.2 # a stage more than 20% slower than the last stored run is flagged
+STUDY_LAT = (8.0, 24.0)
+STUDY_LON = (102.0, 110.0)
+
+def synthetic_cube(years: int = 10, n_lat: int = 40, n_lon: int = 40, start_year: int = 1991, calendar: str = 'standard',
+                   chunks: Optional[Dict[str, Union[int, str]]] = None, humidity: bool = False, seed: int = 0,
+                   lat_range: Tuple[float, float] = STUDY_LAT, lon_range: Tuple[float, float] = STUDY_LON) -> xr.Dataset:
+    # Daily CMIP-like fields (K, kg m-2 s-1, float32) with masked cells and fill-value spikes for the cleaning pass
+    rng = np.random.default_rng(seed)
+    time_index = xr.date_range(f"{start_year}-01-01", f"{start_year + years}-01-01", freq='D', inclusive='left', calendar=calendar,
+                               use_cftime=calendar not in ('standard', 'gregorian', 'proleptic_gregorian'))
+    lat = np.linspace(*lat_range, n_lat)
+    lon = np.linspace(*lon_range, n_lon)
+    shape = (len(time_index), n_lat, n_lon)
+
+    day = xr.DataArray(time_index, dims='time').dt.dayofyear.values.astype(np.float32)
+    season = np.sin(2 * np.pi * (day - 110) / 365.0)[:, None, None].astype(np.float32)
+    trend = (0.03 * np.arange(len(time_index)) / 365.0).astype(np.float32)[:, None, None]
+    climate = (300.0 - 0.35 * (lat - lat[0]))[None, :, None].astype(np.float32)
+
+    tas = climate + 4.0 * season + trend + rng.standard_normal(shape, dtype=np.float32) * 2.0
+    tasmax = tas + 4.0 + rng.random(shape, dtype=np.float32) * 3.0
+    tasmin = tas - 4.0 - rng.random(shape, dtype=np.float32) * 3.0
+    wet = rng.random(shape, dtype=np.float32) < 0.4 + 0.25 * season
+    pr = np.where(wet, rng.gamma(0.7, 12.0, shape).astype(np.float32), np.float32(0.0)) / np.float32(86400.0)
+
+    fields = {"tas": tas, "tasmax": tasmax, "tasmin": tasmin, "pr": pr}
+    if humidity:
+        fields["hurs"] = np.clip(70.0 + 15.0 * season + rng.standard_normal(shape, dtype=np.float32) * 8.0, 5.0, 100.0)
+    masked = rng.random((n_lat, n_lon)) < 0.05
+    spikes = rng.random(shape) < 1e-5
+    for values in fields.values():
+        values[:, masked] = np.nan
+        values[spikes] = np.float32(1e20)
+
+    attrs = {
+        "tas": {"standard_name": "air_temperature", "units": "K"},
+        "tasmax": {"standard_name": "air_temperature", "units": "K"},
+        "tasmin": {"standard_name": "air_temperature", "units": "K"},
+        "pr": {"standard_name": "precipitation_flux", "units": "kg m-2 s-1"},
+        "hurs": {"standard_name": "relative_humidity", "units": "%"},
+    }
+    ds = xr.Dataset(
+        {name: (('time', 'lat', 'lon'), values, attrs[name]) for name, values in fields.items()},
+        coords={
+            'time': time_index,
+            'lat': ('lat', lat, {"units": "degrees_north"}),
+            'lon': ('lon', lon, {"units": "degrees_east"}),
+        },
+    )
+    return ds.chunk(chunks) if chunks else ds
+
+def write_synthetic_files(ds: xr.Dataset, data_dir: str, model: str = 'SYNTH') -> List[str]:
+    # One file per variable and year, named like the CMIP daily files
+    os.makedirs(data_dir, exist_ok=True)
+    paths: List[str] = []
+    for name in ds.data_vars:
+        for year, yearly in ds[name].groupby('time.year'):
+            path = os.path.join(data_dir, f"{name}_day_{model}_historical_r1i1p1f1_gn_{year}0101-{year}1231.nc")
+            yearly.to_dataset().to_netcdf(path, encoding={name: {"zlib": True, "complevel": 1}})
+            paths.append(path)
+    return paths
+
+def task_count(result) -> int:
+    if not dask.is_dask_collection(result):
+        return 0
+    return len(dask.optimize(result)[0].__dask_graph__())
+
+def _run_once(stage: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        result = stage()
+        if dask.is_dask_collection(result):
+            dask.compute(result)
+    return time.perf_counter() - start
+
+def measure(stage: Callable[[], object], repeat: int = 3, memory: bool = True) -> Dict[str, float]:
+    timings = [_run_once(stage) for _ in range(repeat)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        tasks = task_count(stage())
+    record = {"wall_s": min(timings), "wall_median_s": median(timings), "tasks": tasks}
+    if memory:
+        # Traced in an extra run: tracemalloc slows allocation-heavy code and must not leak into the timings
+        tracemalloc.start()
+        try:
+            _run_once(stage)
+            record["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+        finally:
+            tracemalloc.stop()
+    return record
+
+def previous_results(results_path: str, config: Dict) -> Dict[str, Dict]:
+    # Latest stored result of every stage for this configuration, so partial runs still have a baseline
+    previous: Dict[str, Dict] = {}
+    if not os.path.exists(results_path):
+        return previous
+    with open(results_path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record["config"] == config:
+                for name, result in record["stages"].items():
+                    previous[name] = {**result, "commit": record["environment"].get("commit")}
+    return previous
+
+def store_results(results_path: str, config: Dict, stages: Dict[str, Dict[str, float]]) -> Dict:
+    record = {"timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'), "config": config,
+              "environment": environment(), "stages": stages}
+    Path(results_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(results_path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    return record
+
+def compare(stages: Dict[str, Dict[str, float]], previous: Dict[str, Dict], tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    print(f"\n{'Stage':<28}{'wall (s)':>10}{'median':>10}{'peak (MB)':>11}{'tasks':>8}{'vs last':>10}")
+    regressions: List[str] = []
+    for name, result in stages.items():
+        change = ""
+        if name in previous and previous[name]["wall_s"] > 0:
+            ratio = result["wall_s"] / previous[name]["wall_s"]
+            change = f"{ratio:.2f}x"
+            if ratio > 1 + tolerance:
+                regressions.append(name)
+                change += " !"
+        peak = f"{result['peak_mb']:.1f}" if "peak_mb" in result else "-"
+        print(f"{name:<28}{result['wall_s']:>10.3f}{result['wall_median_s']:>10.3f}{peak:>11}{result['tasks']:>8}{change:>10}")
+    if regressions:
+        print(f"Slower than the last stored run by more than {tolerance:.0%}: {', '.join(regressions)}")
+    return regressions
@@ -0,0 +1,105 @@
+import xarray as xr
+import json
+import os
+import glob
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+CATALOG_NAME = '.urex_catalog.json'
+# netCDF-C/HDF5 is not thread-safe: concurrent opens in the scan pool fail intermittently with HDF errors
+_OPEN_LOCK = threading.Lock()
+
+def _date(value) -> str:
+    return str(value)[:10]
+
+def scan_file(file_path: str) -> Dict:
+    stat = os.stat(file_path)
+    with _OPEN_LOCK, xr.open_dataset(file_path, chunks=None) as ds:
+        time_vars = [name for name, da in ds.data_vars.items() if 'time' in da.dims and da.ndim >= 3]
+        variable = time_vars[0] if time_vars else Path(file_path).stem.split('_')[-1]
+        entry = {
+            "path": str(Path(file_path).resolve()),
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "variable": variable,
+            "time_start": _date(ds['time'].values[0]) if 'time' in ds.coords else None,
+            "time_end": _date(ds['time'].values[-1]) if 'time' in ds.coords else None,
+            "calendar": ds['time'].encoding.get('calendar', 'standard') if 'time' in ds.coords else None,
+        }
+        for coord in ('lat', 'lon'):
+            if coord in ds.coords:
+                entry[f"{coord}_min"] = float(ds[coord].min())
+                entry[f"{coord}_max"] = float(ds[coord].max())
+                entry[f"n{coord}"] = int(ds.sizes[coord])
+    return entry
+
+def build_catalog(data_dir: str, pattern: str = '*.nc', workers: int = 16, catalog_path: Optional[str] = None) -> List[Dict]:
+    catalog_path = Path(catalog_path or os.path.join(data_dir, CATALOG_NAME))
+    known: Dict[str, Dict] = {}
+    if catalog_path.exists():
+        with open(catalog_path) as f:
+            known = {entry["path"]: entry for entry in json.load(f)}
+
+    entries: List[Dict] = []
+    to_scan: List[str] = []
+    for file_path in sorted(glob.glob(os.path.join(data_dir, pattern))):
+        path = str(Path(file_path).resolve())
+        stat = os.stat(path)
+        cached = known.get(path)
+        if cached and cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            entries.append(cached)
+        else:
+            to_scan.append(path)
+
+    if to_scan:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            entries.extend(pool.map(scan_file, to_scan))
+        try:
+            tmp_path = catalog_path.with_name(catalog_path.name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f, indent=1)
+            os.replace(tmp_path, catalog_path)
+        except OSError as e:
+            print(f" Could not write catalog {catalog_path}: {e}")
+
+    print(f"Catalog: {len(entries)} files ({len(to_scan)} scanned, {len(entries) - len(to_scan)} from cache)")
+    return entries
+
+def _overlaps(low: float, high: float, bounds: Tuple[float, float]) -> bool:
+    return high >= min(bounds) and low <= max(bounds)
+
+def select_files(catalog: List[Dict], variable: str, period: Optional[Tuple[int, int]] = None,
+                 lat_range: Optional[Tuple[float, float]] = None, lon_range: Optional[Tuple[float, float]] = None) -> List[Dict]:
+    selected = []
+    for entry in catalog:
+        if entry["variable"] != variable:
+            continue
+        if period and entry["time_start"] and not (entry["time_start"][:4] <= f"{period[1]:04d}" and entry["time_end"][:4] >= f"{period[0]:04d}"):
+            continue
+        if lat_range and "lat_min" in entry and not _overlaps(entry["lat_min"], entry["lat_max"], lat_range):
+            continue
+        if lon_range and "lon_min" in entry and not any(
+                _overlaps(entry["lon_min"], entry["lon_max"], (lon_range[0] + shift, lon_range[1] + shift)) for shift in (-360, 0, 360)):
+            continue
+        selected.append(entry)
+    return sorted(selected, key=lambda entry: entry["time_start"] or "")
+
+def file_fingerprint(entries: List[Dict]) -> List[List]:
+    # Changes when a file is added, removed or rewritten
+    return [[entry["path"], entry["size"], entry["mtime"]] for entry in entries]
+
+def open_variable(entries: List[Dict], chunks: Optional[Dict[str, Union[int, str]]]) -> xr.Dataset:
+    paths = [entry["path"] for entry in entries]
+    if len(paths) == 1:
+        ds = xr.open_dataset(paths[0], chunks=chunks)
+    else:
+        ds = xr.open_mfdataset(paths, chunks=chunks if chunks is not None else {}, combine='by_coords', parallel=True,
+                               data_vars='minimal', coords='minimal', compat='override')
+        # One file per chunk along time otherwise; rechunk to the requested layout
+        ds = ds.chunk(chunks) if chunks else ds
+    # encoding['source'] only names the first file of a multi-file open; caches key on all of them
+    for da in ds.data_vars.values():
+        da.encoding['source_files'] = file_fingerprint(entries)
+    return ds
@@ -0,0 +1,109 @@
+import xarray as xr
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from catalog import build_catalog, file_fingerprint, select_files
+
+# Bump when preprocessing changes so stale cubes are not reused
+CACHE_VERSION = 1
+CACHE_INDEX = 'cube_index.json'
+CUBE_CHUNKS = {'time': -1, 'lat': 'auto', 'lon': 'auto'}
+
+def input_fingerprint(data_dir: str, variables: Sequence[str], period: Optional[Tuple[int, int]] = None,
+                      lat_range: Optional[Tuple[float, float]] = None, lon_range: Optional[Tuple[float, float]] = None) -> Dict[str, List[List]]:
+    catalog = build_catalog(data_dir)
+    return {name: file_fingerprint(select_files(catalog, name, period, lat_range, lon_range)) for name in variables}
+
+def cube_key(payload: Dict) -> str:
+    return hashlib.sha1(json.dumps({"version": CACHE_VERSION, **payload}, sort_keys=True, default=list).encode()).hexdigest()[:16]
+
+def _covers(cached: Dict, payload: Dict) -> bool:
+    # A cube holding more variables from the same files and options serves any subset of them
+    same_options = all(cached.get(k) == v for k, v in payload.items() if k not in ('variables', 'files'))
+    return same_options and all(cached['files'].get(name) == files for name, files in payload['files'].items())
+
+def _select(cube: xr.Dataset, payload: Dict) -> xr.Dataset:
+    # The per-variable masks from cleaning let a cube serve a variable subset with the masks a fresh run would build
+    names = [name for name in payload['variables'] if name in cube.data_vars]
+    keep = {f"valid_mask_{name}" for name in names}
+    cube = cube[names].drop_vars([name for name in cube.coords if name.startswith('valid_mask') and name not in keep])
+    for var in cube.variables.values():
+        var.encoding.pop('coordinates', None)
+    # The input files the cube was built from, as open_variable records them
+    for name in names:
+        if payload['files'].get(name):
+            cube[name].encoding['source_files'] = payload['files'][name]
+    return cube
+
+def _read_index(cache_dir: Path) -> Dict[str, Dict]:
+    index_path = cache_dir / CACHE_INDEX
+    if not index_path.exists():
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
+
+def _write_index(cache_dir: Path, index: Dict[str, Dict]) -> None:
+    tmp_path = cache_dir / f".{CACHE_INDEX}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, cache_dir / CACHE_INDEX)
+
+def _store_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+def evict(cache_dir: str, max_size_gb: float, keep: Optional[str] = None) -> None:
+    cache_dir = Path(cache_dir)
+    index = {key: entry for key, entry in _read_index(cache_dir).items() if (cache_dir / entry["store"]).exists()}
+    total = sum(entry["size"] for entry in index.values())
+    # Least recently used cubes go first; the one just written or read is never evicted
+    for key, entry in sorted(index.items(), key=lambda item: item[1]["last_access"]):
+        if total <= max_size_gb * 1024**3:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(cache_dir / entry["store"], ignore_errors=True)
+        total -= entry["size"]
+        del index[key]
+        print(f"Evicted cached cube {entry['store']} ({entry['size'] / 1024**2:.1f} MB)")
+    _write_index(cache_dir, index)
+
+def cached_cube(payload: Dict, build: Callable[[], xr.Dataset], cache_dir: Optional[str], max_size_gb: float = 20.0) -> xr.Dataset:
+    if cache_dir is None or max_size_gb <= 0:
+        return build()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Compare against the index in its JSON form (tuples come back as lists)
+    payload = json.loads(json.dumps(payload, default=list))
+    key = cube_key(payload)
+    store = Path(cache_dir) / f"cube_{key}.zarr"
+    index = _read_index(Path(cache_dir))
+
+    hit = key if key in index else next((k for k, entry in index.items() if _covers(entry["payload"], payload)), None)
+    if hit is not None and (Path(cache_dir) / index[hit]["store"]).exists():
+        index[hit]["last_access"] = time.time()
+        _write_index(Path(cache_dir), index)
+        print(f"Preprocessed cube loaded from cache: {index[hit]['store']}")
+        return _select(xr.open_zarr(Path(cache_dir) / index[hit]["store"], consolidated=True), payload)
+
+    ds = build()
+    for var in ds.variables.values():
+        var.encoding = {}
+    tmp_path = store.with_name(f".{store.name}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    try:
+        ds.chunk(CUBE_CHUNKS).to_zarr(tmp_path, mode='w', consolidated=True)
+        shutil.rmtree(store, ignore_errors=True)
+        os.replace(tmp_path, store)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    index = _read_index(Path(cache_dir))
+    index[key] = {"store": store.name, "size": _store_size(store), "last_access": time.time(), "payload": payload}
+    _write_index(Path(cache_dir), index)
+    print(f"Preprocessed cube cached at: {store} ({index[key]['size'] / 1024**2:.1f} MB)")
+    evict(cache_dir, max_size_gb, keep=key)
+    return _select(xr.open_zarr(store, consolidated=True), payload)
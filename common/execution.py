@@ -0,0 +1,27 @@
+import dask
+from contextlib import contextmanager
+from typing import Iterator, Literal, Optional
+
+Backend = Literal['threads', 'processes', 'distributed']
+
+@contextmanager
+def execution_backend(backend: Backend = 'threads', workers: Optional[int] = None, memory_limit: Optional[str] = None,
+                      threads_per_worker: int = 1) -> Iterator[None]:
+    if backend == 'distributed':
+        from dask.distributed import Client, LocalCluster
+
+        cluster = LocalCluster(n_workers=workers, threads_per_worker=threads_per_worker,
+                               memory_limit=memory_limit or 'auto')
+        client = Client(cluster)
+        print(f"Dask cluster started: {len(cluster.workers)} workers, dashboard at {client.dashboard_link}")
+        try:
+            yield
+        finally:
+            client.close()
+            cluster.close()
+    elif backend in ('threads', 'processes'):
+        with dask.config.set(scheduler=backend, num_workers=workers):
+            print(f"Dask scheduler: {backend} ({workers or 'all'} workers)")
+            yield
+    else:
+        raise ValueError(f"Unknown execution backend: {backend}")
@@ -0,0 +1,13 @@
+import numpy as np
+import hashlib
+
+def cell_edges(centres: np.ndarray) -> np.ndarray:
+    # Cell boundaries halfway between sorted centres; the outer cells are as wide as their neighbours
+    mid = (centres[1:] + centres[:-1]) / 2
+    first = centres[0] - (mid[0] - centres[0]) if len(centres) > 1 else centres[0] - 0.5
+    last = centres[-1] + (centres[-1] - mid[-1]) if len(centres) > 1 else centres[-1] + 0.5
+    return np.r_[first, mid, last]
+
+def grid_digest(values: np.ndarray) -> str:
+    # Identifies a coordinate axis in cache keys
+    return hashlib.sha1(np.ascontiguousarray(values, dtype=np.float64).tobytes()).hexdigest()[:16]
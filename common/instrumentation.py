@@ -0,0 +1,246 @@
+import xarray as xr
+import numpy as np
+import dask
+import cProfile
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dask.callbacks import Callback
+from dask.utils import key_split
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Literal, Optional, TypeVar, Union
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+ProfileMode = Literal['cprofile', 'dask']
+T = TypeVar('T')
+
+TOP_TASK_PREFIXES = 10
+
+# State of the active run; empty when no report is being recorded, which turns every hook into a no-op
+_RUN: Dict = {}
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment() -> Dict[str, Optional[str]]:
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "xarray": xr.__version__,
+        "dask": dask.__version__,
+        "numba": numba_version,
+        "machine": f"{platform.node()} ({os.cpu_count()} cpus)",
+        "commit": _git_commit(),
+    }
+
+def _io_counters() -> Dict[str, int]:
+    # Bytes this process passed through read()/write(), Linux only
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return {"read": int(fields['rchar']), "written": int(fields['wchar'])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+def path_size_mb(path: Union[str, Path]) -> float:
+    path = Path(path)
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob('*') if f.is_file()) / 1024**2
+    return path.stat().st_size / 1024**2 if path.exists() else 0.0
+
+def _stack() -> List[Dict]:
+    if not hasattr(_LOCAL, 'spans'):
+        _LOCAL.spans = []
+    return _LOCAL.spans
+
+class _DaskStats(Callback):
+    # Local schedulers call these hooks in the thread that called compute, so tasks land in that thread's open span
+    def __init__(self):
+        super().__init__()
+        self.started: Dict = {}
+
+    def _start(self, dsk):
+        stack = _stack()
+        if stack:
+            stack[-1]["dask_computes"] += 1
+
+    def _pretask(self, key, dsk, state):
+        self.started[(threading.get_ident(), key)] = time.perf_counter()
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        start = self.started.pop((threading.get_ident(), key), None)
+        stack = _stack()
+        if stack and start is not None:
+            record = stack[-1]
+            record["dask_tasks"] += 1
+            prefix = key_split(key)
+            record["task_seconds"][prefix] = record["task_seconds"].get(prefix, 0.0) + time.perf_counter() - start
+
+@contextmanager
+def _profiled(name: str) -> Iterator[None]:
+    if _RUN.get("profile_stage") != name:
+        yield
+        return
+    # Only the first span of that name is profiled
+    _RUN["profile_stage"] = None
+    base = _RUN["profile_base"]
+    if _RUN["profile_mode"] == 'dask':
+        try:
+            import bokeh # renders the performance report
+            from distributed import get_client, performance_report
+            get_client()
+        except (ImportError, ValueError):
+            print("A dask performance report needs bokeh and a running dask.distributed client (--scheduler distributed); "
+                  "profiling with cProfile instead.")
+        else:
+            path = f"{base}_{name}_dask.html"
+            with performance_report(filename=path):
+                yield
+            _RUN["profiles"][name] = path
+            return
+
+    path = f"{base}_{name}.prof"
+    profiler = cProfile.Profile()
+    # Tasks run in the profiled thread; on a thread pool cProfile would only see the scheduler waiting
+    with dask.config.set(scheduler='synchronous'):
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            _RUN["profiles"][name] = path
+
+@contextmanager
+def span(name: str, **info) -> Iterator[Dict]:
+    if not _RUN:
+        yield info
+        return
+
+    stack = _stack()
+    record = {"name": name, "parent": stack[-1]["name"] if stack else None, **info,
+              "dask_computes": 0, "dask_tasks": 0, "task_seconds": {}}
+    io_start = _io_counters()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    stack.append(record)
+    try:
+        with _profiled(name):
+            yield record
+    except BaseException:
+        record["failed"] = True
+        raise
+    finally:
+        stack.pop()
+        io_end = _io_counters()
+        record["start_s"] = round(start - _RUN["start"], 3)
+        record["wall_s"] = round(time.perf_counter() - start, 3)
+        # Process-wide: includes dask worker threads and spans running concurrently in other threads
+        record["cpu_s"] = round(time.process_time() - cpu_start, 3)
+        if io_start and io_end:
+            record["read_mb"] = round((io_end["read"] - io_start["read"]) / 1024**2, 2)
+            record["written_mb"] = round((io_end["written"] - io_start["written"]) / 1024**2, 2)
+        record["rss_mb"] = _rss_mb()
+        record["peak_rss_mb"] = _peak_rss_mb()
+        slowest = sorted(record["task_seconds"].items(), key=lambda item: -item[1])[:TOP_TASK_PREFIXES]
+        record["task_seconds"] = {prefix: round(seconds, 3) for prefix, seconds in slowest}
+        with _LOCK:
+            _RUN["spans"].append(record)
+        if record["parent"] is None:
+            print(f"[{' '.join([name] + [str(value) for value in info.values()])}] {record['wall_s']:.2f} s")
+
+def timed(name: str, func: Callable[[], T]) -> T:
+    # For code inside dask tasks (e.g. one index of a fused kernel); seconds are summed over blocks and threads
+    if not _RUN:
+        return func()
+    start = time.perf_counter()
+    try:
+        return func()
+    finally:
+        elapsed = time.perf_counter() - start
+        with _LOCK:
+            entry = _RUN["kernels"].setdefault(name, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += elapsed
+            entry["calls"] += 1
+
+@contextmanager
+def instrumented_run(report_path: Optional[str], profile_stage: Optional[str] = None, profile_mode: ProfileMode = 'cprofile',
+                     config: Optional[Dict] = None) -> Iterator[Dict]:
+    if report_path is None:
+        yield {}
+        return
+
+    report_path = Path(report_path)
+    os.makedirs(report_path.parent, exist_ok=True)
+    _RUN.update(start=time.perf_counter(), io=_io_counters(), spans=[], kernels={}, profiles={}, profile_stage=profile_stage,
+                profile_mode=profile_mode, profile_base=str(report_path.with_suffix('')))
+    report = {
+        "started": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "config": config or {},
+        "scheduler": str(dask.config.get('scheduler', None) or 'threads'),
+        "environment": environment(),
+    }
+    stats = _DaskStats()
+    stats.register()
+    report["status"] = "completed"
+    try:
+        yield report
+    except BaseException as exc:
+        report["status"] = "failed"
+        report["error"] = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        stats.unregister()
+        report["finished"] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        report["wall_s"] = round(time.perf_counter() - _RUN["start"], 3)
+        report["peak_rss_mb"] = _peak_rss_mb()
+        io_end = _io_counters()
+        if _RUN["io"] and io_end:
+            report["read_mb"] = round((io_end["read"] - _RUN["io"]["read"]) / 1024**2, 2)
+            report["written_mb"] = round((io_end["written"] - _RUN["io"]["written"]) / 1024**2, 2)
+        report["spans"] = sorted(_RUN["spans"], key=lambda record: record["start_s"])
+        # Time inside kernels run on dask's threads; work in worker processes is not included
+        report["kernel_seconds"] = {name: {"seconds": round(entry["seconds"], 3), "calls": entry["calls"]}
+                                    for name, entry in sorted(_RUN["kernels"].items(), key=lambda item: -item[1]["seconds"])}
+        report["profiles"] = _RUN["profiles"]
+        _RUN.clear()
+
+        tmp_path = report_path.with_name(f".{report_path.name}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
+        os.replace(tmp_path, report_path)
+        print(f"Run report written to: {report_path}")
@@ -0,0 +1,87 @@
+import xarray as xr
+import numpy as np
+import json
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Literal, Optional, Union
+
+Precision = Literal['float32', 'float64']
+Compression = Literal['zlib', 'zstd', 'none']
+
+COUNT_UNITS = ('days', 'count') # whole numbers, stored as int16 with a fill value and a unit scale factor
+# Stored as int16 with scale_factor 0.01 (±327.67, 0.005 resolution); Kelvin values would overflow this range and stay float
+PACKED_UNITS = ('°C', 'degC')
+PACK_SCALE = np.float32(0.01)
+INT16_FILL = np.int16(-32768)
+
+# Process-wide, like the dask scheduler: set once per run by precision_policy()
+_POLICY: Dict[str, Union[str, bool]] = {'precision': 'float32', 'packing': True, 'compression': 'zlib'}
+
+@contextmanager
+def precision_policy(precision: Precision = 'float32', packing: bool = True, compression: Compression = 'zlib') -> Iterator[None]:
+    previous = dict(_POLICY)
+    _POLICY.update(precision=precision, packing=packing, compression=compression)
+    try:
+        yield
+    finally:
+        _POLICY.clear()
+        _POLICY.update(previous)
+
+def compute_dtype() -> np.dtype:
+    # Daily fields are cleaned into this dtype; every temperature and precipitation kernel then runs in it
+    return np.dtype(_POLICY['precision'])
+
+def storage_encoding(da: xr.DataArray, integer_counts: bool = True) -> Dict:
+    # dtype / packing part of the on-disk encoding of one result variable; compression is added by the writer
+    if da.dtype.kind != 'f':
+        return {}
+    units = str(da.attrs.get('units', '')).strip()
+    if integer_counts and units in COUNT_UNITS:
+        # Without a scale factor xarray reads integer 'days' with a fill value back as timedeltas (NaT) instead of NaN
+        return {'dtype': 'int16', 'scale_factor': np.float32(1.0), 'add_offset': np.float32(0.0), '_FillValue': INT16_FILL}
+    if _POLICY['packing'] and units in PACKED_UNITS:
+        return {'dtype': 'int16', 'scale_factor': PACK_SCALE, 'add_offset': np.float32(0.0), '_FillValue': INT16_FILL}
+    if _POLICY['precision'] == 'float32':
+        return {'dtype': 'float32'}
+    return {}
+
+def compression_encoding(complevel: int) -> Dict:
+    if complevel <= 0 or _POLICY['compression'] == 'none':
+        return {}
+    if _POLICY['compression'] == 'zstd':
+        return {'compression': 'zstd', 'complevel': complevel}
+    return {'zlib': True, 'complevel': complevel}
+
+def precision_report(reference: xr.Dataset, saved_path: str, report_path: Optional[str] = None) -> Dict[str, Dict]:
+    # Largest deviation of the saved (decoded) result from a float64 run, per variable
+    saved_path = Path(saved_path)
+    engine = 'zarr' if saved_path.suffix == '.zarr' else None
+    report: Dict[str, Dict] = {}
+    with xr.open_dataset(saved_path, engine=engine) as saved:
+        for name, ref in reference.data_vars.items():
+            if name not in saved.data_vars:
+                continue
+            ref = ref.astype(np.float64).values
+            got = saved[name].astype(np.float64).values
+            both = ~np.isnan(ref) & ~np.isnan(got)
+            deviation = np.abs(got - ref)[both]
+            scale = np.abs(ref)[both]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                relative = np.where(scale > 0, deviation / scale, 0.0)
+            scale_factor = saved[name].encoding.get('scale_factor')
+            report[name] = {
+                "stored_as": str(saved[name].encoding.get('dtype', saved[name].dtype)),
+                "scale_factor": float(scale_factor) if scale_factor is not None else None,
+                "max_abs_deviation": float(deviation.max()) if deviation.size else 0.0,
+                "max_rel_deviation": float(relative.max()) if relative.size else 0.0,
+                "nan_mismatches": int((np.isnan(ref) != np.isnan(got)).sum()),
+                "units": reference[name].attrs.get('units', ''),
+            }
+    report_path = report_path or str(saved_path.with_name(f"{saved_path.stem}_precision.json"))
+    with open(report_path, 'w') as f:
+        json.dump({"policy": dict(_POLICY), "output": str(saved_path), "variables": report}, f, indent=1)
+    worst = max(report.items(), key=lambda item: item[1]['max_abs_deviation'], default=None)
+    if worst:
+        print(f"Precision report written to: {report_path} (largest deviation {worst[1]['max_abs_deviation']:.3g} "
+              f"{worst[1]['units']} in {worst[0]})")
+    return report
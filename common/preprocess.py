@@ -0,0 +1,116 @@
+import xarray as xr
+import numpy as np
+from typing import Literal, Optional, Tuple
+from time_segments import calendar_fields
+from precision import compute_dtype
+
+def lon_to_grid(value: float, lon: xr.DataArray) -> float:
+    # Express a longitude in the grid's own convention (0–360 or -180–180)
+    if float(lon.max()) > 180 and value < 0:
+        return value + 360
+    if float(lon.min()) < 0 and value > 180:
+        return value - 360
+    return value
+
+def _coord_slice(coord: xr.DataArray, low: Optional[float], high: Optional[float]) -> slice:
+    if coord.size > 1 and float(coord[0]) > float(coord[-1]):
+        return slice(high, low)
+    return slice(low, high)
+
+def spatial_subset(ds: xr.Dataset, lat_range: Tuple[float, float], lon_range: Tuple[float, float], verbose: bool = True) -> xr.Dataset:
+    lat_min, lat_max = lat_range
+    lon_min, lon_max = lon_range
+    ds_sel = ds.sel(lat=_coord_slice(ds['lat'], lat_min, lat_max))
+
+    grid_min, grid_max = lon_to_grid(lon_min, ds['lon']), lon_to_grid(lon_max, ds['lon'])
+    if lon_max - lon_min >= 360:
+        pass
+    elif grid_min <= grid_max:
+        ds_sel = ds_sel.sel(lon=_coord_slice(ds['lon'], grid_min, grid_max))
+    else:
+        # The box crosses the grid's longitude seam: join both pieces in the requested convention
+        west = ds_sel.sel(lon=_coord_slice(ds['lon'], grid_min, None))
+        east = ds_sel.sel(lon=_coord_slice(ds['lon'], None, grid_max))
+        if lon_min < 0:
+            west = west.assign_coords(lon=west['lon'] - 360)
+        else:
+            east = east.assign_coords(lon=east['lon'] + 360)
+        ds_sel = xr.concat([west, east], dim='lon')
+    if verbose:
+        print(f"Cut area: lat={lat_min}–{lat_max}, lon={lon_min}–{lon_max}")
+    return ds_sel
+
+def time_subset(ds: xr.Dataset, period: Optional[Tuple[int, int]] = None, verbose: bool = True) -> xr.Dataset:
+    if period is not None:
+        start_year, end_year = period
+    else:
+        years = np.unique(calendar_fields(ds["time"])[0])
+        start_year = int(years.min())
+        end_year   = int(years.max())
+    ds_sel = ds.sel(time=slice(f"{start_year:04d}", f"{end_year:04d}"))
+    if verbose:
+        print(f"Filtered time data{' automatically' if period is None else ''}: {start_year} → {end_year}")
+    return ds_sel
+
+def _unit_conversion(var: str, units: str) -> Tuple[float, float, str]:
+    units = units.strip()
+    if 'tas' in var.lower() and units.lower().startswith('k'):
+        return 1.0, -273.15, '°C'
+    if var.lower() == 'pr' and units.replace(' ', '') in ('kgm-2s-1', 'kg/m2/s', 'kgm**-2s**-1'):
+        return 86400.0, 0.0, 'mm/day'
+    return 1.0, 0.0, units
+
+def _clean_block(data: np.ndarray, scale: float, offset: float, static_zero: bool, dtype: np.dtype) -> Tuple[np.ndarray, np.ndarray]:
+    # Spikes/fill values, unit conversion and static-zero cells in one pass over the block, in the policy dtype
+    with np.errstate(invalid='ignore'):
+        out = np.where(np.abs(data) < 1e10, data, np.nan).astype(dtype, copy=False)
+    if offset:
+        out += offset
+    if scale != 1.0:
+        out *= scale
+    valid = (~np.isnan(out)).any(axis=-1)
+    if static_zero:
+        zero = valid & (np.nansum(out, axis=-1) == 0)
+        out[zero] = np.nan
+        valid &= ~zero
+    return out, valid
+
+def clean_dataset(ds: xr.Dataset, nan_method: Literal['keep'] = 'keep', verbose: bool = True) -> xr.Dataset:
+    # One mask per variable, so a cell missing one input only masks the results computed from that input
+    masks = {}
+    dtype = compute_dtype()
+    for var in ds.data_vars:
+        arr = ds[var]
+        if 'time' not in arr.dims:
+            continue
+        if arr.chunks is not None:
+            arr = arr.chunk({'time': -1})
+        scale, offset, units = _unit_conversion(var, arr.attrs.get('units', ''))
+        cleaned, valid = xr.apply_ufunc(
+            _clean_block, arr,
+            kwargs={'scale': scale, 'offset': offset, 'static_zero': nan_method == 'keep', 'dtype': dtype},
+            input_core_dims=[['time']],
+            output_core_dims=[['time'], []],
+            dask='parallelized',
+            output_dtypes=[dtype, bool],
+        )
+        cleaned = cleaned.transpose(*arr.dims)
+        cleaned.attrs = {**arr.attrs, 'units': units}
+        cleaned.encoding = arr.encoding
+        ds[var] = cleaned
+        masks[f"valid_mask_{var}"] = valid.astype(bool)
+
+    ds = ds.assign_coords(masks)
+    if verbose:
+        print("Units normalized, spike errors and static cells removed.")
+    return ds
+
+def combine_preprocess(ds: xr.Dataset, lat_range: Tuple[float, float], lon_range: Tuple[float, float], nan_method: Literal['keep'] = 'keep',
+                       verbose: bool = True, period: Optional[Tuple[int, int]] = None) -> xr.Dataset:
+    # Crop first so the cleaning pass only touches the study area
+    ds = spatial_subset(ds, lat_range, lon_range, verbose)
+    ds = time_subset(ds, period, verbose)
+    ds = clean_dataset(ds, nan_method, verbose)
+    if verbose:
+        print("Preprocessing completed!")
+    return ds
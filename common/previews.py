@@ -0,0 +1,66 @@
+import xarray as xr
+import numpy as np
+import dask
+from pathlib import Path
+from typing import Dict, Optional
+from writers import save_previews
+
+PREVIEW_LEVELS = 3
+COARSEN_FACTOR = 2
+HISTOGRAM_BINS = 40
+
+def _gridded(ds: xr.Dataset) -> xr.Dataset:
+    names = [name for name, da in ds.data_vars.items() if set(da.dims) == {'time', 'lat', 'lon'}]
+    ds = ds[names]
+    return ds.drop_vars([name for name in ds.coords if name not in ds.dims and name != 'season'])
+
+def _climatology(ds: xr.Dataset) -> xr.Dataset:
+    clim = ds.mean(dim='time', skipna=True, keep_attrs=True)
+    return clim.rename({name: f"{name}_climatology" for name in clim.data_vars})
+
+def _histogram(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    return np.histogram(values[np.isfinite(values)], bins=edges)[0]
+
+def _histograms(ds: xr.Dataset, bins: int) -> xr.Dataset:
+    bounds = dask.compute({name: (da.min(), da.max()) for name, da in ds.data_vars.items()})[0]
+    out: Dict[str, xr.DataArray] = {}
+    for name, da in ds.data_vars.items():
+        low, high = (float(v) for v in bounds[name])
+        if not np.isfinite(low):
+            continue
+        edges = np.linspace(low, high if high > low else low + 1.0, bins + 1)
+        counts = xr.apply_ufunc(
+            _histogram, da.chunk({'lat': -1, 'lon': -1}) if da.chunks is not None else da,
+            kwargs={'edges': edges},
+            input_core_dims=[['lat', 'lon']],
+            output_core_dims=[['bin']],
+            vectorize=True,
+            dask='parallelized',
+            output_dtypes=[np.int64],
+            dask_gufunc_kwargs={'output_sizes': {'bin': bins}},
+        )
+        out[f"{name}_hist"] = counts.assign_attrs(long_name=f"Grid cells per {name} bin", units="count")
+        out[f"{name}_bin_edges"] = xr.DataArray(edges, dims='bin_edge', attrs={"units": da.attrs.get('units', '')})
+        out[f"{name}_area_mean"] = da.mean(dim=['lat', 'lon'], skipna=True).assign_attrs(da.attrs)
+    return xr.Dataset(out)
+
+def build_previews(ds: xr.Dataset, levels: int = PREVIEW_LEVELS, factor: int = COARSEN_FACTOR,
+                   bins: int = HISTOGRAM_BINS) -> Dict[Optional[str], xr.Dataset]:
+    ds = _gridded(ds)
+    groups: Dict[Optional[str], xr.Dataset] = {None: _histograms(ds, bins), 'level_0': _climatology(ds)}
+    for level in range(1, levels + 1):
+        step = factor ** level
+        if min(ds.sizes['lat'], ds.sizes['lon']) < step:
+            break
+        coarse = ds.coarsen(lat=step, lon=step, boundary='pad').mean(keep_attrs=True)
+        groups[f"level_{level}"] = xr.merge([coarse, _climatology(coarse)])
+    return groups
+
+def write_previews(output_path: str, levels: int = PREVIEW_LEVELS, factor: int = COARSEN_FACTOR, bins: int = HISTOGRAM_BINS) -> str:
+    output_path = Path(output_path)
+    engine = 'zarr' if output_path.suffix == '.zarr' else None
+    with xr.open_dataset(output_path, engine=engine, chunks={}) as ds:
+        groups = build_previews(ds, levels, factor, bins)
+        # One pass over the result for every level and histogram
+        groups = dict(zip(groups, dask.compute(*groups.values())))
+    return save_previews(groups, output_path.with_name(f"{output_path.stem}_preview.nc"))
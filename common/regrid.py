@@ -0,0 +1,201 @@
+import xarray as xr
+import numpy as np
+import dask.array
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple
+from grids import cell_edges, grid_digest
+from writers import _atomic_write
+
+# Bump when the weight computation changes so stale weights are not reused
+REGRID_VERSION = 1
+MIN_VALID_SHARE = 0.5 # target cells whose valid source weight falls below this share become NaN
+
+RegridMethod = Literal['conservative', 'bilinear']
+
+def _conservative_1d(source: np.ndarray, target: np.ndarray, sine: bool) -> np.ndarray:
+    # Overlap length of every (target, source) cell pair; in sin(lat) so latitude bands get their true area share
+    source_edges, target_edges = cell_edges(source), cell_edges(target)
+    if sine:
+        source_edges = np.sin(np.radians(np.clip(source_edges, -90, 90)))
+        target_edges = np.sin(np.radians(np.clip(target_edges, -90, 90)))
+    low = np.maximum(target_edges[:-1, None], source_edges[None, :-1])
+    high = np.minimum(target_edges[1:, None], source_edges[None, 1:])
+    return np.clip(high - low, 0.0, None)
+
+def _bilinear_1d(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    weights = np.zeros((target.size, source.size))
+    if source.size == 1:
+        weights[:, 0] = 1.0
+        return weights
+    upper = np.clip(np.searchsorted(source, target), 1, source.size - 1)
+    share = np.clip((target - source[upper - 1]) / (source[upper] - source[upper - 1]), 0.0, 1.0)
+    rows = np.arange(target.size)
+    weights[rows, upper - 1] = 1.0 - share
+    weights[rows, upper] += share
+    return weights
+
+def _weights_key(payload: Dict) -> str:
+    return hashlib.sha1(json.dumps({"version": REGRID_VERSION, **payload}, sort_keys=True).encode()).hexdigest()[:16]
+
+def regrid_weights(source_lat: np.ndarray, source_lon: np.ndarray, target_lat: np.ndarray, target_lon: np.ndarray,
+                   method: RegridMethod = 'conservative', cache_dir: Optional[str] = None) -> xr.Dataset:
+    # Sparse (target cell, source cell) weights as COO triplets sorted by target cell; rows sum to 1.
+    # Computed once per (source grid, target grid, method) and reused from the cache afterwards
+    payload = {"method": method, "source_lat": grid_digest(source_lat), "source_lon": grid_digest(source_lon),
+               "target_lat": grid_digest(target_lat), "target_lon": grid_digest(target_lon)}
+    weights_path = Path(cache_dir) / f"regrid_{_weights_key(payload)}.nc" if cache_dir else None
+    if weights_path is not None and weights_path.exists():
+        print(f"Regridding weights loaded from cache: {weights_path}")
+        with xr.open_dataset(weights_path) as cached:
+            return cached.load()
+
+    print(f"Computing {method} weights from the {source_lat.size}x{source_lon.size} grid to the {target_lat.size}x{target_lon.size} grid...")
+    # Both grids are rectilinear, so the 2-D weights are the outer product of a latitude and a longitude factor
+    lat_order, lon_order = np.argsort(source_lat), np.argsort(source_lon)
+    target_lat_order, target_lon_order = np.argsort(target_lat), np.argsort(target_lon)
+    if method == 'conservative':
+        lat_w = _conservative_1d(source_lat[lat_order], target_lat[target_lat_order], sine=True)
+        lon_w = _conservative_1d(source_lon[lon_order], target_lon[target_lon_order], sine=False)
+    elif method == 'bilinear':
+        lat_w = _bilinear_1d(source_lat[lat_order], target_lat[target_lat_order])
+        lon_w = _bilinear_1d(source_lon[lon_order], target_lon[target_lon_order])
+    else:
+        raise ValueError(f"Unknown regridding method: {method}")
+
+    # Back to the original (possibly descending) order of both grids
+    lat_w = lat_w[np.argsort(target_lat_order)][:, np.argsort(lat_order)]
+    lon_w = lon_w[np.argsort(target_lon_order)][:, np.argsort(lon_order)]
+
+    target_rows, source_rows = np.nonzero(lat_w)
+    target_cols, source_cols = np.nonzero(lon_w)
+    target_cell = (target_rows[:, None] * target_lon.size + target_cols[None, :]).ravel()
+    source_cell = (source_rows[:, None] * source_lon.size + source_cols[None, :]).ravel()
+    weight = (lat_w[target_rows, source_rows][:, None] * lon_w[target_cols, source_cols][None, :]).ravel()
+    order = np.argsort(target_cell, kind='stable')
+    target_cell, source_cell, weight = target_cell[order], source_cell[order], weight[order]
+    total = np.bincount(target_cell, weights=weight, minlength=target_lat.size * target_lon.size)
+    weight = weight / total[target_cell]
+
+    weights = xr.Dataset(
+        {
+            "target_cell": ('entry', target_cell.astype(np.int64)),
+            "source_cell": ('entry', source_cell.astype(np.int64)),
+            "weight": ('entry', weight),
+        },
+        attrs={"method": method, "source_shape": [source_lat.size, source_lon.size],
+               "target_shape": [target_lat.size, target_lon.size], "payload": json.dumps(payload)},
+    )
+    if weights_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        _atomic_write(weights, weights_path, lambda ds, path: ds.to_netcdf(path, engine='netcdf4'))
+        print(f"Regridding weights cached at: {weights_path}")
+    return weights
+
+def _regrid_block(block: np.ndarray, target_cell: np.ndarray, source_cell: np.ndarray, weight: np.ndarray,
+                  target_shape: Tuple[int, int]) -> np.ndarray:
+    # Sparse matmul over the last two axes: gather the source cells, then a segmented sum per target cell.
+    # Missing sources drop out and the remaining weights are renormalised
+    values = block.reshape(block.shape[:-2] + (-1,))[..., source_cell].astype(np.float64)
+    valid = ~np.isnan(values)
+    cells, starts = np.unique(target_cell, return_index=True)
+    total = np.add.reduceat(np.where(valid, values, 0.0) * weight, starts, axis=-1) if cells.size else 0.0
+    covered = np.add.reduceat(valid * weight, starts, axis=-1) if cells.size else 0.0
+    out = np.full(block.shape[:-2] + (target_shape[0] * target_shape[1],), np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[..., cells] = np.where(covered >= MIN_VALID_SHARE, total / covered, np.nan)
+    return out.reshape(block.shape[:-2] + target_shape).astype(block.dtype if block.dtype.kind == 'f' else np.float64)
+
+def _split(size: int, parts: int) -> Tuple[int, ...]:
+    parts = max(min(parts, size), 1)
+    return tuple(np.diff(np.linspace(0, size, parts + 1).round().astype(int)))
+
+def apply_weights(da: xr.DataArray, weights: xr.Dataset, target_lat: xr.DataArray, target_lon: xr.DataArray) -> xr.DataArray:
+    # Each target block only reads the source rows and columns its weights touch, so a chunked source stays chunked
+    # and an unchunked one (tiled or batch loads) is never read in full
+    da = da.transpose(..., 'lat', 'lon')
+    if da.chunks is None:
+        da = da.chunk({'lat': 'auto', 'lon': 'auto'})
+    target_cell, source_cell, weight = weights['target_cell'].values, weights['source_cell'].values, weights['weight'].values
+    n_lon, n_target_lon = da.sizes['lon'], target_lon.size
+    source_rows, source_cols = source_cell // n_lon, source_cell % n_lon
+    target_rows, target_cols = target_cell // n_target_lon, target_cell % n_target_lon
+
+    def regrid_part(data, row_range: Tuple[int, int], col_range: Tuple[int, int]):
+        keep = ((target_rows >= row_range[0]) & (target_rows < row_range[1])
+                & (target_cols >= col_range[0]) & (target_cols < col_range[1]))
+        shape = (row_range[1] - row_range[0], col_range[1] - col_range[0])
+        dtype = data.dtype if data.dtype.kind == 'f' else np.float64
+        if not keep.any():
+            return dask.array.full(data.shape[:-2] + shape, np.nan, dtype=dtype, chunks=data.chunks[:-2] + shape)
+        r0, r1 = source_rows[keep].min(), source_rows[keep].max() + 1
+        c0, c1 = source_cols[keep].min(), source_cols[keep].max() + 1
+        local_target = (target_rows[keep] - row_range[0]) * shape[1] + target_cols[keep] - col_range[0]
+        local_source = (source_rows[keep] - r0) * (c1 - c0) + source_cols[keep] - c0
+        kwargs = {'target_cell': local_target, 'source_cell': local_source, 'weight': weight[keep], 'target_shape': shape}
+        piece = data[..., r0:r1, c0:c1]
+        piece = piece.rechunk(piece.chunks[:-2] + ((r1 - r0,), (c1 - c0,)))
+        return piece.map_blocks(_regrid_block, chunks=piece.chunks[:-2] + ((shape[0],), (shape[1],)), dtype=dtype, **kwargs)
+
+    row_edges = np.cumsum((0,) + _split(target_lat.size, len(da.chunks[-2])))
+    col_edges = np.cumsum((0,) + _split(n_target_lon, len(da.chunks[-1])))
+    regridded = dask.array.block([[regrid_part(da.data, (row_edges[i], row_edges[i + 1]), (col_edges[j], col_edges[j + 1]))
+                                   for j in range(len(col_edges) - 1)] for i in range(len(row_edges) - 1)])
+
+    coords = {name: coord for name, coord in da.coords.items() if 'lat' not in coord.dims and 'lon' not in coord.dims}
+    return xr.DataArray(regridded, dims=da.dims, coords={**coords, 'lat': target_lat.values, 'lon': target_lon.values},
+                        name=da.name, attrs=da.attrs)
+
+def _same_grid(ds: xr.Dataset, lat: np.ndarray, lon: np.ndarray) -> bool:
+    return (ds.sizes['lat'] == lat.size and ds.sizes['lon'] == lon.size
+            and np.allclose(ds['lat'].values, lat, atol=1e-6) and np.allclose(ds['lon'].values, lon, atol=1e-6))
+
+def _lon_like(ds: xr.Dataset, lon: np.ndarray) -> xr.Dataset:
+    # Puts a source on the target's longitude convention (0..360 or -180..180)
+    if lon.min() < 0 and float(ds['lon'].max()) > 180:
+        return ds.assign_coords(lon=((ds['lon'] + 180) % 360) - 180).sortby('lon')
+    if lon.max() > 180 and float(ds['lon'].min()) < 0:
+        return ds.assign_coords(lon=ds['lon'] % 360).sortby('lon')
+    return ds
+
+def align_to_grid(datasets: List[xr.Dataset], method: RegridMethod = 'conservative',
+                  cache_dir: Optional[str] = None) -> List[xr.Dataset]:
+    # Puts every dataset on the grid of the first, cropped to the area all of them cover, instead of
+    # letting an outer join pad the union of the grids with NaN rows and columns
+    if len(datasets) < 2:
+        return datasets
+    reference = datasets[0]
+    lat, lon = reference['lat'].values, reference['lon'].values
+    if all(_same_grid(ds, lat, lon) for ds in datasets[1:]):
+        return datasets
+
+    sources = [_lon_like(ds, lon) for ds in datasets]
+    keep_lat = np.ones(lat.size, dtype=bool)
+    keep_lon = np.ones(lon.size, dtype=bool)
+    for ds in sources[1:]:
+        # Conservative weights cover target cells whose centre lies in a source cell; bilinear ones need source points around it
+        span_lat = cell_edges(np.sort(ds['lat'].values)) if method == 'conservative' else np.sort(ds['lat'].values)
+        span_lon = cell_edges(np.sort(ds['lon'].values)) if method == 'conservative' else np.sort(ds['lon'].values)
+        keep_lat &= (lat >= span_lat[0]) & (lat <= span_lat[-1])
+        keep_lon &= (lon >= span_lon[0]) & (lon <= span_lon[-1])
+    if not keep_lat.any() or not keep_lon.any():
+        raise ValueError("The input datasets do not overlap in space.")
+    target = reference.isel(lat=keep_lat, lon=keep_lon)
+    print(f"Inputs are on different grids: regridding ({method}) to the {target.sizes['lat']}x{target.sizes['lon']} grid of "
+          f"{list(reference.data_vars)}.")
+
+    aligned = [target]
+    for ds in sources[1:]:
+        if _same_grid(ds, target['lat'].values, target['lon'].values):
+            aligned.append(ds.assign_coords(lat=target['lat'], lon=target['lon']))
+            continue
+        weights = regrid_weights(ds['lat'].values, ds['lon'].values, target['lat'].values, target['lon'].values, method, cache_dir)
+        gridded = {name: apply_weights(da, weights, target['lat'], target['lon']) for name, da in ds.data_vars.items()
+                   if {'lat', 'lon'} <= set(da.dims)}
+        for name, da in gridded.items():
+            da.encoding.update({key: ds[name].encoding[key] for key in ('source', 'source_files') if key in ds[name].encoding})
+        others = {name: da for name, da in ds.data_vars.items() if not {'lat', 'lon'} <= set(da.dims)}
+        aligned.append(xr.Dataset({**gridded, **others}, attrs=ds.attrs))
+    return aligned
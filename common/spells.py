@@ -0,0 +1,39 @@
+import numpy as np
+from typing import Tuple
+
+def _segment_starts(n_time: int, starts: np.ndarray) -> np.ndarray:
+    edges = np.zeros(n_time, dtype=bool)
+    edges[starts] = True
+    return edges
+
+def _running_length(mask: np.ndarray, resets: np.ndarray) -> np.ndarray:
+    # Length of the run ending at each step (0 where mask is False), restarting at resets
+    idx = np.arange(mask.shape[-1], dtype=np.int32)
+    last_break = np.where(resets, idx - 1, -1).astype(np.int32)
+    last_break = np.where(mask, last_break, idx)
+    return idx - np.maximum.accumulate(last_break, axis=-1)
+
+def run_lengths(mask: np.ndarray, starts: np.ndarray, span_years: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    n_time = mask.shape[-1]
+    if span_years:
+        first = last = np.zeros(n_time, dtype=bool)
+    else:
+        first = _segment_starts(n_time, starts)
+        last = np.roll(first, -1)
+    forward = _running_length(mask, first)
+    backward = _running_length(mask[..., ::-1], last[::-1])[..., ::-1]
+    total = np.where(mask, forward + backward - 1, 0)
+    return forward, total
+
+def longest_run(mask: np.ndarray, starts: np.ndarray, span_years: bool = False) -> np.ndarray:
+    forward, _ = run_lengths(mask, starts, span_years)
+    return np.maximum.reduceat(forward, starts, axis=-1).astype(np.float64)
+
+def days_in_runs(mask: np.ndarray, starts: np.ndarray, min_length: int, span_years: bool = False) -> np.ndarray:
+    _, total = run_lengths(mask, starts, span_years)
+    return np.add.reduceat(total >= min_length, starts, axis=-1, dtype=np.float64)
+
+def run_count(mask: np.ndarray, starts: np.ndarray, min_length: int = 1, span_years: bool = False) -> np.ndarray:
+    forward, total = run_lengths(mask, starts, span_years)
+    run_end = (forward > 0) & (forward == total)
+    return np.add.reduceat(run_end & (total >= min_length), starts, axis=-1, dtype=np.float64)
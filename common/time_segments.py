@@ -0,0 +1,82 @@
+import xarray as xr
+import numpy as np
+import pandas as pd
+from typing import Dict, Literal, Sequence, Tuple
+
+Frequency = Literal['annual', 'seasonal', 'monthly']
+
+# Labels follow the matching pandas/xarray resample rule: year end, season start (DJF starts in December), month start
+FREQUENCIES: Dict[str, str] = {'annual': 'YE', 'seasonal': 'QS-DEC', 'monthly': 'MS'}
+SEASON_START_MONTHS = (12, 3, 6, 9)
+
+def calendar_fields(time: xr.DataArray) -> Tuple[np.ndarray, np.ndarray]:
+    values = np.asarray(time.values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        years = values.astype('datetime64[Y]').astype(np.int64) + 1970
+        months = values.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        return years, months
+    # cftime dates (noleap, 360_day, ...): read the fields once, no per-date arithmetic or object resampling
+    years = np.fromiter((date.year for date in values), np.int64, len(values))
+    months = np.fromiter((date.month for date in values), np.int64, len(values))
+    return years, months
+
+def period_codes(years: np.ndarray, months: np.ndarray, freq: Frequency = 'annual') -> np.ndarray:
+    if freq == 'annual':
+        return years
+    if freq == 'seasonal':
+        # December belongs to the following year's DJF season
+        return (years + (months == 12)) * 4 + (months % 12) // 3
+    if freq == 'monthly':
+        return years * 12 + months - 1
+    raise ValueError(f"Unknown frequency '{freq}', expected one of {list(FREQUENCIES)}")
+
+def _label_fields(codes: np.ndarray, freq: Frequency) -> Tuple[np.ndarray, np.ndarray]:
+    if freq == 'annual':
+        return codes, np.full(len(codes), 12)
+    if freq == 'seasonal':
+        quarter = codes % 4
+        return codes // 4 - (quarter == 0), np.array(SEASON_START_MONTHS)[quarter]
+    return codes // 12, codes % 12 + 1
+
+def period_labels(time: xr.DataArray, codes: np.ndarray, freq: Frequency = 'annual') -> xr.DataArray:
+    years, months = _label_fields(np.asarray(codes), freq)
+    values = np.asarray(time.values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        starts = pd.to_datetime({'year': years, 'month': months, 'day': 1})
+        labels = (starts + pd.offsets.MonthEnd(0)).values if freq == 'annual' else starts.values
+    else:
+        date_type = type(values[0])
+        days = [date_type(y, 12, 1).daysinmonth if freq == 'annual' else 1 for y in years]
+        labels = np.array([date_type(y, m, d) for y, m, d in zip(years, months, days)])
+    return xr.DataArray(labels, dims='time')
+
+def time_segments(time: xr.DataArray, freq: Frequency = 'annual') -> Tuple[np.ndarray, xr.DataArray]:
+    # Start index of every period along an ascending time axis, plus one time label per period
+    codes = period_codes(*calendar_fields(time), freq)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    return starts, period_labels(time, codes[starts], freq)
+
+def period_index(time: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    # Integer period of every time step, for groupby reductions
+    return xr.DataArray(period_codes(*calendar_fields(time), freq), dims='time', coords={'time': time}, name='period')
+
+def label_periods(reduced: xr.DataArray, time: xr.DataArray, freq: Frequency = 'annual') -> xr.DataArray:
+    # Replaces the integer 'period' dimension left by a groupby with the same time labels as time_segments
+    _, labels = time_segments(time, freq)
+    return reduced.rename({'period': 'time'}).assign_coords(time=labels.values)
+
+def nested_segments(time: xr.DataArray, freqs: Sequence[Frequency]) -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, xr.DataArray]]:
+    # Daily starts of the finest period needed, and for every frequency the starts of its periods along that finer axis;
+    # months nest in seasons and years (seasons do not nest in years), so several frequencies share a monthly base
+    freqs = list(dict.fromkeys(freqs))
+    finest = freqs[0] if len(freqs) == 1 else 'monthly'
+    years, months = calendar_fields(time)
+    fine_codes = period_codes(years, months, finest)
+    starts = np.flatnonzero(np.r_[True, fine_codes[1:] != fine_codes[:-1]])
+    groups: Dict[str, np.ndarray] = {}
+    labels: Dict[str, xr.DataArray] = {}
+    for freq in freqs:
+        codes = period_codes(years[starts], months[starts], freq)
+        groups[freq] = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        labels[freq] = period_labels(time, codes[groups[freq]], freq)
+    return starts, groups, labels
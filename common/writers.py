@@ -0,0 +1,96 @@
+import xarray as xr
+import dask
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Literal, Optional, Union
+from precision import compression_encoding, storage_encoding
+
+OutputFormat = Literal['netcdf', 'zarr', 'zarr-append']
+
+def _netcdf_encoding(ds: xr.Dataset, complevel: int, chunks: Optional[Dict[str, int]], integer_counts: bool = True) -> Dict[str, Dict]:
+    encoding: Dict[str, Dict] = {}
+    for name, da in ds.data_vars.items():
+        enc: Dict = {**storage_encoding(da, integer_counts), **compression_encoding(complevel)}
+        if chunks:
+            enc['chunksizes'] = tuple(min(chunks.get(dim, size), size) for dim, size in zip(da.dims, da.shape))
+        encoding[name] = enc
+    return encoding
+
+def _zarr_encoding(ds: xr.Dataset, integer_counts: bool = True) -> Dict[str, Dict]:
+    # Zarr keeps its own default compressor; only the dtype and packing follow the precision policy
+    encoding = {name: storage_encoding(da, integer_counts) for name, da in ds.data_vars.items()}
+    return {name: enc for name, enc in encoding.items() if enc}
+
+def _zarr_chunks(ds: xr.Dataset, chunks: Optional[Dict[str, int]]) -> Dict:
+    # Zarr needs regular chunks, so let dask pick them unless given explicitly. One chunk per time step keeps
+    # incremental updates, which rewrite or append single years, aligned with the chunks already in the store
+    return chunks or {dim: 1 if dim == 'time' else 'auto' for dim in ds.dims}
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+def _atomic_write(ds: xr.Dataset, output_path: Path, writer) -> None:
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    _remove(tmp_path)
+    try:
+        writer(ds, tmp_path)
+        if output_path.is_dir():
+            shutil.rmtree(output_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        _remove(tmp_path)
+
+def save_indices(ds_indices: xr.Dataset, output_filename: str, output_dir: str, fmt: OutputFormat = 'netcdf', complevel: int = 4,
+                 chunks: Optional[Dict[str, int]] = None, append_dim: str = 'time', integer_counts: bool = True) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = Path(output_dir) / output_filename
+
+    # Each module sets its own title (ETCCDI indices, heat-stress metrics, UHI intensity)
+    ds_indices.attrs["Conventions"] = "CF-1.7"
+
+    if fmt == 'netcdf':
+        if dask.config.get('scheduler', None) == 'processes':
+            # The NetCDF write lock cannot be shared with worker processes, so compute before writing
+            ds_indices = ds_indices.compute()
+        encoding = _netcdf_encoding(ds_indices, complevel, chunks, integer_counts)
+        _atomic_write(ds_indices, output_path, lambda ds, path: ds.to_netcdf(path, engine='netcdf4', encoding=encoding))
+    elif fmt == 'zarr-append' and output_path.exists():
+        ds_indices.chunk(_zarr_chunks(ds_indices, chunks)).to_zarr(output_path, append_dim=append_dim)
+    elif fmt in ('zarr', 'zarr-append'):
+        encoding = _zarr_encoding(ds_indices, integer_counts)
+        _atomic_write(ds_indices.chunk(_zarr_chunks(ds_indices, chunks)), output_path,
+                      lambda ds, path: ds.to_zarr(path, mode='w', consolidated=True, encoding=encoding))
+    else:
+        raise ValueError(f"Unknown output format: {fmt}")
+
+    print(f"\n Save {len(ds_indices.data_vars)} success indicators at: {output_path.resolve()}")
+    return str(output_path.resolve())
+
+def save_indices_to_netcdf(ds_indices: xr.Dataset, output_filename: str, output_dir: str, complevel: int = 4,
+                           chunks: Optional[Dict[str, int]] = None, integer_counts: bool = True) -> str:
+    return save_indices(ds_indices, output_filename, output_dir, 'netcdf', complevel, chunks, integer_counts=integer_counts)
+
+def init_zarr_store(template: xr.Dataset, store_path: str, chunks: Optional[Dict[str, int]] = None) -> None:
+    # Writes coordinates and array metadata only; data is filled later with write_zarr_region
+    template.attrs["Conventions"] = "CF-1.7"
+    template.chunk(_zarr_chunks(template, chunks)).to_zarr(store_path, mode='w', compute=False, consolidated=True,
+                                                           encoding=_zarr_encoding(template))
+
+def write_zarr_region(ds: xr.Dataset, store_path: str, region: Dict[str, slice]) -> None:
+    unrelated = [name for name, var in ds.variables.items() if not set(var.dims) & set(region)]
+    ds.drop_vars(unrelated).to_zarr(store_path, region=region, mode='r+')
+
+def save_previews(groups: Dict[Optional[str], xr.Dataset], preview_path: Union[str, Path]) -> str:
+    preview_path = Path(preview_path)
+
+    def writer(_, path: Path) -> None:
+        for k, (group, ds) in enumerate(groups.items()):
+            ds.to_netcdf(path, group=group, mode='w' if k == 0 else 'a', engine='netcdf4')
+
+    _atomic_write(None, preview_path, writer)
+    print(f" Save previews ({len(groups) - 1} levels) at: {preview_path.resolve()}")
+    return str(preview_path.resolve())
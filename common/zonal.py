@@ -0,0 +1,203 @@
+import xarray as xr
+import numpy as np
+import dask.array
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from grids import cell_edges, grid_digest
+from writers import _atomic_write, save_indices_to_netcdf
+
+# Bump when the weight computation changes so stale weights are not reused
+WEIGHTS_VERSION = 1
+SUPERSAMPLE = 10 # sub-points per cell edge for the fractional overlap of boundary cells
+EARTH_RADIUS_KM = 6371.0
+
+Ring = np.ndarray # (n, 2) lon/lat vertices
+Polygon = List[Ring] # exterior ring first, then holes
+
+def _polygons(geometry: Dict) -> List[Polygon]:
+    if geometry['type'] == 'Polygon':
+        return [[np.asarray(ring, dtype=np.float64)[:, :2] for ring in geometry['coordinates']]]
+    if geometry['type'] == 'MultiPolygon':
+        return [[np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon] for polygon in geometry['coordinates']]
+    raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+def read_regions(path: str, name_field: Optional[str] = None) -> Dict[str, List[Polygon]]:
+    # GeoJSON is read directly; shapefiles and other formats need geopandas
+    if Path(path).suffix.lower() in ('.geojson', '.json'):
+        with open(path) as f:
+            collection = json.load(f)
+    else:
+        try:
+            import geopandas
+        except ImportError as exc:
+            raise ImportError(f"Reading {Path(path).suffix} region files needs geopandas (pip install geopandas), "
+                              "or convert them to GeoJSON.") from exc
+        collection = geopandas.read_file(path).to_crs(4326).__geo_interface__
+
+    regions: Dict[str, List[Polygon]] = {}
+    for k, feature in enumerate(collection['features']):
+        properties = feature.get('properties') or {}
+        if name_field is None:
+            name_field = next((key for key in properties if key.lower() in ('name', 'name_1', 'name_2', 'varname_1')), None)
+        name = str(properties.get(name_field, k)) if name_field else str(k)
+        # Features sharing a name (e.g. islands stored separately) form one region
+        regions.setdefault(name, []).extend(_polygons(feature['geometry']))
+    return regions
+
+def cell_area_km2(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    # Exact area of each lat/lon cell on the sphere
+    lat_edges = np.radians(np.clip(cell_edges(np.sort(lat)), -90, 90))
+    lon_width = np.radians(np.abs(np.diff(cell_edges(np.sort(lon)))))
+    band = EARTH_RADIUS_KM ** 2 * np.abs(np.diff(np.sin(lat_edges)))
+    order_lat, order_lon = np.argsort(np.argsort(lat)), np.argsort(np.argsort(lon))
+    return band[order_lat][:, None] * lon_width[order_lon][None, :]
+
+def _inside(points: np.ndarray, polygon: Polygon) -> np.ndarray:
+    from matplotlib.path import Path as MplPath
+
+    inside = MplPath(polygon[0]).contains_points(points)
+    for hole in polygon[1:]:
+        inside &= ~MplPath(hole).contains_points(points)
+    return inside
+
+def overlap_fractions(polygons: List[Polygon], lat: np.ndarray, lon: np.ndarray,
+                      supersample: int = SUPERSAMPLE) -> Tuple[np.ndarray, np.ndarray]:
+    # Share of every cell in the region's bounding box covered by the region, from supersampled cell points
+    lat_order, lon_order = np.argsort(lat), np.argsort(lon)
+    lat_edges, lon_edges = cell_edges(lat[lat_order]), cell_edges(lon[lon_order])
+    vertices = np.concatenate([polygon[0] for polygon in polygons])
+    if lon.max() > 180:
+        polygons = [[np.column_stack([ring[:, 0] % 360, ring[:, 1]]) for ring in polygon] for polygon in polygons]
+        vertices = np.column_stack([vertices[:, 0] % 360, vertices[:, 1]])
+    rows = np.flatnonzero((lat_edges[1:] > vertices[:, 1].min()) & (lat_edges[:-1] < vertices[:, 1].max()))
+    cols = np.flatnonzero((lon_edges[1:] > vertices[:, 0].min()) & (lon_edges[:-1] < vertices[:, 0].max()))
+    if rows.size == 0 or cols.size == 0:
+        return np.array([], dtype=np.int64), np.array([])
+
+    step = (np.arange(supersample) + 0.5) / supersample
+    sub_lat = (lat_edges[rows, None] + step[None, :] * np.diff(lat_edges)[rows, None]).ravel()
+    sub_lon = (lon_edges[cols, None] + step[None, :] * np.diff(lon_edges)[cols, None]).ravel()
+    points = np.column_stack([np.tile(sub_lon, sub_lat.size), np.repeat(sub_lat, sub_lon.size)])
+    inside = np.zeros(len(points), dtype=bool)
+    for polygon in polygons:
+        inside |= _inside(points, polygon)
+    fraction = inside.reshape(rows.size, supersample, cols.size, supersample).mean(axis=(1, 3))
+
+    i, j = np.nonzero(fraction)
+    cells = lat_order[rows[i]] * lon.size + lon_order[cols[j]]
+    return cells, fraction[i, j]
+
+def _weights_key(payload: Dict) -> str:
+    return hashlib.sha1(json.dumps({"version": WEIGHTS_VERSION, **payload}, sort_keys=True, default=list).encode()).hexdigest()[:16]
+
+def region_weights(regions_path: str, lat: xr.DataArray, lon: xr.DataArray, cache_dir: Optional[str] = None,
+                   name_field: Optional[str] = None, supersample: int = SUPERSAMPLE) -> xr.Dataset:
+    # Sparse (region, cell) weights: overlap fraction times cell area, as COO triplets sorted by region.
+    # Computed once per (region file, grid) and reused from the cache afterwards
+    stat = os.stat(regions_path)
+    payload = {"regions": [str(Path(regions_path).resolve()), stat.st_size, stat.st_mtime_ns], "name_field": name_field,
+               "lat": grid_digest(lat.values), "lon": grid_digest(lon.values), "supersample": supersample}
+    weights_path = Path(cache_dir) / f"weights_{_weights_key(payload)}.nc" if cache_dir else None
+    if weights_path is not None and weights_path.exists():
+        print(f"Zonal weights loaded from cache: {weights_path}")
+        with xr.open_dataset(weights_path) as cached:
+            return cached.load()
+
+    regions = read_regions(regions_path, name_field)
+    print(f"Computing overlap weights of {len(regions)} regions on the {lat.size}x{lon.size} grid...")
+    area = cell_area_km2(lat.values, lon.values).ravel()
+    region_index, cell, weight = [], [], []
+    for k, polygons in enumerate(regions.values()):
+        cells, fraction = overlap_fractions(polygons, lat.values, lon.values, supersample)
+        region_index.append(np.full(cells.size, k, dtype=np.int32))
+        cell.append(cells)
+        weight.append(fraction * area[cells])
+    region_index, cell, weight = np.concatenate(region_index), np.concatenate(cell), np.concatenate(weight)
+    region_area = np.bincount(region_index, weights=weight, minlength=len(regions))
+    empty = [name for name, total in zip(regions, region_area) if total == 0]
+    if empty:
+        print(f"Warning: {len(empty)} regions do not overlap the grid: {empty[:5]}{' ...' if len(empty) > 5 else ''}")
+
+    weights = xr.Dataset(
+        {
+            "region_index": ('entry', region_index),
+            "cell": ('entry', cell.astype(np.int64)),
+            "weight": ('entry', weight, {"long_name": "Overlap area of region and cell", "units": "km2"}),
+            "region_area": ('region', region_area, {"long_name": "Region area covered by the grid", "units": "km2"}),
+        },
+        coords={'region': list(regions)},
+        attrs={"n_lat": lat.size, "n_lon": lon.size, "payload": json.dumps(payload)},
+    )
+    if weights_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        _atomic_write(weights, weights_path, lambda ds, path: ds.to_netcdf(path, engine='netcdf4'))
+        print(f"Zonal weights cached at: {weights_path}")
+    return weights
+
+def _zonal_block(block: np.ndarray, lat_start: int, lon_start: int, n_lon: int, region_index: np.ndarray, cell: np.ndarray,
+                 weight: np.ndarray, n_regions: int) -> np.ndarray:
+    # Weighted sums and valid-data weights of every region over the cells of one (..., lat, lon) block: a sparse matmul
+    # done as a gather of the block's cells followed by a segmented sum per region
+    n_lat_b, n_lon_b = block.shape[-2:]
+    row, col = cell // n_lon - lat_start, cell % n_lon - lon_start
+    here = (row >= 0) & (row < n_lat_b) & (col >= 0) & (col < n_lon_b)
+    out = np.zeros(block.shape[:-2] + (2 * n_regions,))
+    if here.any():
+        values = block.reshape(block.shape[:-2] + (-1,))[..., row[here] * n_lon_b + col[here]].astype(np.float64)
+        valid = ~np.isnan(values)
+        regions, starts = np.unique(region_index[here], return_index=True)
+        out[..., regions] = np.add.reduceat(np.where(valid, values, 0.0) * weight[here], starts, axis=-1)
+        out[..., n_regions + regions] = np.add.reduceat(valid * weight[here], starts, axis=-1)
+    return out
+
+def zonal_means(ds: xr.Dataset, weights: xr.Dataset) -> xr.Dataset:
+    # Area-weighted mean of every gridded variable per region; NaN cells are left out and the rest renormalised
+    region_index, cell, weight = weights['region_index'].values, weights['cell'].values, weights['weight'].values
+    n_regions = weights.sizes['region']
+    out: Dict[str, xr.DataArray] = {}
+    for name, da in ds.data_vars.items():
+        if not {'lat', 'lon'} <= set(da.dims):
+            continue
+        da = da.transpose(..., 'lat', 'lon')
+        lead = da.dims[:-2]
+        kwargs = {'n_lon': da.sizes['lon'], 'region_index': region_index, 'cell': cell, 'weight': weight, 'n_regions': n_regions}
+        if da.chunks is None:
+            sums = _zonal_block(da.values, 0, 0, **kwargs)
+        else:
+            lat_starts = np.cumsum((0,) + da.chunks[-2][:-1])
+            lon_starts = np.cumsum((0,) + da.chunks[-1][:-1])
+
+            def partial(block, block_info=None):
+                i, j = block_info[0]['chunk-location'][-2:]
+                return _zonal_block(block, lat_starts[i], lon_starts[j], **kwargs)[..., None, None]
+
+            # One partial table per spatial block, summed afterwards: the grid is never rechunked
+            partials = dask.array.map_blocks(
+                partial, da.data, new_axis=len(lead), dtype=np.float64,
+                chunks=da.chunks[:-2] + ((2 * n_regions,), (1,) * len(da.chunks[-2]), (1,) * len(da.chunks[-1])),
+            )
+            sums = partials.sum(axis=(-2, -1))
+        total, covered = sums[..., :n_regions], sums[..., n_regions:]
+        mean = total / np.where(covered > 0, covered, np.nan) if da.chunks is None else total / dask.array.where(covered > 0, covered, np.nan)
+        out[name] = xr.DataArray(mean, dims=lead + ('region',), attrs=da.attrs,
+                                 coords={key: coord for key, coord in da.coords.items() if set(coord.dims) <= set(lead)})
+    return xr.Dataset(out).assign_coords(region=weights['region'].values, region_area_km2=('region', weights['region_area'].values))
+
+def write_zonal(output_path: str, regions_path: str, cache_dir: Optional[str] = None, name_field: Optional[str] = None) -> str:
+    # (time, region) tables of a saved gridded result: '<output>_zonal.nc' plus a CSV for reporting
+    output_path = Path(output_path)
+    engine = 'zarr' if output_path.suffix == '.zarr' else None
+    with xr.open_dataset(output_path, engine=engine, chunks={}) as ds:
+        weights = region_weights(regions_path, ds['lat'], ds['lon'], cache_dir, name_field)
+        table = zonal_means(ds, weights).compute()
+    table.attrs["title"] = f"Area-weighted regional means of {output_path.name}"
+    table.attrs["regions"] = str(Path(regions_path).name)
+    saved_path = save_indices_to_netcdf(table, f"{output_path.stem}_zonal.nc", str(output_path.parent),
+                                       integer_counts=False)
+    csv_path = output_path.with_name(f"{output_path.stem}_zonal.csv")
+    table.drop_vars('region_area_km2').to_dataframe().to_csv(csv_path)
+    print(f"Regional table written to: {csv_path}")
+    return saved_path
@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+FOLDERS = ['Climate Extreme Indicators', 'Heat-Stress Metrics', 'Urban Heat Islands']
+
+def use_folder(folder: str) -> None:
+    # The module folders reuse module names (indices, engine, input, ...), so only one of them is importable at a time.
+    # Test modules bind what they need at import, so switching folders does not affect modules collected earlier.
+    for other in FOLDERS:
+        path = ROOT / other
+        if str(path) in sys.path:
+            sys.path.remove(str(path))
+        for name in [module.stem for module in path.glob('*.py')]:
+            module = sys.modules.get(name)
+            if module is not None and Path(getattr(module, '__file__', None) or '').resolve().parent == path:
+                del sys.modules[name]
+    sys.path.insert(0, str(ROOT / folder))
+    if str(ROOT / 'common') not in sys.path:
+        sys.path.insert(1, str(ROOT / 'common'))
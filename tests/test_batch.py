@@ -0,0 +1,100 @@
+import json
+import numpy as np
+import pytest
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+import batch
+from batch import load_manifest, run_batch
+from benchmarking import synthetic_cube, write_synthetic_files
+from indices import climate_index
+from input import load_all_data_for_analysis
+from precision import precision_policy
+from preprocess import combine_preprocess
+
+INDICES = ['TXx', 'Rx1day', 'CWD', 'R95p']
+REGIONS = {"north": {"lat_range": [16.0, 24.0], "lon_range": [102.0, 106.0]},
+           "south": {"lat_range": [8.0, 14.0], "lon_range": [104.0, 110.0]}}
+
+@pytest.fixture(scope='module')
+def datasets(tmp_path_factory) -> dict:
+    root = tmp_path_factory.mktemp('members')
+    paths = {}
+    for seed, member in enumerate(['m1', 'm2']):
+        paths[member] = str(root / member)
+        write_synthetic_files(synthetic_cube(3, 8, 6, start_year=2000, seed=seed)[['tasmax', 'pr']], paths[member])
+    return paths
+
+def _manifest(tmp_path, datasets: dict, **extra) -> str:
+    manifest = {"regions": REGIONS, "base_period": [2000, 2001],
+                "jobs": [{"dataset": path, "member": member, "period": [2000, 2002], "indices": INDICES}
+                         for member, path in datasets.items()], **extra}
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+def _standalone(dataset: str, region: dict) -> xr.Dataset:
+    # What main.py computes for one dataset and region
+    raw = load_all_data_for_analysis(chunks=None, variables=['tasmax', 'pr'], period=(2000, 2002), lat_range=tuple(region['lat_range']),
+                                     lon_range=tuple(region['lon_range']), data_dir=dataset)
+    processed = combine_preprocess(raw, tuple(region['lat_range']), tuple(region['lon_range']), period=(2000, 2002), verbose=False)
+    return climate_index(processed, INDICES, base_period=(2000, 2001), cache_dir=None, verbose=False).compute()
+
+def test_manifest_expands_regions_and_members(tmp_path):
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps({"regions": REGIONS, "output_format": "zarr",
+                                "jobs": [{"dataset": "data/ACCESS-CM2"}, {"dataset": "data/MIROC6", "member": "miroc", "regions": ["south"]}]}))
+    _, jobs = load_manifest(str(path))
+    assert [(job['member'], job['region']) for job in jobs] == [('ACCESS-CM2', 'north'), ('ACCESS-CM2', 'south'), ('miroc', 'south')]
+    assert jobs[0]['lat_range'] == (16.0, 24.0) and jobs[0]['period'] is None
+    assert jobs[2]['output_filename'] == 'miroc_south.zarr'
+
+    path.write_text(json.dumps({"regions": REGIONS, "jobs": [{"dataset": "data/MIROC6", "regions": ["west"]}]}))
+    with pytest.raises(ValueError, match="Unknown region 'west'"):
+        load_manifest(str(path))
+
+def test_batch_reads_each_dataset_once_and_matches_single_runs(tmp_path, datasets, monkeypatch):
+    loads, crops = [], []
+    load, run_job = batch.load_all_data_for_analysis, batch._run_job
+
+    def counting_load(*args, **kwargs):
+        loads.append(kwargs['data_dir'])
+        return load(*args, **kwargs)
+
+    def recording_job(job, crop, *args):
+        crops.append(crop)
+        return run_job(job, crop, *args)
+
+    monkeypatch.setattr(batch, 'load_all_data_for_analysis', counting_load)
+    monkeypatch.setattr(batch, '_run_job', recording_job)
+    with precision_policy('float64', packing=False):
+        outputs = run_batch(_manifest(tmp_path, datasets), str(tmp_path / 'out'), report=False)
+        expected = {(member, region): _standalone(path, bounds) for member, path in datasets.items() for region, bounds in REGIONS.items()}
+
+    # One read of the union of both regions per member, every job cropped from memory
+    assert sorted(loads) == sorted(datasets.values())
+    assert len(crops) == 4 and all(crop[name].chunks is None for crop in crops for name in crop.data_vars)
+    assert len(outputs) == 6
+    for (member, region), reference in expected.items():
+        with xr.open_dataset(tmp_path / 'out' / f"{member}_{region}.nc") as result:
+            for name in INDICES:
+                np.testing.assert_allclose(result[name].values, reference[name].values, rtol=1e-6, err_msg=f"{member}/{region}/{name}")
+
+    for region in REGIONS:
+        with xr.open_dataset(tmp_path / 'out' / f"ensemble_{region}_2000-2002.nc") as ensemble:
+            assert list(ensemble['member'].values) == ['m1', 'm2']
+            assert list(ensemble['time'].values) == [2000, 2001, 2002]
+            for member in datasets:
+                np.testing.assert_allclose(ensemble['R95p'].sel(member=member).values, expected[(member, region)]['R95p'].values,
+                                           rtol=1e-6)
+
+def test_batch_tiles_jobs_over_the_memory_budget(tmp_path, datasets):
+    with precision_policy('float64', packing=False):
+        run_batch(_manifest(tmp_path, {'m1': datasets['m1']}), str(tmp_path / 'unbounded'), report=False)
+        # Too small to hold the union or any job: every job is streamed in tiles
+        run_batch(_manifest(tmp_path, {'m1': datasets['m1']}, memory_budget_mb=0.05), str(tmp_path / 'tiled'), report=False)
+    for region in REGIONS:
+        with xr.open_dataset(tmp_path / 'unbounded' / f"m1_{region}.nc") as full, xr.open_dataset(tmp_path / 'tiled' / f"m1_{region}.nc") as tiled:
+            for name in INDICES:
+                np.testing.assert_allclose(tiled[name].values, full[name].values, rtol=1e-6, err_msg=f"{region}/{name}")
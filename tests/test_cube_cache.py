@@ -0,0 +1,79 @@
+import json
+import os
+import numpy as np
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from benchmarking import synthetic_cube, write_synthetic_files
+from cube_cache import CACHE_INDEX, cached_cube, input_fingerprint
+
+def _cube(seed: int = 0) -> xr.Dataset:
+    ds = synthetic_cube(1, 4, 3, start_year=2000, seed=seed)[['tasmax', 'pr']]
+    return ds.assign_coords(valid_mask_tasmax=ds['tasmax'].notnull().any('time'), valid_mask_pr=ds['pr'].notnull().any('time'))
+
+class Builder:
+    def __init__(self, ds: xr.Dataset):
+        self.ds, self.calls = ds, 0
+
+    def __call__(self) -> xr.Dataset:
+        self.calls += 1
+        return self.ds.copy()
+
+def _payload(data_dir: str, variables, **options) -> dict:
+    return {"files": input_fingerprint(data_dir, variables), "variables": variables, **options}
+
+def test_cube_is_rebuilt_when_an_input_file_changes(tmp_path):
+    data_dir, cache_dir = str(tmp_path / 'data'), str(tmp_path / 'cache')
+    paths = write_synthetic_files(_cube(), data_dir)
+    build = Builder(_cube())
+    first = cached_cube(_payload(data_dir, ['tasmax', 'pr']), build, cache_dir)
+    again = cached_cube(_payload(data_dir, ['tasmax', 'pr']), build, cache_dir)
+    assert build.calls == 1
+    xr.testing.assert_identical(first.compute(), again.compute())
+    # A cube with more variables from the same files serves a subset, with only that variable's mask
+    subset = cached_cube(_payload(data_dir, ['pr']), build, cache_dir)
+    assert build.calls == 1 and list(subset.data_vars) == ['pr'] and 'valid_mask_tasmax' not in subset.coords
+    assert subset['pr'].encoding['source_files'] == input_fingerprint(data_dir, ['pr'])['pr']
+
+    # Same names, new contents: the file size and mtime recorded in the key no longer match
+    pr_file = next(path for path in paths if os.path.basename(path).startswith('pr_'))
+    write_synthetic_files(_cube(seed=1)[['pr']], data_dir)
+    stat = os.stat(pr_file)
+    os.utime(pr_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    rebuild = Builder(_cube(seed=1))
+    changed = cached_cube(_payload(data_dir, ['tasmax', 'pr']), rebuild, cache_dir)
+    assert rebuild.calls == 1
+    np.testing.assert_array_equal(changed['pr'].values, _cube(seed=1)['pr'].values)
+    # Options other than the files are part of the key too
+    cached_cube(_payload(data_dir, ['tasmax', 'pr'], period=[2000, 2000]), rebuild, cache_dir)
+    assert rebuild.calls == 2
+
+def test_least_recently_used_cubes_are_evicted(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    builds = {name: Builder(_cube(seed)) for seed, name in enumerate('abc')}
+
+    def use(name: str, max_size_gb: float = 20.0) -> None:
+        cached_cube({"files": {}, "variables": ['tasmax', 'pr'], "cube": name}, builds[name], str(cache_dir), max_size_gb)
+
+    use('a')
+    store_size = json.loads((cache_dir / CACHE_INDEX).read_text()).popitem()[1]['size']
+    # Room for two cubes
+    cap_gb = 2.5 * store_size / 1024**3
+    use('b', cap_gb)
+    use('a', cap_gb) # 'a' is now more recent than 'b'
+    use('c', cap_gb)
+
+    index = json.loads((cache_dir / CACHE_INDEX).read_text())
+    assert sorted(entry['payload']['cube'] for entry in index.values()) == ['a', 'c']
+    assert sorted(path.name for path in cache_dir.glob('cube_*.zarr')) == sorted(entry['store'] for entry in index.values())
+    assert sum(entry['size'] for entry in index.values()) <= cap_gb * 1024**3
+    use('a', cap_gb)
+    use('b', cap_gb)
+    assert builds['a'].calls == 1 and builds['b'].calls == 2 and builds['c'].calls == 1
+
+def test_zero_size_disables_the_cache(tmp_path):
+    build = Builder(_cube())
+    cached_cube({"files": {}, "variables": ['pr']}, build, str(tmp_path / 'cache'), 0)
+    cached_cube({"files": {}, "variables": ['pr']}, build, str(tmp_path / 'cache'), 0)
+    assert build.calls == 2 and not (tmp_path / 'cache').exists()
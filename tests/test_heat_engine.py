@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Heat-Stress Metrics')
+from aggregation import aggregate_daily, aggregate_heat_stress, input_masks
+from benchmarking import STUDY_LAT, STUDY_LON, synthetic_cube
+from engine import NUMBA_AVAILABLE
+from indices import calculate_indices, calculate_indices_reference
+from writers import save_indices_to_netcdf
+import main as heat_main
+
+def _daily(rh_scale: float) -> xr.Dataset:
+    rng = np.random.default_rng(5)
+    shape = (60, 4, 3)
+    tas = rng.uniform(5.0, 45.0, shape)
+    rh = rng.uniform(10.0, 100.0, shape) / rh_scale
+    tas[0, 0, 0] = np.nan
+    coords = {'time': pd.date_range('2000-06-01', periods=shape[0]), 'lat': np.arange(4.0), 'lon': np.arange(3.0)}
+    # The engine reads the humidity units from the attributes, the reference guesses them from the values
+    rh_attrs = {'units': '%' if rh_scale == 1.0 else '1'}
+    return xr.Dataset({'tas': (('time', 'lat', 'lon'), tas, {'units': '°C'}), 'rh': (('time', 'lat', 'lon'), rh, rh_attrs)},
+                      coords=coords)
+
+ENGINES = [False, pytest.param(True, marks=pytest.mark.skipif(not NUMBA_AVAILABLE, reason="numba is not installed"))]
+
+@pytest.mark.parametrize('rh_scale', [1.0, 100.0]) # percent and fraction
+@pytest.mark.parametrize('use_numba', ENGINES)
+def test_heat_kernel_matches_reference(use_numba, rh_scale):
+    ds = _daily(rh_scale)
+    fused = calculate_indices(ds.copy(), use_numba=use_numba)
+    reference = calculate_indices_reference(ds.copy())
+    for name in ('Tw', 'WBGT'):
+        np.testing.assert_allclose(fused[name].values, reference[name].values, rtol=1e-10, atol=1e-10, err_msg=name)
+    assert np.isnan(fused['HI'].values[0, 0, 0]) and np.isfinite(fused['HI'].values[1:]).all()
+
+@pytest.mark.parametrize('use_numba', ENGINES)
+def test_heat_kernel_with_constant_humidity(use_numba):
+    # Without humidity files input.py adds a constant 'rh' fraction
+    ds = _daily(1.0).drop_vars('rh').assign(rh=0.7)
+    fused = calculate_indices(ds.copy(), use_numba=use_numba)
+    reference = calculate_indices_reference(ds.copy())
+    for name in ('Tw', 'WBGT'):
+        np.testing.assert_allclose(fused[name].values, reference[name].values, rtol=1e-10, atol=1e-10, err_msg=name)
+
+@pytest.mark.skipif(not NUMBA_AVAILABLE, reason="numba is not installed")
+def test_heat_kernel_numba_matches_numpy():
+    ds = _daily(1.0)
+    compiled = calculate_indices(ds.copy(), use_numba=True)
+    plain = calculate_indices(ds.copy(), use_numba=False)
+    for name in ('Tw', 'WBGT', 'HI'):
+        np.testing.assert_allclose(compiled[name].values, plain[name].values, rtol=1e-12, atol=1e-12, err_msg=name)
+
+@pytest.mark.parametrize('freq', ['annual', 'seasonal'])
+def test_aggregate_titles(tmp_path, freq):
+    aggregated = aggregate_heat_stress(_daily(1.0), freq, use_numba=False)
+    path = save_indices_to_netcdf(aggregated, 'heat.nc', str(tmp_path))
+    with xr.open_dataset(path) as saved:
+        assert saved.attrs['title'] == f"{freq.capitalize()} Heat-Stress Metrics"
+        assert saved.attrs['frequency'] == freq
+
+@pytest.mark.parametrize('freq', ['annual', 'seasonal'])
+def test_aggregate_daily_matches_the_fused_aggregation(freq):
+    ds = _daily(1.0)
+    ds = ds.assign_coords(valid_mask_tas=(('lat', 'lon'), np.arange(12).reshape(4, 3) != 5),
+                          valid_mask_rh=(('lat', 'lon'), np.ones((4, 3), bool)))
+    direct = aggregate_heat_stress(ds, freq, use_numba=False)
+    daily = calculate_indices(ds.copy(), use_numba=False)[['Tw', 'WBGT', 'HI']]
+    reduced = aggregate_daily(daily, freq, masks=input_masks(ds))
+    assert set(reduced.coords) == set(direct.coords)
+    assert np.isnan(reduced['WBGT_max'].values[:, 1, 2]).all()
+    for name in direct.data_vars:
+        np.testing.assert_array_equal(reduced[name].values, direct[name].values, err_msg=name)
+
+def test_keep_daily_reuses_the_daily_fields(tmp_path):
+    # tas only, so the run uses the constant RH fallback, which is not part of the cached cube
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    synthetic_cube(2, 5, 4, start_year=2000)[['tas']].to_netcdf(data_dir / 'tas_day_MODEL_20000101-20011231.nc')
+    args = ['--data-dir', str(data_dir), '--lat-range', *map(str, STUDY_LAT), '--lon-range', *map(str, STUDY_LON),
+            '--no-previews', '--no-report']
+    heat_main.main(args + ['--output-dir', str(tmp_path / 'plain')])
+    heat_main.main(args + ['--output-dir', str(tmp_path / 'daily'), '--keep-daily', '--cube-cache-dir', str(tmp_path / 'plain' / 'cube_cache')])
+
+    with xr.open_dataset(tmp_path / 'plain' / heat_main.OUTPUT_FILENAME) as plain, \
+         xr.open_dataset(tmp_path / 'daily' / heat_main.OUTPUT_FILENAME) as reduced, \
+         xr.open_dataset(tmp_path / 'daily' / 'calculated_heatstress_daily.nc') as daily:
+        assert daily['WBGT'].encoding['dtype'] == np.float32 and 'scale_factor' not in daily['WBGT'].encoding
+        assert np.isfinite(reduced['WBGT_max'].values).any()
+        for name in plain.data_vars:
+            np.testing.assert_array_equal(reduced[name].values, plain[name].values, err_msg=name)
+    index = (tmp_path / 'plain' / 'cube_cache' / 'cube_index.json').read_text()
+    assert '"rh"' not in index and index.count('"store"') == 1
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from benchmarking import STUDY_LAT, STUDY_LON, synthetic_cube
+from incremental import thresholds_path, update_indices
+from preprocess import combine_preprocess
+from tiling import run_tiled
+
+INDICES = ['TXx', 'SU25', 'Rx5day', 'R95p', 'CDD']
+
+def _processed(years: int = 4) -> xr.Dataset:
+    # Dask-backed like the cube main.py passes in, so index blocks reach the Zarr writer as dask arrays
+    raw = synthetic_cube(years, 6, 5, start_year=2000, chunks={'time': -1, 'lat': 3, 'lon': 5})
+    return combine_preprocess(raw, STUDY_LAT, STUDY_LON, verbose=False)
+
+def test_zarr_update_recomputes_years_already_in_the_store(tmp_path):
+    ds = _processed()
+    # First run ends mid-2001, so 2001 is partial and has to be recomputed next to the appended 2002-2003
+    update_indices(ds.sel(time=slice(None, '2001-06-30')), 'indices.zarr', str(tmp_path), base_period=(2000, 2000), indices=INDICES)
+    update_indices(ds, 'indices.zarr', str(tmp_path), base_period=(2000, 2000), indices=INDICES)
+    # An explicit recompute of a full year already in the store
+    update_indices(ds, 'indices.zarr', str(tmp_path), base_period=(2000, 2000), recompute_years=[2000], indices=INDICES)
+
+    update_indices(ds, 'full.zarr', str(tmp_path / 'full'), base_period=(2000, 2000), indices=INDICES)
+    with xr.open_zarr(tmp_path / 'indices.zarr') as updated, xr.open_zarr(tmp_path / 'full' / 'full.zarr') as full:
+        assert list(updated['time'].dt.year.values) == [2000, 2001, 2002, 2003]
+        for name in INDICES:
+            np.testing.assert_allclose(updated[name].values, full[name].values, rtol=1e-5, atol=1e-4, err_msg=name)
+
+def test_zarr_update_of_a_tiled_store(tmp_path):
+    ds = _processed()
+    raw = synthetic_cube(4, 6, 5, start_year=2000).sel(time=slice(None, '2002-12-31'))
+    # A tiny budget forces several tiles, each written into its region of one store
+    run_tiled(raw, STUDY_LAT, STUDY_LON, 'indices.zarr', str(tmp_path), memory_budget_mb=0.05, base_period=(2000, 2000),
+              cache_dir=None, indices=INDICES)
+    assert thresholds_path(tmp_path / 'indices.zarr').exists()
+    update_indices(ds, 'indices.zarr', str(tmp_path), base_period=(2000, 2000), recompute_years=[2001], indices=INDICES)
+
+    update_indices(ds, 'full.zarr', str(tmp_path / 'full'), base_period=(2000, 2000), indices=INDICES)
+    with xr.open_zarr(tmp_path / 'indices.zarr') as updated, xr.open_zarr(tmp_path / 'full' / 'full.zarr') as full:
+        assert list(updated['time'].dt.year.values) == [2000, 2001, 2002, 2003]
+        for name in INDICES:
+            np.testing.assert_allclose(updated[name].values, full[name].values, rtol=1e-5, atol=1e-4, err_msg=name)
+
+def test_update_refuses_thresholds_from_another_record(tmp_path):
+    ds = _processed(3)
+    # Without a fixed base period the thresholds would depend on the years present on the first run
+    with pytest.raises(ValueError, match='base period'):
+        update_indices(ds, 'indices.nc', str(tmp_path), indices=INDICES)
+    update_indices(ds.sel(time=slice(None, '2000-12-31')), 'indices.nc', str(tmp_path), base_period=(2000, 2000), indices=INDICES)
+    thresholds_path(tmp_path / 'indices.nc').unlink()
+    with pytest.raises(ValueError, match='frozen thresholds'):
+        update_indices(ds, 'indices.nc', str(tmp_path), base_period=(2000, 2000), indices=INDICES)
+    # Indices without percentile thresholds can still be extended
+    update_indices(ds, 'indices.nc', str(tmp_path), indices=['TXx', 'CDD'])
+
+def test_full_run_then_incremental_update(tmp_path):
+    from benchmarking import write_synthetic_files
+    from main import main
+    write_synthetic_files(synthetic_cube(4, 6, 5, start_year=2000), str(tmp_path / 'data'))
+    common = ['--data-dir', str(tmp_path / 'data'), '--base-period', '2000', '2001', '--indices', *INDICES,
+              '--cube-cache-gb', '0', '--no-previews', '--no-report']
+    # A normal run freezes the thresholds, so the next year can be appended without recomputing them
+    main(common + ['--output-dir', str(tmp_path / 'run'), '--period', '2000', '2002'])
+    assert thresholds_path(tmp_path / 'run' / 'calculated_indices.nc').exists()
+    main(common + ['--output-dir', str(tmp_path / 'run'), '--incremental'])
+
+    main(common + ['--output-dir', str(tmp_path / 'full')])
+    with xr.open_dataset(tmp_path / 'run' / 'calculated_indices.nc') as updated, \
+         xr.open_dataset(tmp_path / 'full' / 'calculated_indices.nc') as full:
+        assert list(updated['time'].dt.year.values) == [2000, 2001, 2002, 2003]
+        for name in INDICES:
+            np.testing.assert_allclose(updated[name].values, full[name].values, rtol=1e-5, atol=1e-4, err_msg=name)
+
+def test_zarr_update_with_years_before_the_store(tmp_path):
+    ds = _processed()
+    update_indices(ds.sel(time=slice('2002-01-01', None)), 'indices.zarr', str(tmp_path), base_period=(2002, 2003), indices=INDICES)
+    # Earlier years cannot be appended, the store is rewritten in time order
+    update_indices(ds, 'indices.zarr', str(tmp_path), base_period=(2002, 2003), indices=INDICES)
+    with xr.open_zarr(tmp_path / 'indices.zarr') as updated:
+        assert list(updated['time'].dt.year.values) == [2000, 2001, 2002, 2003]
+        assert updated.attrs['time_coverage_end'] == '2003-12-31'
+        assert int(updated['TXx'].sel(time='2000').notnull().sum()) > 0
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from benchmarking import STUDY_LAT, STUDY_LON, synthetic_cube
+from indices import CDD, CSDI, CWD, INDEX_REGISTRY, WSDI, climate_index
+from precision import precision_policy
+from preprocess import combine_preprocess
+
+@pytest.fixture(scope='module')
+def processed() -> xr.Dataset:
+    # float64 so the fused engine and the per-index functions only differ by summation order
+    with precision_policy('float64', packing=False):
+        raw = synthetic_cube(3, 8, 6, start_year=2000, seed=3, chunks={'time': -1, 'lat': 4, 'lon': 6})
+        return combine_preprocess(raw, STUDY_LAT, STUDY_LON, verbose=False).load()
+
+@pytest.mark.parametrize('span_years', [False, True])
+@pytest.mark.parametrize('freq', ['annual', 'seasonal', 'monthly'])
+def test_fused_engine_matches_reference_functions(processed, freq, span_years):
+    fused = climate_index(processed, fused=True, span_years=span_years, base_period=(2000, 2001), freq=freq, verbose=False)
+    reference = climate_index(processed, fused=False, span_years=span_years, base_period=(2000, 2001), freq=freq, verbose=False)
+    assert sorted(fused.data_vars) == sorted(INDEX_REGISTRY)
+    np.testing.assert_array_equal(fused['time'].values, reference['time'].values)
+    for name in INDEX_REGISTRY:
+        assert np.isfinite(fused[name].values).any(), name
+        np.testing.assert_allclose(fused[name].values, reference[name].values, rtol=1e-9, atol=1e-9, err_msg=name)
+
+@pytest.mark.parametrize('fused', [True, False])
+def test_missing_precipitation_only_masks_precipitation_indices(fused):
+    raw = synthetic_cube(2, 4, 3, start_year=2000, seed=5)
+    raw['pr'][:, 1, 1] = np.nan
+    processed = combine_preprocess(raw, STUDY_LAT, STUDY_LON, verbose=False)
+    assert not processed['valid_mask_pr'][1, 1] and processed['valid_mask_tasmax'][1, 1]
+
+    result = climate_index(processed, ['TXx', 'DTR', 'Rx1day', 'R95p'], fused=fused, base_period=(2000, 2001), verbose=False)
+    assert not [name for name in result.coords if name.startswith('valid_mask')]
+    for name in ('TXx', 'DTR'):
+        assert np.isfinite(result[name][:, 1, 1]).all(), name
+    for name in ('Rx1day', 'R95p'):
+        assert np.isnan(result[name][:, 1, 1]).all(), name
+
+def _series(values: np.ndarray, time: pd.DatetimeIndex) -> xr.DataArray:
+    return xr.DataArray(values[:, None, None], dims=('time', 'lat', 'lon'), coords={'time': time, 'lat': [10.0], 'lon': [105.0]})
+
+@pytest.mark.parametrize('span_years', [False, True])
+def test_reference_spell_indices_on_known_spells(span_years):
+    time = pd.date_range('2000-01-01', '2001-12-31')
+    pr = pd.Series(np.where(np.arange(time.size) % 2, 0.0, 5.0), index=time) # wet and dry days alternate
+    pr['2000-02-28'] = pr['2000-03-14'] = 0.0
+    pr['2000-02-29':'2000-03-13'] = 5.0 # 14 wet days, from the last day of February to 13 March
+    pr['2000-05-31'] = pr['2000-06-08'] = 5.0
+    pr['2000-06-01':'2000-06-07'] = 0.0
+    pr['2000-12-21'] = pr['2001-01-06'] = 5.0
+    pr['2001-01-07'] = 0.0
+    pr['2000-12-22':'2001-01-05'] = 0.0 # a 15-day dry spell across the new year
+    tasmax = pd.Series(20.0, index=time)
+    tasmax['2000-07-01':'2000-07-08'] = 35.0
+    tasmax['2001-08-01':'2001-08-05'] = 35.0 # too short for a warm spell
+    tasmin = pd.Series(5.0, index=time)
+    tasmin['2000-12-27':'2001-01-02'] = -2.0 # a 7-day cold spell across the new year
+    pr, tasmax, tasmin = (_series(series.values, time) for series in (pr, tasmax, tasmin))
+
+    wet = [14, 1]
+    dry = [10, 15] if span_years else [10, 5]
+    cold = [5, 2] if span_years else [0, 0]
+    np.testing.assert_array_equal(CWD(pr, span_years).values[:, 0, 0], wet)
+    np.testing.assert_array_equal(CDD(pr, span_years).values[:, 0, 0], dry)
+    np.testing.assert_array_equal(WSDI(tasmax, span_years).values[:, 0, 0], [8, 0])
+    np.testing.assert_array_equal(CSDI(tasmin, span_years).values[:, 0, 0], cold)
+    # Seasons cut spells at their own boundaries: the wet spell is split between DJF (29 Feb) and MAM
+    seasonal = CWD(pr, span_years, 'seasonal')
+    assert float(seasonal.sel(time='2000-03-01').squeeze()) == (14 if span_years else 13)
+
+def test_reference_spells_skip_periods_without_data():
+    time = pd.date_range('2000-01-01', '2001-12-31')
+    pr = _series(np.where(time.year == 2001, np.nan, np.where(np.arange(time.size) % 3, 0.0, 5.0)), time)
+    np.testing.assert_array_equal(CDD(pr).values[:, 0, 0], [2, np.nan])
+    np.testing.assert_array_equal(CWD(pr).values[:, 0, 0], [1, np.nan])
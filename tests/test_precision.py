@@ -0,0 +1,41 @@
+import numpy as np
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from engine import _rolling_sum
+from precision import INT16_FILL, PACK_SCALE, precision_policy, storage_encoding
+
+def _result(units: str) -> xr.DataArray:
+    return xr.DataArray(np.zeros(3, dtype=np.float32), dims='time', attrs={'units': units})
+
+def test_packing_encodings():
+    with precision_policy('float32', packing=True):
+        celsius = storage_encoding(_result('°C'))
+        kelvin = storage_encoding(_result('K'))
+        days = storage_encoding(_result('days'))
+    assert celsius['dtype'] == 'int16' and celsius['scale_factor'] == PACK_SCALE
+    assert celsius['scale_factor'].dtype == np.float32
+    # 300 K / 0.01 does not fit in int16
+    assert kelvin == {'dtype': 'float32'}
+    assert days['dtype'] == 'int16' and days['_FillValue'] == INT16_FILL
+
+def test_packed_celsius_round_trip(tmp_path):
+    values = np.array([-40.0, 0.004, 25.126, 55.0, np.nan], dtype=np.float32)
+    ds = xr.Dataset({'TXx': ('time', values, {'units': '°C'})})
+    with precision_policy('float32', packing=True):
+        encoding = {'TXx': storage_encoding(ds['TXx'])}
+    ds.to_netcdf(tmp_path / 'packed.nc', encoding=encoding)
+    with xr.open_dataset(tmp_path / 'packed.nc') as saved:
+        assert saved['TXx'].encoding['dtype'] == np.int16
+        np.testing.assert_allclose(saved['TXx'].values, values, atol=0.005 + 1e-6)
+
+def test_rolling_sum_float32_long_record():
+    # 60 years of daily rain: a float32 running total would drift by more than the daily amounts' resolution
+    rng = np.random.default_rng(0)
+    pr = rng.gamma(0.6, 8.0, size=(2, 60 * 365))
+    pr[0, 100:110] = np.nan
+    expected = _rolling_sum(pr, 5, 1)
+    got = _rolling_sum(pr.astype(np.float32), 5, 1)
+    assert got.dtype == np.float32
+    np.testing.assert_allclose(got, expected, rtol=1e-5, atol=1e-4)
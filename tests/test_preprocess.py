@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from precision import precision_policy
+from preprocess import clean_dataset
+
+def _raw(name: str, values: np.ndarray, units: str) -> xr.Dataset:
+    coords = {'time': pd.date_range('2000-01-01', periods=values.shape[0]), 'lat': [10.0, 11.0], 'lon': [105.0]}
+    return xr.Dataset({name: (('time', 'lat', 'lon'), values, {'units': units})}, coords=coords)
+
+@pytest.mark.parametrize('units', ['kg m-2 s-1', 'kg/m2/s', 'kg m**-2 s**-1'])
+def test_precipitation_flux_becomes_daily_totals(units):
+    flux = np.full((4, 2, 1), 1e-4)
+    flux[1, 0, 0] = 5e-5
+    with precision_policy('float64', packing=False):
+        cleaned = clean_dataset(_raw('pr', flux, units), verbose=False)
+    # 1e-4 kg m-2 s-1 is 8.64 mm/day; the baseline left it at 1e-4, below every wet-day threshold
+    assert cleaned['pr'].attrs['units'] == 'mm/day'
+    np.testing.assert_allclose(cleaned['pr'].values, flux * 86400.0)
+    assert cleaned['pr'].values[0, 0, 0] == pytest.approx(8.64)
+
+def test_daily_totals_and_celsius_are_kept():
+    values = np.full((4, 2, 1), 12.5)
+    with precision_policy('float64', packing=False):
+        pr = clean_dataset(_raw('pr', values, 'mm/day'), verbose=False)['pr']
+        tas = clean_dataset(_raw('tasmax', values, '°C'), verbose=False)['tasmax']
+    np.testing.assert_array_equal(pr.values, values)
+    np.testing.assert_array_equal(tas.values, values)
+
+def test_kelvin_becomes_celsius():
+    values = np.full((4, 2, 1), 300.0)
+    with precision_policy('float64', packing=False):
+        tas = clean_dataset(_raw('tasmin', values, 'K'), verbose=False)['tasmin']
+    assert tas.attrs['units'] == '°C'
+    np.testing.assert_allclose(tas.values, 26.85)
+
+def test_spikes_and_static_zero_cells_are_removed():
+    values = np.full((4, 2, 1), 2e-5)
+    values[2, 0, 0] = 1e20 # fill value
+    values[:, 1, 0] = 0.0 # a cell that never rains (e.g. masked ocean written as zeros)
+    cleaned = clean_dataset(_raw('pr', values, 'kg m-2 s-1'), verbose=False)
+    assert cleaned['pr'].dtype == np.float32
+    assert np.isnan(cleaned['pr'].values[2, 0, 0]) and np.isfinite(cleaned['pr'].values[[0, 1, 3], 0, 0]).all()
+    assert np.isnan(cleaned['pr'].values[:, 1, 0]).all()
+    np.testing.assert_array_equal(cleaned['valid_mask_pr'].values, [[True], [False]])
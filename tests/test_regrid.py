@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+import regrid
+from grids import cell_edges
+from regrid import align_to_grid, apply_weights, regrid_weights
+
+def _field(lat: np.ndarray, lon: np.ndarray, values: np.ndarray, name: str = 'pr') -> xr.Dataset:
+    coords = {'time': np.arange(values.shape[0]), 'lat': lat, 'lon': lon}
+    return xr.Dataset({name: (('time', 'lat', 'lon'), values)}, coords=coords)
+
+def _regrid(values: np.ndarray, source_lat, source_lon, target_lat, target_lon, method: str) -> np.ndarray:
+    weights = regrid_weights(source_lat, source_lon, target_lat, target_lon, method)
+    da = _field(source_lat, source_lon, values)['pr']
+    return apply_weights(da, weights, xr.DataArray(target_lat, dims='lat'), xr.DataArray(target_lon, dims='lon')).values
+
+def test_cell_edges():
+    np.testing.assert_allclose(cell_edges(np.array([1.0, 2.0, 4.0])), [0.5, 1.5, 3.0, 5.0])
+    np.testing.assert_allclose(cell_edges(np.array([3.0])), [2.5, 3.5])
+
+def test_conservative_is_the_area_weighted_mean_of_the_covered_cells():
+    # Every target cell covers exactly 2x2 source cells
+    source_lat, source_lon = np.arange(10.25, 14, 0.5), np.arange(100.25, 104, 0.5)
+    target_lat, target_lon = np.arange(10.5, 14, 1.0), np.arange(100.5, 104, 1.0)
+    values = np.random.default_rng(0).gamma(1.0, 5.0, (2, source_lat.size, source_lon.size))
+    got = _regrid(values, source_lat, source_lon, target_lat, target_lon, 'conservative')
+
+    lat_edges = np.radians(cell_edges(source_lat))
+    area = np.diff(np.sin(lat_edges))[:, None] * np.ones(source_lon.size)
+    expected = np.empty_like(got)
+    for i in range(target_lat.size):
+        for j in range(target_lon.size):
+            cells = np.s_[2 * i:2 * i + 2, 2 * j:2 * j + 2]
+            expected[:, i, j] = (values[(slice(None),) + cells] * area[cells]).sum(axis=(-2, -1)) / area[cells].sum()
+    np.testing.assert_allclose(got, expected, rtol=1e-12)
+
+def test_conservative_keeps_the_area_total():
+    source_lat, source_lon = np.linspace(8.1, 11.9, 20), np.linspace(102.1, 105.9, 20)
+    target_lat, target_lon = np.linspace(8.2, 11.8, 7), np.linspace(102.2, 105.8, 5)
+    values = np.random.default_rng(1).uniform(0, 10, (1, 20, 20))
+    weights = regrid_weights(source_lat, source_lon, target_lat, target_lon, 'conservative')
+    # Rows are normalised, so every target value lies within the range of its sources and a constant stays constant
+    np.testing.assert_allclose(np.bincount(weights['target_cell'].values, weights['weight'].values), 1.0)
+    constant = _regrid(np.full((1, 20, 20), 3.5), source_lat, source_lon, target_lat, target_lon, 'conservative')
+    np.testing.assert_allclose(constant, 3.5)
+    got = _regrid(values, source_lat, source_lon, target_lat, target_lon, 'conservative')
+    assert values.min() <= got.min() and got.max() <= values.max()
+
+def test_bilinear_reproduces_a_linear_field():
+    source_lat, source_lon = np.arange(0.0, 10.1, 1.0), np.arange(100.0, 110.1, 1.0)
+    target_lat, target_lon = np.array([0.3, 4.5, 9.9]), np.array([100.25, 105.0, 109.75])
+    field = lambda lat, lon: 2.0 * lat[:, None] - 0.5 * lon[None, :] + 7.0
+    got = _regrid(field(source_lat, source_lon)[None], source_lat, source_lon, target_lat, target_lon, 'bilinear')
+    np.testing.assert_allclose(got[0], field(target_lat, target_lon), rtol=1e-12)
+
+def test_descending_latitudes_match_ascending():
+    source_lat, source_lon = np.arange(10.25, 14, 0.5), np.arange(100.25, 104, 0.5)
+    target_lat, target_lon = np.arange(10.5, 14, 1.0), np.arange(100.5, 104, 1.0)
+    values = np.random.default_rng(2).uniform(0, 1, (1, source_lat.size, source_lon.size))
+    ascending = _regrid(values, source_lat, source_lon, target_lat, target_lon, 'conservative')
+    descending = _regrid(values[:, ::-1], source_lat[::-1], source_lon, target_lat[::-1], target_lon, 'conservative')
+    np.testing.assert_allclose(descending[:, ::-1], ascending, rtol=1e-12)
+
+def test_missing_sources_drop_out():
+    source_lat, source_lon = np.array([0.25, 0.75]), np.array([0.25, 0.75])
+    values = np.array([[[1.0, 3.0], [np.nan, 5.0]]])
+    got = _regrid(values, source_lat, source_lon, np.array([0.5]), np.array([0.5]), 'conservative')
+    # The three valid cells (three quarters of the weight) are renormalised
+    np.testing.assert_allclose(got[0, 0, 0], (1.0 * np.cos(np.radians(0.25)) + 3.0 * np.cos(np.radians(0.25))
+                                              + 5.0 * np.cos(np.radians(0.75))) /
+                               (2 * np.cos(np.radians(0.25)) + np.cos(np.radians(0.75))), rtol=1e-4)
+    mostly_missing = np.array([[[np.nan, np.nan], [np.nan, 5.0]]])
+    assert np.isnan(_regrid(mostly_missing, source_lat, source_lon, np.array([0.5]), np.array([0.5]), 'conservative')).all()
+
+def test_weights_are_cached(tmp_path, monkeypatch):
+    source_lat, source_lon = np.linspace(0, 5, 11), np.linspace(0, 5, 11)
+    target_lat, target_lon = np.linspace(0.5, 4.5, 5), np.linspace(0.5, 4.5, 5)
+    first = regrid_weights(source_lat, source_lon, target_lat, target_lon, 'conservative', str(tmp_path))
+    assert len(list(tmp_path.glob('regrid_*.nc'))) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("weights were recomputed")
+    monkeypatch.setattr(regrid, '_conservative_1d', fail)
+    cached = regrid_weights(source_lat, source_lon, target_lat, target_lon, 'conservative', str(tmp_path))
+    xr.testing.assert_equal(first.drop_attrs(), cached.drop_attrs())
+    # Another target grid or method gets its own weights
+    with pytest.raises(AssertionError):
+        regrid_weights(source_lat, source_lon, target_lat + 0.1, target_lon, 'conservative', str(tmp_path))
+    regrid_weights(source_lat, source_lon, target_lat, target_lon, 'bilinear', str(tmp_path))
+    assert len(list(tmp_path.glob('regrid_*.nc'))) == 2
+
+def test_longitude_seam():
+    # Target on -180..180 straddling 0°, source on 0..360 (0° sits at the start, 359.5° at the end)
+    target_lat, target_lon = np.arange(-2.0, 2.1, 1.0), np.arange(-3.0, 3.1, 1.0)
+    source_lat, source_lon = np.arange(-3.75, 4, 0.5), np.arange(0.25, 360, 0.5)
+    wave = lambda lon: np.cos(np.radians(lon)) + 0.1 * np.sin(np.radians(3 * lon))
+    source_values = np.broadcast_to(wave(source_lon), (1, source_lat.size, source_lon.size)).copy()
+    target = _field(target_lat, target_lon, np.zeros((1, target_lat.size, target_lon.size)), 'tas')
+    source = _field(source_lat, source_lon, source_values)
+
+    aligned = align_to_grid([target, source], 'conservative')[1]
+    np.testing.assert_array_equal(aligned['lon'].values, target_lon)
+    # Same result as a source already on the target's convention
+    shifted_lon = ((source_lon + 180) % 360) - 180
+    order = np.argsort(shifted_lon)
+    expected = _regrid(source_values[..., order], source_lat, shifted_lon[order], target_lat, target_lon, 'conservative')
+    np.testing.assert_allclose(aligned['pr'].values, expected, rtol=1e-12)
+    assert np.isfinite(aligned['pr'].values).all()
+    # Cells either side of 0° average source cells from both ends of the 0..360 axis
+    np.testing.assert_allclose(aligned['pr'].sel(lon=0.0).values, wave(np.array([-0.25, 0.25])).mean(), rtol=1e-6)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from spells import days_in_runs, longest_run, run_count
+
+def _brute_force(mask: np.ndarray, starts: np.ndarray, min_length: int, span_years: bool):
+    # Walks every series day by day; runs break at period starts unless they may span periods
+    n_time = mask.shape[-1]
+    period = np.searchsorted(starts, np.arange(n_time), side='right') - 1
+    longest = np.zeros(mask.shape[:-1] + (len(starts),))
+    days = np.zeros_like(longest)
+    count = np.zeros_like(longest)
+    for cell in np.ndindex(mask.shape[:-1]):
+        series = mask[cell]
+        runs, t = [], 0
+        while t < n_time:
+            if not series[t]:
+                t += 1
+                continue
+            end = t
+            while end + 1 < n_time and series[end + 1] and (span_years or period[end + 1] == period[t]):
+                end += 1
+            runs.append((t, end))
+            t = end + 1
+        for first, last in runs:
+            length = last - first + 1
+            for day in range(first, last + 1):
+                longest[cell + (period[day],)] = max(longest[cell + (period[day],)], day - first + 1)
+                days[cell + (period[day],)] += length >= min_length
+            count[cell + (period[last],)] += length >= min_length
+    return longest, days, count
+
+@pytest.mark.parametrize('span_years', [False, True])
+def test_run_lengths_match_a_day_by_day_count(span_years):
+    rng = np.random.default_rng(7)
+    # Two cells with frequent long runs, one all-wet and one all-dry, over four uneven "years"
+    mask = rng.random((4, 3, 200)) < 0.75
+    mask[0, 0] = True
+    mask[0, 1] = False
+    starts = np.array([0, 37, 38, 120])
+    expected_longest, expected_days, expected_count = _brute_force(mask, starts, 6, span_years)
+    np.testing.assert_array_equal(longest_run(mask, starts, span_years), expected_longest)
+    np.testing.assert_array_equal(days_in_runs(mask, starts, 6, span_years), expected_days)
+    np.testing.assert_array_equal(run_count(mask, starts, 6, span_years), expected_count)
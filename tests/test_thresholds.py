@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+import thresholds
+from benchmarking import STUDY_LAT, STUDY_LON, synthetic_cube, write_synthetic_files
+from input import load_all_data_for_analysis
+from preprocess import combine_preprocess
+from thresholds import PR_QUANTILES, get_thresholds, threshold_key
+
+def _pr(data_dir: str, period=None) -> xr.DataArray:
+    ds = load_all_data_for_analysis(variables=['pr'], period=period, data_dir=data_dir)
+    return combine_preprocess(ds, STUDY_LAT, STUDY_LON, verbose=False, period=period)['pr']
+
+def test_key_follows_the_time_range(tmp_path):
+    write_synthetic_files(synthetic_cube(6, 4, 3, start_year=1991)[['pr']], str(tmp_path))
+    short, full = _pr(str(tmp_path), (1991, 1993)), _pr(str(tmp_path))
+    assert threshold_key(short, PR_QUANTILES, None) != threshold_key(full, PR_QUANTILES, None)
+    # The first file is the same for both, so only the full file list and time range tell them apart
+    assert len(full.encoding['source_files']) == 6
+    assert short.encoding['source'] == full.encoding['source']
+
+def test_key_follows_the_input_files(tmp_path):
+    cube = synthetic_cube(3, 4, 3, start_year=1991)[['pr']]
+    write_synthetic_files(cube, str(tmp_path))
+    before = threshold_key(_pr(str(tmp_path)), PR_QUANTILES, (1991, 1992))
+    # A reprocessed yearly file with the same dates
+    path = sorted(os.path.join(tmp_path, name) for name in os.listdir(tmp_path) if name.endswith('.nc'))[-1]
+    with xr.open_dataset(path) as ds:
+        changed = (ds * 1.1).load()
+    changed.to_netcdf(path)
+    assert threshold_key(_pr(str(tmp_path)), PR_QUANTILES, (1991, 1992)) != before
+
+def test_key_follows_units_and_precision():
+    pr = combine_preprocess(synthetic_cube(2, 4, 3), STUDY_LAT, STUDY_LON, verbose=False)['pr'].load()
+    key = threshold_key(pr, PR_QUANTILES, None)
+    assert threshold_key(pr.astype(np.float64), PR_QUANTILES, None) != key
+    assert threshold_key(pr.assign_attrs(units='kg m-2 s-1'), PR_QUANTILES, None) != key
+
+def test_memory_cache_is_bounded():
+    thresholds._memory_cache.clear()
+    pr = combine_preprocess(synthetic_cube(2, 2, 2), STUDY_LAT, STUDY_LON, verbose=False)['pr'].load()
+    first = get_thresholds(pr, PR_QUANTILES)
+    for k in range(thresholds.MEMORY_CACHE_SIZE + 4):
+        get_thresholds(pr + k + 1, PR_QUANTILES)
+    assert len(thresholds._memory_cache) == thresholds.MEMORY_CACHE_SIZE
+    assert threshold_key(pr, PR_QUANTILES, None) not in thresholds._memory_cache
+    np.testing.assert_array_equal(get_thresholds(pr, PR_QUANTILES).values, first.values)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from time_segments import FREQUENCIES, calendar_fields, nested_segments, period_codes, time_segments
+
+CALENDARS = ['standard', 'noleap', '360_day', 'all_leap']
+
+def _time(calendar: str) -> xr.DataArray:
+    # Starts mid-winter so the first DJF season is incomplete
+    index = xr.date_range('1999-01-15', '2003-01-01', freq='D', inclusive='left', calendar=calendar,
+                          use_cftime=calendar != 'standard')
+    return xr.DataArray(index, dims='time', coords={'time': index})
+
+@pytest.mark.parametrize('calendar', CALENDARS)
+def test_calendar_fields(calendar):
+    time = _time(calendar)
+    years, months = calendar_fields(time)
+    np.testing.assert_array_equal(years, time.dt.year.values)
+    np.testing.assert_array_equal(months, time.dt.month.values)
+
+@pytest.mark.parametrize('freq', list(FREQUENCIES))
+@pytest.mark.parametrize('calendar', CALENDARS)
+def test_period_codes_match_resample(calendar, freq):
+    time = _time(calendar)
+    codes = period_codes(*calendar_fields(time), freq)
+    assert np.all(np.diff(codes) >= 0)
+
+    # Same periods, lengths and labels as the matching xarray resample rule
+    counts = time.resample(time=FREQUENCIES[freq]).count()
+    starts, labels = time_segments(time, freq)
+    np.testing.assert_array_equal(np.diff(np.r_[starts, len(time)]), counts.values)
+    assert list(labels.values) == list(counts.time.values)
+    if freq == 'seasonal':
+        # December 1999 opens the 2000 DJF season together with January and February 2000
+        december = (time.dt.year == 1999) & (time.dt.month == 12)
+        february = (time.dt.year == 2000) & (time.dt.month == 2)
+        assert np.unique(codes[december.values | february.values]).size == 1
+
+@pytest.mark.parametrize('calendar', CALENDARS)
+def test_nested_segments_match_time_segments(calendar):
+    time = _time(calendar)
+    starts, groups, labels = nested_segments(time, ['annual', 'seasonal', 'monthly'])
+    for freq in FREQUENCIES:
+        freq_starts, freq_labels = time_segments(time, freq)
+        np.testing.assert_array_equal(starts[groups[freq]], freq_starts)
+        assert list(labels[freq].values) == list(freq_labels.values)
+
+def test_unknown_frequency():
+    with pytest.raises(ValueError):
+        period_codes(np.array([2000]), np.array([1]), 'weekly')
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from trends import STATISTICS, _trend_kernel
+
+stats = pytest.importorskip('scipy.stats')
+
+def test_trend_kernel_matches_scipy():
+    rng = np.random.default_rng(11)
+    years = np.arange(1981, 2011)
+    series = 0.04 * (years - years[0]) + rng.standard_normal((5, 4, years.size))
+    series[0, 0, [3, 10, 11]] = np.nan # missing years drop out of that cell only
+    series[1, 1] = np.round(series[1, 1]) # ties
+    out = _trend_kernel(series, years, min_years=10)
+
+    for cell in np.ndindex(series.shape[:-1]):
+        valid = ~np.isnan(series[cell])
+        x, t = series[cell][valid], years[valid]
+        theil = stats.theilslopes(x, t)
+        ols = stats.linregress(t, x)
+        result = dict(zip(STATISTICS, out[cell]))
+        np.testing.assert_allclose(result['sen_slope'], theil.slope, rtol=1e-10, err_msg=str(cell))
+        np.testing.assert_allclose(result['ols_slope'], ols.slope, rtol=1e-10, err_msg=str(cell))
+        np.testing.assert_allclose(result['ols_stderr'], ols.stderr, rtol=1e-10, err_msg=str(cell))
+        assert result['n_years'] == valid.sum()
+        if cell != (1, 1):
+            # Without ties: S over all pairs, variance n(n-1)(2n+5)/18 and a continuity correction
+            n = x.size
+            s = sum(np.sign(x[j] - x[i]) for i in range(n) for j in range(i + 1, n))
+            z = (s - np.sign(s)) / np.sqrt(n * (n - 1) * (2 * n + 5) / 18.0)
+            np.testing.assert_allclose(result['mk_z'], z, rtol=1e-10, err_msg=str(cell))
+            np.testing.assert_allclose(result['mk_p'], 2 * stats.norm.sf(abs(z)), rtol=1e-6, err_msg=str(cell))
+
+def test_trend_kernel_masks_short_series():
+    years = np.arange(2000, 2012)
+    series = np.arange(12, dtype=np.float64)[None, :].repeat(2, axis=0)
+    series[1, :5] = np.nan
+    out = _trend_kernel(series, years, min_years=10)
+    np.testing.assert_allclose(out[0, STATISTICS.index('sen_slope')], 1.0)
+    assert np.isnan(out[1, :-1]).all() and out[1, -1] == 7
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from module_folders import use_folder
+
+use_folder('Urban Heat Islands')
+from lulc import ZONE_BUFFER, ZONE_OUTSIDE, ZONE_RURAL, ZONE_URBAN, _distance_km, cover_fractions, zone_masks
+from indices import uhi_intensity, zone_weights
+
+LAT = np.arange(10.5, 16, 1.0)
+LON = np.arange(100.5, 106, 1.0)
+
+def _raster(codes: np.ndarray, descending: bool = False) -> xr.DataArray:
+    # 0.25° pixels covering LAT/LON, so every climate cell holds a 4x4 block of pixels
+    lat = np.arange(10.125, 16, 0.25)
+    lon = np.arange(100.125, 106, 0.25)
+    da = xr.DataArray(codes, dims=('lat', 'lon'), coords={'lat': lat, 'lon': lon})
+    return da.isel(lat=slice(None, None, -1)) if descending else da
+
+def _brute_fractions(codes: np.ndarray) -> dict:
+    blocks = codes.reshape(LAT.size, 4, LON.size, 4).transpose(0, 2, 1, 3).reshape(LAT.size, LON.size, 16)
+    valid = (blocks != 0).sum(axis=-1)
+    with np.errstate(invalid='ignore'):
+        return {'urban': (blocks == 190).sum(axis=-1) / valid, 'water': (blocks == 210).sum(axis=-1) / valid}
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('block_rows', [3, 1024])
+def test_cover_fractions_count_the_pixels_of_each_cell(descending, block_rows):
+    codes = np.random.default_rng(0).choice([0, 10, 190, 210], size=(LAT.size * 4, LON.size * 4), p=[0.1, 0.5, 0.25, 0.15])
+    codes[:4, :4] = 0 # a cell without valid pixels
+    fractions = cover_fractions(_raster(codes, descending), xr.DataArray(LAT, dims='lat'), xr.DataArray(LON, dims='lon'),
+                                block_rows=block_rows)
+    expected = _brute_fractions(codes)
+    np.testing.assert_allclose(fractions['urban_fraction'].values, expected['urban'])
+    np.testing.assert_allclose(fractions['water_fraction'].values, expected['water'])
+    assert np.isnan(fractions['urban_fraction'].values[0, 0])
+
+def test_cover_fractions_on_a_0_360_grid():
+    codes = np.random.default_rng(1).choice([10, 190, 210], size=(LAT.size * 4, LON.size * 4))
+    raster = _raster(codes)
+    raster = raster.assign_coords(lon=raster['lon'] + 150 - 360) # -180–180 map for a 0–360 climate grid
+    fractions = cover_fractions(raster, xr.DataArray(LAT, dims='lat'), xr.DataArray(LON + 150, dims='lon'))
+    np.testing.assert_allclose(fractions['urban_fraction'].values, _brute_fractions(codes)['urban'])
+
+def _fractions(urban: np.ndarray, water: np.ndarray) -> xr.Dataset:
+    return xr.Dataset({'urban_fraction': (('lat', 'lon'), urban), 'water_fraction': (('lat', 'lon'), water)},
+                      coords={'lat': LAT, 'lon': LON})
+
+def test_zone_masks_split_urban_buffer_rural_and_outside():
+    urban = np.zeros((LAT.size, LON.size))
+    urban[2, 2] = 0.8 # the city cell
+    urban[2, 4] = 0.5 # built-up, but too far out for the urban core
+    urban[1, 1] = 0.1 # too urban for a rural reference cell
+    water = np.zeros_like(urban)
+    water[4, 2] = 0.5 # a lake
+    city = (LAT[2], LON[2])
+    zone = zone_masks(_fractions(urban, water), {'A': city}, urban_radius_km=60.0, buffer_km=60.0, rural_radius_km=300.0)
+
+    distance = _distance_km(*np.meshgrid(LAT, LON, indexing='ij'), *city)
+    got = zone.sel(city='A').values
+    assert got[2, 2] == ZONE_URBAN and (got == ZONE_URBAN).sum() == 1
+    rural = (distance > 120.0) & (distance <= 300.0) & (urban <= 0.05) & (water <= 0.2)
+    np.testing.assert_array_equal(got == ZONE_RURAL, rural)
+    np.testing.assert_array_equal(got == ZONE_OUTSIDE, distance > 300.0)
+    assert got[2, 4] == ZONE_BUFFER and got[4, 2] == ZONE_BUFFER and got[1, 1] == ZONE_BUFFER
+    assert float(zone['city_lat'].sel(city='A')) == city[0]
+
+def test_zone_masks_fall_back_to_the_centre_cell():
+    fractions = _fractions(np.zeros((LAT.size, LON.size)), np.zeros((LAT.size, LON.size)))
+    zone = zone_masks(fractions, {'A': (13.4, 103.6), 'B': (11.2, 100.7)})
+    assert (zone == ZONE_URBAN).sum(dim=['lat', 'lon']).values.tolist() == [1, 1]
+    assert zone.sel(city='A', lat=13.5, lon=103.5) == ZONE_URBAN
+    assert zone.sel(city='B', lat=11.5, lon=100.5) == ZONE_URBAN
+
+def _zone() -> xr.DataArray:
+    zones = np.full((2, LAT.size, LON.size), ZONE_OUTSIDE, dtype=np.int8)
+    zones[0, 1:3, 1:3] = ZONE_URBAN
+    zones[0, 4:, :] = ZONE_RURAL
+    zones[0, 0, :] = ZONE_BUFFER
+    zones[1, 3, 3] = ZONE_URBAN # no rural cells
+    return xr.DataArray(zones, dims=('city', 'lat', 'lon'), coords={'city': ['A', 'B'], 'lat': LAT, 'lon': LON}, name='zone')
+
+def test_zone_weights_are_area_weights_of_each_zone():
+    zone = _zone()
+    weights = zone_weights(zone)
+    area = np.cos(np.deg2rad(LAT))[:, None] * np.ones(LON.size)
+    for city in ('A', 'B'):
+        for name, code in (('urban', ZONE_URBAN), ('rural', ZONE_RURAL)):
+            members = zone.sel(city=city).values == code
+            got = weights.sel(city=city, zone=name).values
+            expected = np.where(members, area, 0.0) / (area[members].sum() if members.any() else 1.0)
+            np.testing.assert_allclose(got, expected)
+    assert float(weights.sel(city='B', zone='rural').sum()) == 0.0
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_uhi_intensity_matches_per_city_means(chunked):
+    rng = np.random.default_rng(2)
+    values = rng.normal(25.0, 3.0, (6, LAT.size, LON.size))
+    values[1, 1, 1] = np.nan # a gap inside the urban zone
+    values[2, 4:, :] = np.nan # a day without any rural data
+    time = pd.date_range('2001-06-01', periods=6)
+    ds = xr.Dataset({'tasmax': (('time', 'lat', 'lon'), values, {'units': '°C'})}, coords={'time': time, 'lat': LAT, 'lon': LON})
+    if chunked:
+        ds = ds.chunk({'time': 2, 'lat': 3, 'lon': 3})
+    zone = _zone()
+    result = uhi_intensity(ds, zone).compute()
+
+    area = np.cos(np.deg2rad(LAT))[:, None] * np.ones(LON.size)
+    for city in ('A', 'B'):
+        means = {}
+        for name, code in (('urban', ZONE_URBAN), ('rural', ZONE_RURAL)):
+            members = zone.sel(city=city).values == code
+            means[name] = np.full(time.size, np.nan)
+            for t in range(time.size):
+                ok = members & ~np.isnan(values[t])
+                if ok.any():
+                    means[name][t] = (values[t][ok] * area[ok]).sum() / area[ok].sum()
+            np.testing.assert_allclose(result[f'tasmax_{name}'].sel(city=city).values, means[name])
+        np.testing.assert_allclose(result['UHI_tasmax'].sel(city=city).values, means['urban'] - means['rural'])
+    assert np.isnan(result['UHI_tasmax'].sel(city='A').values[2])
+    assert result['UHI_tasmax'].dims == ('time', 'city')
+    assert result['n_urban_cells'].values.tolist() == [4, 1]
+    assert result['n_rural_cells'].values.tolist() == [LON.size * 2, 0]
+
+def test_uhi_intensity_needs_a_temperature_variable():
+    ds = xr.Dataset({'pr': (('time', 'lat', 'lon'), np.zeros((1, LAT.size, LON.size)))}, coords={'time': [0], 'lat': LAT, 'lon': LON})
+    with pytest.raises(ValueError):
+        uhi_intensity(ds, _zone())
@@ -0,0 +1,132 @@
+import json
+import numpy as np
+import pytest
+import xarray as xr
+from matplotlib.path import Path as MplPath
+from module_folders import use_folder
+
+use_folder('Climate Extreme Indicators')
+from grids import cell_edges
+from zonal import EARTH_RADIUS_KM, cell_area_km2, region_weights, write_zonal, zonal_means
+
+LAT = np.arange(10.25, 13.3, 0.5) # 7 rows, 0.5° cells
+LON = np.arange(100.25, 104.3, 0.5) # 9 columns
+
+def _square(lon0, lat0, lon1, lat1):
+    return [[lon0, lat0], [lon1, lat0], [lon1, lat1], [lon0, lat1], [lon0, lat0]]
+
+FEATURES = [
+    ('aligned', {'type': 'Polygon', 'coordinates': [_square(100.5, 10.5, 102.0, 12.0)]}),
+    ('triangle', {'type': 'Polygon', 'coordinates': [[[101.1, 10.2], [103.9, 11.05], [101.7, 13.3], [101.1, 10.2]]]}),
+    ('with_hole', {'type': 'Polygon', 'coordinates': [_square(102.1, 10.3, 104.4, 12.9), _square(102.8, 11.1, 103.6, 12.2)]}),
+    ('islands', {'type': 'MultiPolygon', 'coordinates': [[_square(100.0, 12.6, 100.7, 13.5)], [_square(103.9, 10.0, 104.6, 10.4)]]}),
+    ('islands', {'type': 'Polygon', 'coordinates': [_square(101.2, 12.4, 101.45, 12.6)]}),
+]
+
+def _regions_file(tmp_path, features=FEATURES) -> str:
+    path = tmp_path / 'regions.geojson'
+    collection = {'type': 'FeatureCollection',
+                  'features': [{'type': 'Feature', 'properties': {'name': name}, 'geometry': geometry} for name, geometry in features]}
+    path.write_text(json.dumps(collection))
+    return str(path)
+
+def _brute_force_weights(lat: np.ndarray, lon: np.ndarray, n: int = 40) -> dict:
+    # Dense (region, lat, lon) overlap areas from a fine point sample of every cell, cell by cell
+    area = cell_area_km2(lat, lon)
+    lat_edges, lon_edges = cell_edges(lat), cell_edges(lon)
+    step = (np.arange(n) + 0.5) / n
+    dense = {}
+    for name, geometry in FEATURES:
+        polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        weights = dense.setdefault(name, np.zeros((lat.size, lon.size)))
+        for i in range(lat.size):
+            for j in range(lon.size):
+                sub_lat = lat_edges[i] + step * (lat_edges[i + 1] - lat_edges[i])
+                sub_lon = lon_edges[j] + step * (lon_edges[j + 1] - lon_edges[j])
+                points = np.column_stack([np.tile(sub_lon, n), np.repeat(sub_lat, n)])
+                inside = np.zeros(n * n, dtype=bool)
+                for polygon in polygons:
+                    ring = MplPath(np.array(polygon[0])).contains_points(points)
+                    for hole in polygon[1:]:
+                        ring &= ~MplPath(np.array(hole)).contains_points(points)
+                    inside |= ring
+                weights[i, j] += inside.mean() * area[i, j]
+    return dense
+
+def _field(seed: int = 0) -> xr.Dataset:
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(20, 35, (3, LAT.size, LON.size))
+    values[1, 2, 3] = np.nan
+    values[2, :, :4] = np.nan
+    return xr.Dataset({'TXx': (('time', 'lat', 'lon'), values, {'units': '°C'})},
+                      coords={'time': np.arange(3), 'lat': LAT, 'lon': LON})
+
+def test_sparse_means_match_a_dense_brute_force(tmp_path):
+    ds = _field()
+    weights = region_weights(_regions_file(tmp_path), ds['lat'], ds['lon'])
+    assert list(weights['region'].values) == ['aligned', 'triangle', 'with_hole', 'islands']
+    sparse = zonal_means(ds, weights)
+
+    values = ds['TXx'].values
+    valid = ~np.isnan(values)
+    for name, dense in _brute_force_weights(LAT, LON).items():
+        np.testing.assert_allclose(float(weights['region_area'].sel(region=name)), dense.sum(), rtol=2e-2, err_msg=name)
+        with np.errstate(invalid='ignore'):
+            expected = (np.where(valid, values, 0.0) * dense).sum(axis=(1, 2)) / (valid * dense).sum(axis=(1, 2))
+        np.testing.assert_allclose(sparse['TXx'].sel(region=name).values, expected, rtol=2e-3, err_msg=name)
+
+def test_chunked_and_in_memory_paths_agree(tmp_path):
+    ds = _field(1)
+    weights = region_weights(_regions_file(tmp_path), ds['lat'], ds['lon'])
+    in_memory = zonal_means(ds, weights)
+    chunked = zonal_means(ds.chunk({'time': 2, 'lat': 3, 'lon': 4}), weights).compute()
+    xr.testing.assert_allclose(in_memory, chunked, rtol=1e-12)
+
+    # The same weights as a dense matrix
+    dense = np.zeros((weights.sizes['region'], LAT.size * LON.size))
+    np.add.at(dense, (weights['region_index'].values, weights['cell'].values), weights['weight'].values)
+    values = ds['TXx'].values.reshape(3, -1)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore'):
+        expected = (np.where(valid, values, 0.0) @ dense.T) / (valid @ dense.T)
+    np.testing.assert_allclose(in_memory['TXx'].values, expected, rtol=1e-12)
+
+def test_cell_aligned_region_has_the_exact_spherical_area(tmp_path):
+    weights = region_weights(_regions_file(tmp_path), xr.DataArray(LAT, dims='lat'), xr.DataArray(LON, dims='lon'))
+    exact = EARTH_RADIUS_KM ** 2 * np.radians(1.5) * (np.sin(np.radians(12.0)) - np.sin(np.radians(10.5)))
+    np.testing.assert_allclose(float(weights['region_area'].sel(region='aligned')), exact, rtol=1e-12)
+
+def test_descending_latitudes_and_0_360_longitudes(tmp_path):
+    ds = _field(2)
+    reference = zonal_means(ds, region_weights(_regions_file(tmp_path), ds['lat'], ds['lon']))
+    flipped = ds.isel(lat=slice(None, None, -1))
+    got = zonal_means(flipped, region_weights(_regions_file(tmp_path), flipped['lat'], flipped['lon']))
+    xr.testing.assert_allclose(reference, got, rtol=1e-12)
+
+    # The same values repeated at 280-284°E on a 0..360 axis, with the region given at -80..-78° (-180..180)
+    wrapped = xr.Dataset({'TXx': (('time', 'lat', 'lon'), np.concatenate([ds['TXx'].values, ds['TXx'].values], axis=-1))},
+                         coords={'time': ds['time'], 'lat': LAT, 'lon': np.r_[LON, LON + 180.0]})
+    west = [('aligned', {'type': 'Polygon', 'coordinates': [_square(-79.5, 10.5, -78.0, 12.0)]})]
+    weights = region_weights(_regions_file(tmp_path, west), wrapped['lat'], wrapped['lon'])
+    assert (weights['cell'].values % wrapped.sizes['lon'] >= LON.size).all()
+    np.testing.assert_allclose(zonal_means(wrapped, weights)['TXx'].values, reference['TXx'].sel(region=['aligned']).values,
+                               rtol=1e-12)
+
+def test_weights_are_cached(tmp_path):
+    ds = _field()
+    path = _regions_file(tmp_path)
+    first = region_weights(path, ds['lat'], ds['lon'], str(tmp_path / 'cache'))
+    assert len(list((tmp_path / 'cache').glob('weights_*.nc'))) == 1
+    again = region_weights(path, ds['lat'], ds['lon'], str(tmp_path / 'cache'))
+    xr.testing.assert_equal(first, again)
+    region_weights(path, ds['lat'].isel(lat=slice(1, None)), ds['lon'], str(tmp_path / 'cache'))
+    assert len(list((tmp_path / 'cache').glob('weights_*.nc'))) == 2
+
+def test_write_zonal_tables(tmp_path):
+    ds = _field()
+    ds.to_netcdf(tmp_path / 'indices.nc')
+    saved = write_zonal(str(tmp_path / 'indices.nc'), _regions_file(tmp_path), str(tmp_path / 'cache'))
+    with xr.open_dataset(saved) as table:
+        assert table['TXx'].dims == ('time', 'region')
+        assert table['TXx'].attrs['units'] == '°C'
+    assert (tmp_path / 'indices_zonal.csv').exists()